@@ -0,0 +1,172 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+
+# Adjust paths (in case running not as a module)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crypto.elliptic_curve import G
+from crypto.ecdh import generate_keys, compute_shared_secret
+from crypto.dsa import sign_message, verify_signature
+from crypto.gost import _generate_subkeys
+from crypto.backends import get_backend, scalar_mult_active
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_OUTPUT = "bench_results.json"
+DEFAULT_THRESHOLD = 0.25  # 25% slower than baseline counts as a regression
+# Results entry naming the crypto backend the timings were taken with
+BACKEND_KEY = "backend"
+PAYLOAD_SIZES = [64, 1024, 16 * 1024]
+# Inbox reads in the round-trip benchmark (each one gets a fresh recipient)
+INBOX_SAMPLES = 3
+
+def measure(fn, repeat, setup=None):
+    """
+    Runs fn repeat times and returns the median wall time in seconds.
+    :param setup: Optional untimed function run before every sample; fn then receives its result.
+    """
+    samples = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        fn(arg) if setup else fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+def bench_primitives(repeat):
+    """Times the primitives as the project calls them: through the active crypto backend."""
+    results = {}
+    backend = get_backend()
+    priv, pub = generate_keys()
+    priv2, pub2 = generate_keys()
+    msg = b"benchmark message"
+    sig = sign_message(priv, msg)
+
+    results["scalar_mult"] = measure(lambda: scalar_mult_active(priv, G), repeat)
+    results["generate_keys"] = measure(generate_keys, repeat)
+    results["sign_message"] = measure(lambda: sign_message(priv, msg), repeat)
+    results["verify_signature"] = measure(lambda: verify_signature(pub, msg, sig), repeat)
+    results["compute_shared_secret"] = measure(lambda: compute_shared_secret(priv, pub2), repeat)
+
+    key = os.urandom(32)
+    iv = os.urandom(8)
+    subkeys = _generate_subkeys(key)
+    block = os.urandom(8)
+    results["gost_block"] = measure(lambda: backend.encrypt_block(block, subkeys), repeat * 20)
+    for size in PAYLOAD_SIZES:
+        data = os.urandom(size)
+        ciphertext = backend.encrypt_cbc(data, key, iv)
+        results[f"gost_cbc_encrypt_{size}"] = measure(lambda: backend.encrypt_cbc(data, key, iv), repeat)
+        results[f"gost_cbc_decrypt_{size}"] = measure(lambda: backend.decrypt_cbc(ciphertext, key, iv), repeat)
+    return results
+
+def bench_round_trip(repeat):
+    """
+    send_message + check_inbox in a temporary data dir. Every inbox sample reads
+    a fresh recipient's inbox, so read marks, archiving and the seen index do not
+    turn later samples into cheaper work.
+    """
+    from core.user_manager import UserManager
+    from core.secure_messenger import SecureMessenger
+
+    results = {}
+    old_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            um = UserManager()
+            recipients = [f"bob{i}" for i in range(INBOX_SAMPLES)]
+            um.register_many([("alice", "pw-a"), ("carol", "pw-c")] + [(name, "pw-b") for name in recipients])
+            alice, _ = um.login("alice", "pw-a")
+            # No verification cache: measure the full crypto cost on every read.
+            # Without sessions every send pays ECDH + DSA (the cost of opening a session)
+            messenger = SecureMessenger(um, inbox_workers=0, verify_cache=None, sessions=False)
+            results["send_message"] = measure(lambda: messenger.send_message(alice, "carol", "hello carol"), repeat)
+
+            # Follow-up messages of an open session (hash ratchet + HMAC)
+            session_messenger = SecureMessenger(um, inbox_workers=0, verify_cache=None, seen_index=None)
+            session_messenger.send_message(alice, "carol", "opens the session")
+            results["send_message_session"] = measure(
+                lambda: session_messenger.send_message(alice, "carol", "hello again"), repeat)
+            session_messenger.close()
+
+            def fill_inbox():
+                name = recipients.pop()
+                for _ in range(repeat):
+                    messenger.send_message(alice, name, "hello bob")
+                return um.login(name, "pw-b")[0]
+            # Per-message cost of reading a fresh inbox of `repeat` signed messages
+            inbox_time = measure(messenger.check_inbox, INBOX_SAMPLES, setup=fill_inbox)
+            results["check_inbox_per_message"] = inbox_time / repeat
+            messenger.close()
+        finally:
+            os.chdir(old_cwd)
+    return results
+
+def compare(results, baseline, threshold):
+    """Returns a list of (name, baseline, current, ratio) for benchmarks slower than threshold."""
+    regressions = []
+    for name, current in sorted(results.items()):
+        base = baseline.get(name)
+        if not base or name == BACKEND_KEY:
+            continue
+        ratio = current / base
+        if ratio > 1 + threshold:
+            regressions.append((name, base, current, ratio))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Benchmark crypto primitives and messaging.")
+    parser.add_argument("--repeat", type=int, default=10, help="Samples per benchmark (median is reported).")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Where to write the JSON results.")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline JSON to compare against.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed slowdown ratio (0.25 = 25%%).")
+    parser.add_argument("--update-baseline", action="store_true", help="Store these results as the new baseline.")
+    parser.add_argument("--only", choices=["primitives", "round-trip"], help="Run a single group.")
+    args = parser.parse_args(argv)
+
+    results = {}
+    if args.only != "round-trip":
+        results.update(bench_primitives(args.repeat))
+    if args.only != "primitives":
+        results.update(bench_round_trip(args.repeat))
+
+    for name, seconds in sorted(results.items()):
+        print(f"{name:<32} {seconds * 1000:10.3f} ms")
+    results[BACKEND_KEY] = get_backend().name
+    print(f"\nCrypto backend: {results[BACKEND_KEY]}")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=4, sort_keys=True)
+    print(f"\nResults written to {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline found; run with --update-baseline to create one.")
+        return 0
+
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+    if baseline.get(BACKEND_KEY, results[BACKEND_KEY]) != results[BACKEND_KEY]:
+        print(f"Note: the baseline was recorded with the {baseline[BACKEND_KEY]} backend.")
+    regressions = compare(results, baseline, args.threshold)
+    if not regressions:
+        print(f"No regressions (threshold {args.threshold:.0%}).")
+        return 0
+
+    print(f"\nREGRESSIONS (threshold {args.threshold:.0%}):")
+    for name, base, current, ratio in regressions:
+        print(f"  {name:<30} {base * 1000:.3f} ms -> {current * 1000:.3f} ms ({ratio:.2f}x)")
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,19 +6,22 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from core.user_manager import UserManager
 from core.secure_messenger import SecureMessenger
+from core.events import EventLog, DEBUG
 
 class CLIController:
     def __init__(self):
-        # Define a callback to print logs to the console
-        def log_printer(title, details):
-            print(f"\n[LOG] === {title} ===")
-            print(details)
+        # Define a subscriber to print events to the console
+        def log_printer(event):
+            print(f"\n[LOG] === {event.title} ===")
+            print(event.details)
             print("-" * 40)
 
-        # Initialize Core Logic with the logger callback
+        # Initialize Core Logic with a shared event log
         # This connects the print messages to the core logic events
-        self.user_manager = UserManager(debug_callback=log_printer)
-        self.messenger = SecureMessenger(self.user_manager, debug_callback=log_printer)
+        self.events = EventLog()
+        self.events.subscribe(log_printer, level=DEBUG)
+        self.user_manager = UserManager(events=self.events)
+        self.messenger = SecureMessenger(self.user_manager, events=self.events)
         self.current_user = None
 
     def run(self):
@@ -62,6 +65,7 @@ class CLIController:
         print("1. Send Message")
         print("2. Check Inbox")
         print("3. Logout")
+        print("4. Show Metrics")
         choice = input("Select option: ")
 
         if choice == '1':
@@ -90,5 +94,23 @@ class CLIController:
                     print("-" * 30)
         
         elif choice == '3':
+            self.messenger.logout(self.current_user)
             self.current_user = None
-            print("Logged out.")
\ No newline at end of file
+            print("Logged out.")
+
+        elif choice == '4':
+            self._show_metrics()
+
+    def _show_metrics(self):
+        snapshot = self.messenger.metrics.snapshot()
+        print("\n--- Counters ---")
+        for name, value in sorted(snapshot["counters"].items()):
+            print(f"{name:<28} {value}")
+        print("\n--- Latency (ms) ---")
+        print(f"{'stage':<28} {'count':>6} {'p50':>9} {'p95':>9} {'max':>9}")
+        for name, h in sorted(snapshot["histograms"].items()):
+            print(f"{name:<28} {h['count']:>6} {h['p50'] * 1000:>9.2f} {h['p95'] * 1000:>9.2f} {h['max'] * 1000:>9.2f}")
+        path = input("Save Prometheus dump to file (blank to skip): ").strip()
+        if path:
+            self.messenger.metrics.dump_prometheus(path)
+            print(f"Metrics written to {path}")
\ No newline at end of file
@@ -0,0 +1,259 @@
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+
+# Add parent directory to path to import core modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.user_manager import UserManager
+from core.secure_messenger import SecureMessenger
+from core.retention import Compactor, RetentionPolicy
+from core.sharding import ShardedTransport, configured_roots, default_transport
+from core.seen_index import SEEN_INDEX_FILE
+
+# Password fallback so it does not have to appear on the command line
+PASSWORD_ENV = "CRYPTO_PASSWORD"
+
+def _emit(obj):
+    """Machine-readable output: one JSON object per line."""
+    print(json.dumps(obj), flush=True)
+
+def _open_input(path):
+    return sys.stdin if path == "-" else open(path, "r", newline="")
+
+def _read_credentials(path, errors):
+    """
+    Reads username,password rows (CSV, optional header) from a file or stdin.
+    Malformed rows are skipped and reported in errors as (line number, message).
+    """
+    with _open_input(path) as f:
+        reader = csv.reader(f)
+        for row in reader:
+            if not row or row[0].startswith("#") or row[:2] == ["username", "password"]:
+                continue
+            if len(row) < 2 or not row[0].strip() or not row[1].strip():
+                errors.append((reader.line_num, "Expected a username,password row"))
+                continue
+            yield row[0].strip(), row[1].strip()
+
+def _read_send_jobs(path, errors):
+    """
+    Reads {"to": ..., "message": ...} JSON lines from a file or stdin.
+    Malformed lines are skipped and reported in errors as (line number, message).
+    """
+    with _open_input(path) as f:
+        for line_num, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                job = json.loads(line)
+            except ValueError as e:
+                errors.append((line_num, f"Invalid JSON: {e}"))
+                continue
+            if not isinstance(job, dict) or not isinstance(job.get("to"), str) or not isinstance(job.get("message"), str):
+                errors.append((line_num, 'Expected {"to": "...", "message": "..."}'))
+                continue
+            yield job["to"], job["message"]
+
+def _login(args):
+    password = args.password or os.environ.get(PASSWORD_ENV)
+    if password is None:
+        raise SystemExit(f"error: --password or ${PASSWORD_ENV} is required")
+    um = UserManager()
+    user, msg = um.login(args.user, password)
+    if not user:
+        _emit({"ok": False, "user": args.user, "error": msg})
+        raise SystemExit(1)
+    return um, user
+
+def cmd_register(args):
+    um = UserManager()
+    success, msg = um.register(args.username, args.password)
+    _emit({"ok": success, "user": args.username, "message": msg})
+    return 0 if success else 1
+
+def cmd_import_users(args):
+    um = UserManager()
+    errors = []
+    results = um.register_many(_read_credentials(args.file, errors))
+    failures = len(errors)
+    for line, msg in errors:
+        _emit({"ok": False, "line": line, "error": msg})
+    for username, success, msg in results:
+        failures += not success
+        _emit({"ok": success, "user": username, "message": msg})
+    return 0 if not failures else 1
+
+def cmd_send(args):
+    um, user = _login(args)
+    errors = []
+    if args.file:
+        jobs = list(_read_send_jobs(args.file, errors))
+    elif args.to and args.message is not None:
+        jobs = [(args.to, args.message)]
+    else:
+        raise SystemExit("error: give --to and --message, or --file")
+
+    messenger = SecureMessenger(um)
+    failures = len(errors)
+    for line, msg in errors:
+        _emit({"ok": False, "line": line, "error": msg})
+    for recipient, message in jobs:
+        success, msg = messenger.send_message(user, recipient, message)
+        failures += not success
+        _emit({"ok": success, "to": recipient, "message": msg})
+    messenger.close()
+    return 0 if not failures else 1
+
+def cmd_inbox(args):
+    um, user = _login(args)
+    messenger = SecureMessenger(um, inbox_workers=args.workers)
+    if args.all:
+        # Page through the whole history, archived messages included
+        offset = 0
+        while True:
+            headers = messenger.list_inbox(user, offset)
+            for header in headers:
+                _emit(messenger.open_message(user, header["id"]))
+            if not headers:
+                break
+            offset += len(headers)
+    else:
+        for m in messenger.check_inbox(user):
+            _emit(m)
+    messenger.close()
+    return 0
+
+def cmd_watch(args):
+    um, user = _login(args)
+    messenger = SecureMessenger(um)
+
+    def on_new_packets(entries):
+        for message_id, _ in entries:
+            _emit(messenger.open_message(user, message_id))
+
+    watcher = messenger.watch_inbox(user, on_new_packets)
+    try:
+        deadline = time.time() + args.timeout if args.timeout else None
+        while deadline is None or time.time() < deadline:
+            time.sleep(0.2)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
+        messenger.close()
+    return 0
+
+def cmd_gc(args):
+    max_age = args.max_age_days * 86400 if args.max_age_days is not None else None
+    policy = RetentionPolicy(max_age=max_age, max_count=args.max_count)
+    compactor = Compactor(default_transport(), default_policy=policy, seen_index=SEEN_INDEX_FILE)
+    stats = compactor.run_once(usernames=args.user or None)
+    for username, result in sorted(stats.items()):
+        _emit({"user": username, **result})
+    _emit({"seen_expired": compactor.expire_seen()})
+    return 0
+
+def cmd_rebalance(args):
+    transport = ShardedTransport(args.root or configured_roots())
+    report = transport.rebalance(retired=args.retire or (), dry_run=args.dry_run, seen_index=SEEN_INDEX_FILE)
+    for username, source, target in report["users"]:
+        _emit({"user": username, "from": source, "to": target})
+    _emit({"users": len(report["users"]), "messages": report["messages"], "dry_run": args.dry_run})
+    transport.close()
+    return 0
+
+def cmd_serve(args):
+    from core.service import main as service_main
+    argv = ["--workers", str(args.workers)] if args.workers else []
+    if args.port:
+        argv += ["--port", str(args.port)]
+    elif args.path:
+        argv += ["--path", args.path]
+    return service_main(argv)
+
+def cmd_bench(args):
+    from bench.__main__ import main as bench_main
+    return bench_main(args.bench_args)
+
+def cmd_loadgen(args):
+    from demo.loadgen import run_loadgen
+    report = run_loadgen(users=args.users, messages=args.messages, concurrency=args.concurrency,
+                         message_size=args.message_size, seed=args.seed)
+    _emit(report)
+    return 0 if report["verified"] == report["sent"] else 1
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="main.py", description="Non-interactive Secure Messenger commands (JSON lines output).")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("register", help="Register one user.")
+    p.add_argument("username")
+    p.add_argument("password")
+    p.set_defaults(func=cmd_register)
+
+    p = sub.add_parser("import-users", help="Bulk-register users from a username,password CSV.")
+    p.add_argument("file", help="CSV file, or - for stdin.")
+    p.set_defaults(func=cmd_import_users)
+
+    for name, func, help_text in (("send", cmd_send, "Send one or many messages."),
+                                  ("inbox", cmd_inbox, "Decrypt and verify the inbox."),
+                                  ("watch", cmd_watch, "Print new messages as they arrive.")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--user", required=True)
+        p.add_argument("--password", help=f"Defaults to ${PASSWORD_ENV}.")
+        p.set_defaults(func=func)
+        if name == "send":
+            p.add_argument("--to")
+            p.add_argument("--message")
+            p.add_argument("--file", help='JSON lines {"to": ..., "message": ...}, or - for stdin.')
+        elif name == "inbox":
+            p.add_argument("--workers", type=int, default=None, help="Inbox worker processes (0 = serial).")
+            p.add_argument("--all", action="store_true", help="Include archived (already read) messages.")
+        else:
+            p.add_argument("--timeout", type=float, default=None, help="Stop after this many seconds (default: until Ctrl-C).")
+
+    p = sub.add_parser("gc", help="Apply retention and archive read messages.")
+    p.add_argument("--user", action="append", help="Only these users (repeatable; default all).")
+    p.add_argument("--max-age-days", type=float, default=None, help="Delete messages older than this.")
+    p.add_argument("--max-count", type=int, default=None, help="Keep only the newest N messages per user.")
+    p.set_defaults(func=cmd_gc)
+
+    p = sub.add_parser("rebalance", help="Move recipients to their shard after storage roots changed.")
+    p.add_argument("--root", action="append", help="Storage root (repeatable; default $MESSAGE_ROOTS).")
+    p.add_argument("--retire", action="append", help="Old root to drain completely (repeatable).")
+    p.add_argument("--dry-run", action="store_true", help="Only list the moves.")
+    p.set_defaults(func=cmd_rebalance)
+
+    p = sub.add_parser("serve", help="Serve register/login/send/inbox over a local socket.")
+    p.add_argument("--workers", type=int, default=None, help="Worker processes (defaults to CPU count).")
+    p.add_argument("--path", default=None, help="Unix socket path (default data/service.sock).")
+    p.add_argument("--port", type=int, default=None, help="Listen on TCP 127.0.0.1:PORT instead.")
+    p.set_defaults(func=cmd_serve)
+
+    p = sub.add_parser("bench", help="Run the benchmark suite (arguments are passed to python -m bench).")
+    p.add_argument("bench_args", nargs=argparse.REMAINDER)
+    p.set_defaults(func=cmd_bench)
+
+    p = sub.add_parser("loadgen", help="Simulate N users exchanging M messages.")
+    p.add_argument("--users", type=int, default=4)
+    p.add_argument("--messages", type=int, default=20)
+    p.add_argument("--concurrency", type=int, default=None, help="Worker processes (defaults to CPU count).")
+    p.add_argument("--message-size", type=int, default=64)
+    p.add_argument("--seed", type=int, default=None)
+    p.set_defaults(func=cmd_loadgen)
+    return parser
+
+def run(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # bench forwards its options untouched to python -m bench
+    if argv and argv[0] == "bench":
+        return cmd_bench(argparse.Namespace(bench_args=argv[1:]))
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,192 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from crypto.ecdh import compute_shared_secret
+from crypto.dsa import sign_message, verify_signature
+from crypto.backends import encrypt_cbc, decrypt_cbc
+from utils import generate_iv, bytes_to_hex, hex_to_bytes, str_to_bytes
+
+ATTACHMENTS_DIR = os.path.join("data", "attachments")
+CHUNK_SIZE = 64 * 1024
+
+MANIFEST_FILE = "manifest.json"
+PARTIAL_MANIFEST_FILE = "manifest.partial.json"
+# Append-only progress log: one chunk hash (upload) or chunk index (download) per line
+PROGRESS_LOG_SUFFIX = ".log"
+
+# ======================================================
+# Chunked attachments
+# ======================================================
+# Layout: data/attachments/<file_id>/<index>.chunk (IV || GOST-CBC ciphertext)
+# plus manifest.json. Each file gets a random 256-bit key, which is stored
+# wrapped (GOST-CBC) under the sender/recipient ECDH secret. The sender signs
+# the manifest, which lists the SHA-256 of every encrypted chunk, instead
+# of the whole file. Chunks can therefore be checked and decrypted
+# independently and in parallel.
+
+def _chunk_path(directory, index):
+    return os.path.join(directory, f"{index:08d}.chunk")
+
+def _manifest_bytes(manifest):
+    """Canonical serialization that the signature covers."""
+    unsigned = {k: v for k, v in manifest.items() if k != "signature"}
+    return str_to_bytes(json.dumps(unsigned, sort_keys=True, separators=(",", ":")))
+
+def _read_progress(path):
+    """Returns the complete lines of a progress log (a torn last line is ignored)."""
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as f:
+        return [line[:-1] for line in f if line.endswith("\n")]
+
+def _write_json(path, obj):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+def new_file_id():
+    return bytes_to_hex(os.urandom(16))
+
+def send_attachment(sender_user, recipient_keys, recipient_name, file_path,
+                    file_id=None, chunk_size=CHUNK_SIZE, root=None):
+    """
+    Encrypts file_path chunk by chunk into the attachment store.
+    Only one chunk is held in memory at a time. If file_id names an
+    interrupted upload, chunks already written are kept and the upload
+    continues where it stopped.
+    Returns the signed manifest.
+    """
+    root = root or ATTACHMENTS_DIR
+    shared_secret = compute_shared_secret(sender_user["ecdh_priv"], recipient_keys["ecdh"])
+
+    file_id = file_id or new_file_id()
+    directory = os.path.join(root, file_id)
+    partial_path = os.path.join(directory, PARTIAL_MANIFEST_FILE)
+    log_path = partial_path + PROGRESS_LOG_SUFFIX
+
+    if os.path.exists(partial_path):
+        # Resume: recover the per-file key from the wrapped copy
+        with open(partial_path, "r") as f:
+            manifest = json.load(f)
+        file_key = decrypt_cbc(hex_to_bytes(manifest["wrapped_key"]), shared_secret, hex_to_bytes(manifest["key_iv"]))
+        chunk_size = manifest["chunk_size"]
+    else:
+        os.makedirs(directory, exist_ok=True)
+        file_key = os.urandom(32)
+        key_iv = generate_iv(8)
+        manifest = {
+            "file_id": file_id,
+            "sender": sender_user["username"],
+            "recipient": recipient_name,
+            "filename": os.path.basename(file_path),
+            "size": os.path.getsize(file_path),
+            "chunk_size": chunk_size,
+            "key_iv": bytes_to_hex(key_iv),
+            "wrapped_key": bytes_to_hex(encrypt_cbc(file_key, shared_secret, key_iv)),
+        }
+        _write_json(partial_path, manifest)
+
+    chunk_hashes = _read_progress(log_path)
+    done = len(chunk_hashes)
+    with open(file_path, "rb") as f, open(log_path, "a") as progress:
+        f.seek(done * chunk_size)
+        index = done
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            iv = generate_iv(8)
+            blob = iv + encrypt_cbc(chunk, file_key, iv)
+            with open(_chunk_path(directory, index), "wb") as out:
+                out.write(blob)
+            chunk_hash = hashlib.sha256(blob).hexdigest()
+            chunk_hashes.append(chunk_hash)
+            # Record progress after every chunk so an interruption loses at most one
+            progress.write(chunk_hash + "\n")
+            progress.flush()
+            index += 1
+
+    manifest["chunk_hashes"] = chunk_hashes
+    manifest["chunk_count"] = len(chunk_hashes)
+    manifest["signature"] = sign_message(sender_user["dsa_priv"], _manifest_bytes(manifest))
+    _write_json(os.path.join(directory, MANIFEST_FILE), manifest)
+    os.remove(partial_path)
+    os.remove(log_path)
+    return manifest
+
+def load_manifest(file_id, root=None):
+    path = os.path.join(root or ATTACHMENTS_DIR, file_id, MANIFEST_FILE)
+    with open(path, "r") as f:
+        return json.load(f)
+
+def _decrypt_chunk(job):
+    """Worker: checks one chunk against its manifest hash and decrypts it."""
+    path, expected_hash, file_key = job
+    with open(path, "rb") as f:
+        blob = f.read()
+    if hashlib.sha256(blob).hexdigest() != expected_hash:
+        raise ValueError(f"Chunk {os.path.basename(path)} does not match the signed manifest")
+    return decrypt_cbc(blob[8:], file_key, blob[:8])
+
+def receive_attachment(active_user, sender_keys, file_id, dest_path, workers=None, root=None):
+    """
+    Verifies the manifest signature, then decrypts the chunks (in parallel
+    with workers > 1) straight into dest_path. At most 2 * workers chunks
+    are held in memory. Progress is kept in <dest_path>.part.log, so an
+    interrupted download resumes without redoing finished chunks.
+    Returns the manifest.
+    """
+    root = root or ATTACHMENTS_DIR
+    manifest = load_manifest(file_id, root)
+    if manifest["recipient"] != active_user["username"]:
+        raise ValueError("Attachment is addressed to another user")
+    if not verify_signature(sender_keys["dsa"], _manifest_bytes(manifest), tuple(manifest["signature"])):
+        raise ValueError("Invalid manifest signature")
+
+    shared_secret = compute_shared_secret(active_user["ecdh_priv"], sender_keys["ecdh"])
+    file_key = decrypt_cbc(hex_to_bytes(manifest["wrapped_key"]), shared_secret, hex_to_bytes(manifest["key_iv"]))
+
+    directory = os.path.join(root, file_id)
+    part_path = dest_path + ".part"
+    progress_path = part_path + PROGRESS_LOG_SUFFIX
+    completed = set()
+    if os.path.exists(part_path) and os.path.exists(progress_path):
+        completed = {int(line) for line in _read_progress(progress_path)}
+    else:
+        open(progress_path, "w").close()
+        with open(part_path, "wb") as f:
+            f.truncate(manifest["size"])
+
+    pending = [i for i in range(manifest["chunk_count"]) if i not in completed]
+    jobs = ((i, (_chunk_path(directory, i), manifest["chunk_hashes"][i], file_key)) for i in pending)
+    chunk_size = manifest["chunk_size"]
+
+    with open(part_path, "r+b") as out, open(progress_path, "a") as progress:
+        def store(index, data):
+            out.seek(index * chunk_size)
+            out.write(data)
+            out.flush()
+            progress.write(f"{index}\n")
+            progress.flush()
+
+        workers = workers if workers is not None else (os.cpu_count() or 1)
+        if workers > 1 and len(pending) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                # Sliding window keeps memory bounded regardless of file size
+                in_flight = {}
+                for index, job in jobs:
+                    in_flight[index] = pool.submit(_decrypt_chunk, job)
+                    if len(in_flight) >= 2 * workers:
+                        first = min(in_flight)
+                        store(first, in_flight.pop(first).result())
+                for index in sorted(in_flight):
+                    store(index, in_flight[index].result())
+        else:
+            for index, job in jobs:
+                store(index, _decrypt_chunk(job))
+
+    os.replace(part_path, dest_path)
+    os.remove(progress_path)
+    return manifest
@@ -0,0 +1,66 @@
+import zlib
+import lzma
+
+# Payloads shorter than this are sent as-is (compression would not pay off)
+COMPRESS_MIN_BYTES = 256
+# Upper bound on a decompressed message (decompression-bomb protection)
+MAX_DECOMPRESSED_BYTES = 16 * 1024 * 1024
+# Input is fed to the decompressor in pieces of this size
+STREAM_CHUNK = 64 * 1024
+
+ALGORITHMS = ("zlib", "lzma")
+
+def compress(data: bytes, algorithm="zlib", min_bytes=COMPRESS_MIN_BYTES):
+    """
+    Compresses data before encryption.
+    Returns (payload, algorithm) or (data, None) if the data is small or incompressible.
+    """
+    if not algorithm or len(data) < min_bytes:
+        return data, None
+    if algorithm == "zlib":
+        packed = zlib.compress(data, 6)
+    elif algorithm == "lzma":
+        packed = lzma.compress(data, preset=6)
+    else:
+        raise ValueError(f"Unknown compression algorithm '{algorithm}'")
+    if len(packed) >= len(data):
+        return data, None
+    return packed, algorithm
+
+def decompress(data: bytes, algorithm, limit=MAX_DECOMPRESSED_BYTES) -> bytes:
+    """
+    Streams data through the decompressor and stops as soon as the output
+    would exceed limit bytes, so a small packet cannot expand into gigabytes.
+    """
+    if algorithm == "zlib":
+        decompressor = zlib.decompressobj()
+    elif algorithm == "lzma":
+        decompressor = lzma.LZMADecompressor()
+    else:
+        raise ValueError(f"Unknown compression algorithm '{algorithm}'")
+
+    out = bytearray()
+    for offset in range(0, len(data), STREAM_CHUNK):
+        pending = data[offset:offset + STREAM_CHUNK]
+        while pending:
+            out += decompressor.decompress(pending, limit + 1 - len(out))
+            if len(out) > limit:
+                raise ValueError("Decompressed message exceeds size limit")
+            # zlib keeps unread input in unconsumed_tail; lzma buffers it internally
+            pending = getattr(decompressor, "unconsumed_tail", b"")
+
+    # Drain anything the decompressor still holds
+    if algorithm == "lzma":
+        while not decompressor.eof and not decompressor.needs_input:
+            out += decompressor.decompress(b"", limit + 1 - len(out))
+            if len(out) > limit:
+                raise ValueError("Decompressed message exceeds size limit")
+        if not decompressor.eof:
+            raise ValueError("Truncated compressed data")
+    else:
+        out += decompressor.flush()
+        if len(out) > limit:
+            raise ValueError("Decompressed message exceeds size limit")
+        if not decompressor.eof:
+            raise ValueError("Truncated compressed data")
+    return bytes(out)
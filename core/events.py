@@ -0,0 +1,136 @@
+import time
+import threading
+from collections import deque
+
+# Event levels (same numbering as the standard logging module)
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+# Large binary fields are shown as this many bytes of hex plus the total length
+HEX_PREVIEW_BYTES = 32
+
+class Hex:
+    """
+    Deferred, truncated hex dump of a bytes value.
+    Wrapping is free; the hex string is only built if the event is formatted.
+    """
+    __slots__ = ("data", "upper")
+
+    def __init__(self, data: bytes, upper=False):
+        self.data = data
+        self.upper = upper
+
+    def __str__(self):
+        text = self.data[:HEX_PREVIEW_BYTES].hex()
+        if self.upper:
+            text = text.upper()
+        if len(self.data) > HEX_PREVIEW_BYTES:
+            text += f"... ({len(self.data)} bytes)"
+        return text
+
+    def __format__(self, spec):
+        return format(str(self), spec)
+
+
+class Event:
+    """A single pipeline event. details is formatted on first access only."""
+    __slots__ = ("time", "level", "title", "_details", "_args")
+
+    def __init__(self, level, title, details, args):
+        self.time = time.time()
+        self.level = level
+        self.title = title
+        self._details = details
+        self._args = args
+
+    @property
+    def details(self):
+        # details is a plain string, a format string with deferred args, or a callable
+        if self._args is not None:
+            self._details = self._details.format(*self._args)
+            self._args = None
+        elif callable(self._details):
+            self._details = self._details()
+        return self._details
+
+    @property
+    def level_name(self):
+        return LEVEL_NAMES.get(self.level, str(self.level))
+
+
+class EventLog:
+    """
+    Structured event sink shared by UserManager, SecureMessenger and the front ends.
+    Keeps a bounded ring buffer of recent events and notifies subscribers.
+    Events below every subscriber's level (and the buffer's level) are dropped
+    before anything is allocated or formatted.
+    """
+    def __init__(self, capacity=1000, buffer_level=INFO):
+        self.buffer = deque(maxlen=capacity)
+        self.buffer_level = buffer_level
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._update_min_level()
+
+    def _update_min_level(self):
+        levels = [level for _, level in self._subscribers]
+        if self.buffer.maxlen:
+            levels.append(self.buffer_level)
+        self.min_level = min(levels) if levels else ERROR + 1
+
+    def subscribe(self, callback, level=DEBUG):
+        """Calls callback(event) for every event at or above level. Subscribing twice is a no-op."""
+        with self._lock:
+            if not any(cb == callback for cb, _ in self._subscribers):
+                self._subscribers.append((callback, level))
+            self._update_min_level()
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers = [(cb, lvl) for cb, lvl in self._subscribers if cb != callback]
+            self._update_min_level()
+
+    def enabled(self, level):
+        """True if an event at this level would be seen by anyone."""
+        return level >= self.min_level
+
+    def emit(self, level, title, details="", *args):
+        """
+        Records an event.
+        :param details: A string, a str.format template filled from args, or a callable.
+        """
+        if level < self.min_level:
+            return
+        event = Event(level, title, details, args if args else None)
+        if level >= self.buffer_level and self.buffer.maxlen:
+            self.buffer.append(event)
+        for callback, cb_level in self._subscribers:
+            if level >= cb_level:
+                callback(event)
+
+    def recent(self, level=DEBUG):
+        """Returns buffered events at or above level, oldest first."""
+        return [e for e in list(self.buffer) if e.level >= level]
+
+
+class CallbackSubscriber:
+    """
+    Adapts an old-style debug_callback(title, details) function to the EventLog API.
+    Two adapters around the same function compare equal, so a callback handed to
+    both UserManager and SecureMessenger is only subscribed once.
+    """
+    def __init__(self, debug_callback):
+        self.debug_callback = debug_callback
+
+    def __call__(self, event):
+        self.debug_callback(event.title, event.details)
+
+    def __eq__(self, other):
+        return isinstance(other, CallbackSubscriber) and other.debug_callback == self.debug_callback
+
+    def __hash__(self):
+        return hash(self.debug_callback)
@@ -0,0 +1,70 @@
+import json
+import time
+import struct
+from multiprocessing import shared_memory
+
+# Shared segment size; the directory is JSON, roughly 300 bytes per user
+KEYDIR_SIZE = 16 * 1024 * 1024
+# generation (odd while a write is in progress), payload length
+HEADER = struct.Struct(">QQ")
+
+class PublicKeyDirectory:
+    """
+    Read-mostly map username -> {"dsa": [x, y], "ecdh": [x, y]} in
+    multiprocessing.shared_memory, so worker processes look up public keys
+    without reloading users.json.
+    There is a single writer (the service front end). Readers use a seqlock:
+    they retry when the generation is odd or changes while they copy the data,
+    and they only re-parse the JSON when the generation has moved on.
+    """
+    def __init__(self, name=None, create=False, size=KEYDIR_SIZE):
+        if create:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            HEADER.pack_into(self._shm.buf, 0, 0, 0)
+        else:
+            # Attach from child processes of the creator (they share its resource
+            # tracker, so the segment lives until the creator unlinks it)
+            self._shm = shared_memory.SharedMemory(name=name)
+        self.name = self._shm.name
+        self._keys = {}
+        self._generation = None
+
+    # --- writer ---
+    def publish(self, keys):
+        """Replaces the whole directory with keys ({username: public keys})."""
+        body = json.dumps(keys, separators=(",", ":")).encode("utf-8")
+        if HEADER.size + len(body) > self._shm.size:
+            raise ValueError("Public key directory is full; raise KEYDIR_SIZE")
+        generation, _ = HEADER.unpack_from(self._shm.buf, 0)
+        buf = self._shm.buf
+        HEADER.pack_into(buf, 0, generation + 1, 0)
+        buf[HEADER.size:HEADER.size + len(body)] = body
+        HEADER.pack_into(buf, 0, generation + 2, len(body))
+        self._keys, self._generation = dict(keys), generation + 2
+
+    # --- readers ---
+    def snapshot(self):
+        """Returns the current {username: public keys}."""
+        buf = self._shm.buf
+        while True:
+            generation, length = HEADER.unpack_from(buf, 0)
+            if generation == self._generation:
+                return self._keys
+            if generation % 2:
+                time.sleep(0)
+                continue
+            body = bytes(buf[HEADER.size:HEADER.size + length])
+            if HEADER.unpack_from(buf, 0)[0] != generation:
+                continue
+            self._keys = json.loads(body) if length else {}
+            self._generation = generation
+            return self._keys
+
+    def get(self, username):
+        return self.snapshot().get(username)
+
+    def close(self):
+        self._shm.close()
+
+    def unlink(self):
+        self._shm.unlink()
@@ -0,0 +1,168 @@
+import os
+import time
+import cProfile
+import inspect
+import functools
+import threading
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Recent samples kept per histogram for percentile estimates
+SAMPLE_WINDOW = 1024
+
+# Set to a directory to save a .pstats file for every instrumented call
+PROFILE_DIR_ENV = "CRYPTO_PROFILE_DIR"
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self.samples = deque(maxlen=SAMPLE_WINDOW)
+
+    def observe(self, value):
+        self.bucket_counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.samples.append(value)
+
+    def percentile(self, q):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+        }
+
+
+class MetricsRegistry:
+    """
+    Counters and latency histograms for the messaging pipeline stages
+    (send.*, inbox.*, register.*, login.*).
+    """
+    def __init__(self, profile_dir=None):
+        self.counters = {}
+        self.histograms = {}
+        self.profile_dir = profile_dir if profile_dir is not None else os.environ.get(PROFILE_DIR_ENV)
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        """Records the duration of the with-block in the named histogram."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    @contextmanager
+    def profiled(self, name):
+        """If profiling is switched on, runs the with-block under cProfile and saves <name>_<time>.pstats."""
+        if not self.profile_dir:
+            yield
+            return
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            os.makedirs(self.profile_dir, exist_ok=True)
+            filename = f"{name}_{time.time():.6f}.pstats"
+            profiler.dump_stats(os.path.join(self.profile_dir, filename))
+
+    def snapshot(self):
+        """Returns a plain dict copy of all counters and histogram summaries."""
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "histograms": {name: h.snapshot() for name, h in self.histograms.items()},
+            }
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def to_prometheus(self):
+        """Renders the registry in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                metric = _prometheus_name(name) + "_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value}")
+            for name, h in sorted(self.histograms.items()):
+                metric = _prometheus_name(name) + "_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, count in zip(h.buckets, h.bucket_counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{le="+Inf"}} {h.count}')
+                lines.append(f"{metric}_sum {h.sum}")
+                lines.append(f"{metric}_count {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def dump_prometheus(self, path):
+        with open(path, "w") as f:
+            f.write(self.to_prometheus())
+
+
+def _prometheus_name(name):
+    return "crypto_" + name.replace(".", "_").replace("-", "_")
+
+def instrumented(name):
+    """
+    Method decorator: counts calls, times the whole call as <name>.total and
+    applies the registry's optional cProfile switch. The object needs a .metrics attribute.
+    For generator methods the timing spans the whole iteration, not just the call.
+    """
+    def decorator(fn):
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def generator_wrapper(self, *args, **kwargs):
+                self.metrics.inc(f"{name}.calls")
+                with self.metrics.profiled(name), self.metrics.timer(f"{name}.total"):
+                    yield from fn(self, *args, **kwargs)
+            return generator_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            self.metrics.inc(f"{name}.calls")
+            with self.metrics.profiled(name), self.metrics.timer(f"{name}.total"):
+                return fn(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Process-wide registry used unless a component is given its own
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,184 @@
+import sys
+import json
+import asyncio
+import struct
+from collections import deque
+
+# Every frame is a 4-byte big-endian length followed by a UTF-8 JSON object.
+HEADER = struct.Struct(">I")
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+async def read_frame(reader):
+    """Reads one frame. Returns None when the connection is closed."""
+    try:
+        header = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError:
+        return None
+    (length,) = HEADER.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise ValueError("Frame too large")
+    return json.loads(await reader.readexactly(length))
+
+def encode_frame(obj):
+    body = json.dumps(obj).encode("utf-8")
+    return HEADER.pack(len(body)) + body
+
+
+class RelayServer:
+    """
+    Local message relay.
+    Requests (each carries an "id" echoed in the reply):
+      {"op": "send", "packet": {...}}    -> push to the recipient if online, else queue
+      {"op": "subscribe", "user": name}  -> flush the offline queue, then push new packets
+    Clients may pipeline any number of requests without waiting for replies.
+    """
+    def __init__(self):
+        self.offline = {}      # username -> deque of packets
+        self.subscribers = {}  # username -> set of StreamWriters
+        self._server = None
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT, path=None):
+        if path:
+            self._server = await asyncio.start_unix_server(self._handle, path=path)
+        else:
+            self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server
+
+    @property
+    def port(self):
+        return self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    def _push(self, packet):
+        writers = self.subscribers.get(packet.get("recipient"))
+        if not writers:
+            self.offline.setdefault(packet.get("recipient"), deque()).append(packet)
+            return
+        frame = encode_frame({"op": "deliver", "packet": packet})
+        for writer in writers:
+            writer.write(frame)
+
+    async def _handle(self, reader, writer):
+        subscribed = set()
+        try:
+            while True:
+                request = await read_frame(reader)
+                if request is None:
+                    break
+                op = request.get("op")
+
+                if op == "send":
+                    self._push(request["packet"])
+                    reply = {"op": "ack", "id": request.get("id")}
+                elif op == "subscribe":
+                    user = request["user"]
+                    self.subscribers.setdefault(user, set()).add(writer)
+                    subscribed.add(user)
+                    queued = self.offline.pop(user, ())
+                    for packet in queued:
+                        writer.write(encode_frame({"op": "deliver", "packet": packet}))
+                    reply = {"op": "ack", "id": request.get("id")}
+                else:
+                    reply = {"op": "error", "id": request.get("id"), "error": f"Unknown op '{op}'"}
+
+                writer.write(encode_frame(reply))
+                # Only wait for the socket when the buffer is actually backing up
+                if writer.transport.get_write_buffer_size() > 64 * 1024:
+                    await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            for user in subscribed:
+                self.subscribers.get(user, set()).discard(writer)
+                if not self.subscribers.get(user):
+                    self.subscribers.pop(user, None)
+            writer.close()
+
+
+class RelayClient:
+    """
+    asyncio client for RelayServer over one persistent connection.
+    Replies are matched to requests by id, so calls can be pipelined with asyncio.gather.
+    """
+    def __init__(self, host=DEFAULT_HOST, port=None, path=None, on_deliver=None):
+        self.host = host
+        self.port = port or DEFAULT_PORT
+        self.path = path
+        self.on_deliver = on_deliver
+        self._pending = {}
+        self._next_id = 0
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+
+    async def connect(self):
+        if self.path:
+            self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+        else:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self._reader_task = asyncio.ensure_future(self._read_loop())
+
+    async def _read_loop(self):
+        try:
+            while True:
+                frame = await read_frame(self._reader)
+                if frame is None:
+                    break
+                if frame.get("op") == "deliver":
+                    if self.on_deliver:
+                        self.on_deliver(frame["packet"])
+                    continue
+                future = self._pending.pop(frame.get("id"), None)
+                if future and not future.done():
+                    if frame.get("op") == "error":
+                        future.set_exception(RuntimeError(frame.get("error")))
+                    else:
+                        future.set_result(frame)
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Relay connection closed"))
+            self._pending.clear()
+
+    async def _request(self, request):
+        self._next_id += 1
+        request["id"] = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[self._next_id] = future
+        self._writer.write(encode_frame(request))
+        await self._writer.drain()
+        return await future
+
+    async def send(self, packet):
+        return await self._request({"op": "send", "packet": packet})
+
+    async def subscribe(self, username):
+        return await self._request({"op": "subscribe", "user": username})
+
+    async def close(self):
+        if self._writer:
+            self._writer.close()
+        if self._reader_task:
+            await asyncio.gather(self._reader_task, return_exceptions=True)
+
+
+async def _serve(host, port, path):
+    server = RelayServer()
+    srv = await server.start(host, port, path)
+    print(f"Relay listening on {path or f'{host}:{server.port}'}")
+    async with srv:
+        await srv.serve_forever()
+
+if __name__ == "__main__":
+    # Usage: python -m core.relay [port | unix-socket-path]
+    arg = sys.argv[1] if len(sys.argv) > 1 else str(DEFAULT_PORT)
+    if arg.isdigit():
+        asyncio.run(_serve(DEFAULT_HOST, int(arg), None))
+    else:
+        asyncio.run(_serve(None, None, arg))
@@ -0,0 +1,147 @@
+import time
+import threading
+from core.events import EventLog, INFO, ERROR
+from core.seen_index import get_seen_index
+
+# Seconds between two background compaction runs
+GC_INTERVAL = 300
+# Read messages per archive segment
+SEGMENT_SIZE = 256
+SEGMENT_COMPRESSION = "lzma"
+
+# ======================================================
+# Retention and compaction
+# ======================================================
+# Works on a FileTransport (core/transport.py):
+#   1. messages outside the user's RetentionPolicy are deleted (live or archived),
+#   2. read messages still in the live directory are moved into compressed
+#      archive segments,
+#   3. ids not seen within the replay window are dropped from the seen index
+#      (core/seen_index.py), unless their message is still stored.
+# The live directory (and so check_inbox) then only holds unread mail, while
+# list_inbox/open_message keep serving the archived history.
+
+class RetentionPolicy:
+    def __init__(self, max_age=None, max_count=None):
+        """
+        :param max_age: Seconds a message is kept, or None for no age limit.
+        :param max_count: Newest messages kept per user, or None for no limit.
+        """
+        self.max_age = max_age
+        self.max_count = max_count
+
+    def expired(self, headers, now):
+        """Returns the ids in headers (oldest first) that fall outside the policy."""
+        expired = set()
+        if self.max_count is not None and len(headers) > self.max_count:
+            expired.update(h["id"] for h in headers[:len(headers) - self.max_count])
+        if self.max_age is not None:
+            cutoff = now - self.max_age
+            expired.update(h["id"] for h in headers if (h["timestamp"] or 0) < cutoff)
+        return expired
+
+    def __repr__(self):
+        return f"RetentionPolicy(max_age={self.max_age}, max_count={self.max_count})"
+
+# Keeps everything; compaction still archives read mail
+KEEP_ALL = RetentionPolicy()
+
+
+class Compactor:
+    def __init__(self, transport, policies=None, default_policy=KEEP_ALL,
+                 segment_size=SEGMENT_SIZE, algorithm=SEGMENT_COMPRESSION, seen_index=None):
+        """
+        :param transport: The FileTransport whose messages are compacted.
+        :param policies: Optional {username: RetentionPolicy} overriding default_policy.
+        :param seen_index: Path of the seen-message index to expire, or None.
+        """
+        self.transport = transport
+        self.seen_index = seen_index
+        self.policies = policies or {}
+        self.default_policy = default_policy
+        self.segment_size = segment_size
+        self.algorithm = algorithm
+
+    def policy_for(self, username):
+        return self.policies.get(username, self.default_policy)
+
+    def compact_user(self, username, now=None):
+        """Applies retention, then archives read live mail. Returns {"expired": n, "archived": n}."""
+        now = time.time() if now is None else now
+
+        # 1. Retention
+        headers = self.transport.headers(username)
+        expired = self.policy_for(username).expired(headers, now)
+        removed = self.transport.expire(username, expired)
+
+        # 2. Read messages still in the live directory go to the archive
+        read = self.transport.read_ids(username)
+        entries = sorted(self.transport.fetch_entries(username), key=lambda entry: entry[1].get("timestamp") or 0)
+        # Timestamp order keeps each segment's messages close in age, so they expire together
+        live_read = [message_id for message_id, _ in entries if message_id in read and message_id not in expired]
+        archived = 0
+        for i in range(0, len(live_read), self.segment_size):
+            archived += self.transport.archive(username, live_read[i:i + self.segment_size], self.algorithm)
+        return {"expired": removed, "archived": archived}
+
+    def run_once(self, usernames=None, now=None):
+        """Compacts the given users (default: every recipient). Returns {username: stats}."""
+        names = self.transport.recipients() if usernames is None else usernames
+        return {username: self.compact_user(username, now) for username in names}
+
+    def expire_seen(self, now=None):
+        """
+        Drops seen-index entries outside the replay window, except those of messages
+        the transport still stores (live or archived). Returns the number removed.
+        """
+        if not self.seen_index:
+            return 0
+        stored = {username: {header["id"] for header in self.transport.headers(username)}
+                  for username in self.transport.recipients()}
+        return get_seen_index(self.seen_index).expire(now, keep=stored)
+
+
+class GarbageCollector:
+    """
+    Runs a Compactor on a daemon thread every interval seconds.
+    Senders hardly wait for it: the transport only holds its index lock for
+    short writes (index lines, or a segment that was compressed beforehand).
+    """
+    def __init__(self, compactor, interval=GC_INTERVAL, events=None):
+        self.compactor = compactor
+        self.interval = interval
+        self.events = events or EventLog()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="message-gc", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run_now(self):
+        try:
+            stats = self.compactor.run_once()
+            seen_expired = self.compactor.expire_seen()
+        except Exception as e:
+            self.events.emit(ERROR, "GC ERROR", "Compaction failed: {}", e)
+            return None
+        expired = sum(s["expired"] for s in stats.values())
+        archived = sum(s["archived"] for s in stats.values())
+        if expired or archived:
+            self.events.emit(INFO, "GC", "Expired {} and archived {} messages for {} users.",
+                             expired, archived, len(stats))
+        if seen_expired:
+            self.events.emit(INFO, "GC", "Forgot {} message ids outside the replay window.", seen_expired)
+        return stats
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.run_now()
@@ -1,171 +1,691 @@
 import os
 import json
 import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from crypto.ecdh import compute_shared_secret
 from crypto.dsa import sign_message, verify_signature
-from crypto.gost import encrypt_cbc, decrypt_cbc
+from crypto.backends import encrypt_cbc, decrypt_cbc
+from core.sharding import default_transport
+from core.watcher import InboxWatcher
+from core import sessions as session_layer
+from core.sessions import SessionStore, SESSION_MAX_MESSAGES
+from core.seen_index import SEEN_INDEX_FILE, get_seen_index, message_id_for, DUPLICATE, STALE, INVALID
+from core.metrics import REGISTRY, instrumented
+from core import attachments
+from core.compression import compress, decompress
+from core.verify_cache import VERIFY_CACHE_FILE, get_cache
+from core.events import EventLog, CallbackSubscriber, Hex, DEBUG, INFO, WARNING, ERROR
 from utils import generate_iv, str_to_bytes, bytes_to_str, bytes_to_hex, hex_to_bytes
 
-MESSAGES_DIR = os.path.join("data", "messages")
+# Inbox crypto is handed to worker processes in chunks of this many packets
+INBOX_CHUNK_SIZE = 16
+# Default page size of list_inbox
+INBOX_PAGE_SIZE = 20
+# Opened messages kept in memory by open_message
+OPENED_CACHE_SIZE = 1024
+# DSA signatures cover these packet fields as well as the text (format 2), so
+# e.g. a replayed packet cannot get a fresh timestamp past the seen-index window
+# and the session a message opens cannot be swapped
+SIGNATURE_FORMAT = 2
+SIGNED_FIELDS = ("sender", "recipient", "timestamp", "session")
+# Older packets signed the text only; their timestamp is unauthenticated, so they
+# are only accepted when dated before format 2 was introduced (2026-10-19 UTC)
+LEGACY_SIGNATURES_UNTIL = 1792368000
+# ECDH results kept per process for the logged-in keys (dropped by SecureMessenger.logout)
+SHARED_SECRET_CACHE_SIZE = 256
 
 class SecureMessenger:
-    def __init__(self, user_manager, debug_callback=None):
+    def __init__(self, user_manager, debug_callback=None, inbox_workers=None, transport=None, events=None, metrics=None,
+                 verify_cache=VERIFY_CACHE_FILE, compression="zlib", sessions=True, seen_index=SEEN_INDEX_FILE):
         """
         Initialize the Secure Messenger.
         :param user_manager: Reference to the UserManager (to look up public keys).
         :param debug_callback: A function to call for logging events (used by the GUI Monitor).
+        :param inbox_workers: Number of processes used to decrypt/verify the inbox.
+                              Defaults to the CPU count; 0 or 1 processes serially.
+        :param transport: How packets travel: FileTransport (default, data/messages),
+                          ShardedTransport (default when $MESSAGE_ROOTS lists several roots,
+                          see core/sharding.py) or RelayTransport (asyncio relay server, see core/relay.py).
+        :param events: Shared EventLog; a private one is created if omitted.
+        :param metrics: MetricsRegistry for per-stage latencies (defaults to the process-wide one).
+        :param verify_cache: Path of the signature verification cache (SQLite), or None to disable it.
+        :param compression: "zlib", "lzma" or None. Large payloads are compressed before encryption.
+        :param sessions: Send follow-up messages through the session ratchet (core/sessions.py)
+                         instead of a fresh ECDH + DSA signature each time.
+        :param seen_index: Path of the per-recipient seen-message index (SQLite), or None to
+                           disable duplicate/replay screening.
         """
         self.user_manager = user_manager
         self.debug_callback = debug_callback
-        
-        if not os.path.exists(MESSAGES_DIR):
-            os.makedirs(MESSAGES_DIR)
+        self.inbox_workers = (os.cpu_count() or 1) if inbox_workers is None else inbox_workers
+        self._executor = None
+        self.transport = transport or default_transport()
+        self.events = events or EventLog()
+        self.metrics = metrics or REGISTRY
+        self.verify_cache = verify_cache
+        self.compression = compression
+        self._opened = OrderedDict()
+        # open_message may run on the GUI worker and the inbox watcher at the same time
+        self._opened_lock = threading.Lock()
+        self.sessions = sessions
+        self._session_stores = {}
+        self.seen_index = seen_index
+        if debug_callback:
+            self.events.subscribe(CallbackSubscriber(debug_callback))
+
+    def _log(self, title, details, *args, level=INFO):
+        """Helper function to record a pipeline event (formatting is deferred, see core/events.py)."""
+        self.events.emit(level, title, details, *args)
 
-    def _log(self, title, details):
-        """Helper function to send logs to the monitor if a callback is set."""
-        if self.debug_callback:
-            self.debug_callback(title, details)
+    def _screen(self, username, entries, discard=True):
+        """
+        Checks (message_id, packet) entries against the seen index, before any crypto.
+        With discard, duplicates and packets with a forged id are removed from the store.
+        Returns the verdicts (None for every entry when screening is off).
+        """
+        if not self.seen_index or not entries:
+            return [None] * len(entries)
+        with self.metrics.timer("inbox.screen"):
+            index = get_seen_index(self.seen_index)
+            # An old packet is only suspicious if the transport did not store it itself
+            cutoff = time.time() - index.window
+            stored = self._stored_ids(username) if any((packet.get("timestamp") or 0) < cutoff
+                                                       for _, packet in entries) else None
+            verdicts = index.check_many(username, [(packet, message_id) for message_id, packet in entries],
+                                        stored=stored)
+        rejected = [message_id for (message_id, _), verdict in zip(entries, verdicts) if verdict in (DUPLICATE, INVALID)]
+        for verdict in verdicts:
+            if verdict in (DUPLICATE, STALE, INVALID):
+                self.metrics.inc(f"inbox.rejected_{verdict}")
+        if rejected and discard:
+            self._log("REPLAY PROTECTION", "Discarded {} duplicate or forged packets without decrypting them.",
+                      len(rejected), level=WARNING)
+            self.transport.discard(username, rejected)
+        return verdicts
 
+    def _stored_ids(self, username):
+        """Ids in the transport's header index for the user (live and archived), or None without one."""
+        if not hasattr(self.transport, "headers"):
+            return None
+        return {header["id"] for header in self.transport.headers(username)}
+
+    def _session_store(self, user):
+        store = self._session_stores.get(user["username"])
+        if store is None:
+            store = self._session_stores[user["username"]] = SessionStore(user)
+        return store
+
+    def _session_root(self, active_user, packet, sender_keys):
+        """
+        Root key of the sender's session (one ticket check and ECDH per session, then remembered).
+        Raises ValueError if the sender's DSA key did not sign the session ticket.
+        """
+        session = packet["session"]
+        sender_name, username = packet["sender"], active_user["username"]
+
+        def derive_root():
+            ticket = session_layer.ticket_bytes(sender_name, username, session["id"], session["created"])
+            signature = tuple(session["ticket"])
+            if self.verify_cache:
+                is_valid = get_cache(self.verify_cache).verify(verify_signature, sender_keys["dsa"], ticket, signature)
+            else:
+                is_valid = verify_signature(sender_keys["dsa"], ticket, signature)
+            if not is_valid:
+                raise ValueError("Invalid session ticket")
+            peer_x, peer_y = sender_keys["ecdh"]
+            shared_secret = _shared_secret_for(active_user["ecdh_priv"], peer_x, peer_y)
+            return session_layer.session_root(shared_secret, session["id"], sender_name, username)
+
+        if not self.sessions:
+            return derive_root()
+        return self._session_store(active_user).incoming_root(sender_name, session["id"], derive_root)
+
+    @instrumented("send")
     def send_message(self, sender_user, recipient_name, message_text):
-        self._log("SEND PROCESS START", f"Initiating secure message from '{sender_user['username']}' to '{recipient_name}'.")
+        self._log("SEND PROCESS START", "Initiating secure message from '{}' to '{}'.", sender_user['username'], recipient_name)
 
         # 1. Get recipient public keys
         recipient_keys = self.user_manager.get_public_keys(recipient_name)
         if not recipient_keys:
-            self._log("ERROR", f"Recipient '{recipient_name}' not found in database.")
+            self._log("ERROR", "Recipient '{}' not found in database.", recipient_name, level=ERROR)
+            self.metrics.inc("send.errors")
             return False, "Recipient not found."
 
+        # Inside an established session the next chain key replaces ECDH and DSA
+        if self.sessions:
+            ratchet = self._session_store(sender_user).next_outgoing(recipient_name, recipient_keys["ecdh"])
+            if ratchet:
+                return self._send_session_message(sender_user, recipient_name, message_text, ratchet)
+
         # 2. Compute Shared Secret (ECDH)
         # Using Sender's Private + Recipient's Public
         self._log("ECDH KEY EXCHANGE", 
-                  f"Sender Private: [HIDDEN]\n"
-                  f"Recipient Public: {recipient_keys['ecdh']}\n"
-                  f"Calculating shared secret point...")
+                  "Sender Private: [HIDDEN]\n"
+                  "Recipient Public: {}\n"
+                  "Calculating shared secret point...", recipient_keys['ecdh'], level=DEBUG)
         
         try:
-            shared_secret = compute_shared_secret(sender_user["ecdh_priv"], recipient_keys["ecdh"])
-            self._log("SHARED SECRET DERIVED", f"Shared Secret (SHA-256 of Point X): {shared_secret.hex().upper()}")
+            with self.metrics.timer("send.ecdh"):
+                shared_secret = compute_shared_secret(sender_user["ecdh_priv"], recipient_keys["ecdh"])
+            self._log("SHARED SECRET DERIVED", "Shared Secret (SHA-256 of Point X): {}", Hex(shared_secret, upper=True), level=DEBUG)
         except ValueError as e:
-            self._log("ECDH ERROR", str(e))
+            self._log("ECDH ERROR", str(e), level=ERROR)
+            self.metrics.inc("send.errors")
             return False, f"Key Exchange Error: {e}"
 
         # 3. Sign the message (DSA)
-        # Using Sender's Private DSA Key
+        # Using Sender's Private DSA Key, over the header fields and the text
         msg_bytes = str_to_bytes(message_text)
-        self._log("DIGITAL SIGNATURE (DSA)", f"Signing message hash with '{sender_user['username']}' Private Key...")
+        packet = {
+            "sender": sender_user["username"],
+            "recipient": recipient_name,
+            "timestamp": time.time(),
+            "sig_format": SIGNATURE_FORMAT,
+        }
+        if self.sessions:
+            # Later messages to this recipient derive their keys from this session; the
+            # ticket lets the recipient check that each of them belongs to a session we opened
+            session_id, created = session_layer.new_session_id(), packet["timestamp"]
+            with self.metrics.timer("send.ticket"):
+                ticket = sign_message(sender_user["dsa_priv"],
+                                      session_layer.ticket_bytes(packet["sender"], recipient_name, session_id, created))
+            packet["session"] = {"id": session_id, "n": 0, "created": created, "ticket": list(ticket)}
+        self._log("DIGITAL SIGNATURE (DSA)", "Signing message hash with '{}' Private Key...", sender_user['username'], level=DEBUG)
         
-        signature = sign_message(sender_user["dsa_priv"], msg_bytes)
-        self._log("SIGNATURE GENERATED", f"Signature (r, s): {signature}")
+        with self.metrics.timer("send.sign"):
+            signature = sign_message(sender_user["dsa_priv"], signed_bytes(packet, msg_bytes))
+        self._log("SIGNATURE GENERATED", "Signature (r, s): {}", signature, level=DEBUG)
+
+        # 4. Compress large payloads (the signature above covers the original text)
+        with self.metrics.timer("send.compress"):
+            payload, algorithm = compress(msg_bytes, self.compression)
+        if algorithm:
+            self._log("COMPRESSION", "{}: {} -> {} bytes", algorithm, len(msg_bytes), len(payload), level=DEBUG)
 
-        # 4. Encrypt the message (GOST)
+        # 5. Encrypt the message (GOST)
         # Using the Shared Secret
-        self._log("ENCRYPTION (GOST)", "Generating random IV and encrypting message using CBC mode...")
+        self._log("ENCRYPTION (GOST)", "Generating random IV and encrypting message using CBC mode...", level=DEBUG)
         iv = generate_iv(8)
-        ciphertext = encrypt_cbc(msg_bytes, shared_secret, iv)
+        with self.metrics.timer("send.encrypt"):
+            ciphertext = encrypt_cbc(payload, shared_secret, iv)
         
-        self._log("ENCRYPTION COMPLETE", f"IV: {bytes_to_hex(iv)}\nCiphertext: {bytes_to_hex(ciphertext)}")
+        self._log("ENCRYPTION COMPLETE", "IV: {}\nCiphertext: {}", Hex(iv), Hex(ciphertext), level=DEBUG)
 
-        # 5. Package the message
+        # 6. Package the message
         # We need to send: IV, Ciphertext, Signature
+        packet.update({
+            "iv": bytes_to_hex(iv),
+            "ciphertext": bytes_to_hex(ciphertext),
+            "signature": signature # Tuple (r, s)
+        })
+        if algorithm:
+            packet["compression"] = algorithm
+        packet["message_id"] = message_id_for(packet)
+
+        # 7. Hand the packet to the transport (file drop or relay server)
+        result = self._deliver(packet)
+        if self.sessions:
+            # Only a delivered opening message starts the session
+            self._session_store(sender_user).start_outgoing(recipient_name, recipient_keys["ecdh"], shared_secret,
+                                                           packet["session"])
+            self._log("SESSION START", "New session {} with '{}'.", packet["session"]["id"], recipient_name, level=DEBUG)
+        return result
+
+    def _send_session_message(self, sender_user, recipient_name, message_text, ratchet):
+        """Steady-state send: SHA-256 key derivation + GOST + HMAC, no curve operations."""
+        session, chain_key = ratchet
+        session_id, n = session["id"], session["n"]
+        with self.metrics.timer("send.ratchet"):
+            enc_key, mac_key = session_layer.message_keys(chain_key)
+        self._log("SESSION KEY (RATCHET)", "Session {} message #{}: key derived from chain key {}.",
+                  session_id, n, Hex(chain_key, upper=True), level=DEBUG)
+
+        msg_bytes = str_to_bytes(message_text)
+        with self.metrics.timer("send.compress"):
+            payload, algorithm = compress(msg_bytes, self.compression)
+
+        iv = generate_iv(8)
+        with self.metrics.timer("send.encrypt"):
+            ciphertext = encrypt_cbc(payload, enc_key, iv)
+        self._log("ENCRYPTION COMPLETE", "IV: {}\nCiphertext: {}", Hex(iv), Hex(ciphertext), level=DEBUG)
+
         packet = {
             "sender": sender_user["username"],
             "recipient": recipient_name,
             "timestamp": time.time(),
             "iv": bytes_to_hex(iv),
             "ciphertext": bytes_to_hex(ciphertext),
-            "signature": signature # Tuple (r, s)
+            "session": session,
         }
+        if algorithm:
+            packet["compression"] = algorithm
+        packet["message_id"] = message_id_for(packet)
+        # The MAC covers every field above, including the session header and position
+        packet["mac"] = session_layer.packet_mac(mac_key, packet)
+        self.metrics.inc("send.session_messages")
+        return self._deliver(packet)
 
-        # 6. Save to file (Simulating network send)
-        filename = f"{recipient_name}_{int(time.time())}.msg"
-        filepath = os.path.join(MESSAGES_DIR, filename)
-        
-        with open(filepath, "w") as f:
-            json.dump(packet, f)
+    def _deliver(self, packet):
+        with self.metrics.timer("send.deliver"):
+            details = self.transport.deliver(packet)
+        self.metrics.inc("send.messages")
             
-        self._log("NETWORK SIMULATION", f"Message packet saved to '{filename}'.")
+        self._log("NETWORK SIMULATION", details)
 
         return True, "Message sent securely."
 
+    @instrumented("attachment_send")
+    def send_attachment(self, sender_user, recipient_name, file_path, file_id=None):
+        """
+        Sends a file as encrypted chunks (see core/attachments.py) and notifies
+        the recipient with a normal secure message.
+        Pass the file_id of an interrupted upload to resume it.
+        Returns (success, message, file_id).
+        """
+        recipient_keys = self.user_manager.get_public_keys(recipient_name)
+        if not recipient_keys:
+            self._log("ERROR", "Recipient '{}' not found in database.", recipient_name, level=ERROR)
+            return False, "Recipient not found.", None
+
+        # The id is fixed up front so a failed upload can be resumed with it
+        file_id = file_id or attachments.new_file_id()
+        self._log("ATTACHMENT START", "Encrypting '{}' in chunks for '{}'...", file_path, recipient_name)
+        try:
+            manifest = attachments.send_attachment(sender_user, recipient_keys, recipient_name, file_path, file_id=file_id)
+        except (OSError, ValueError) as e:
+            self._log("ATTACHMENT ERROR", "Upload failed: {}", e, level=ERROR)
+            return False, f"Attachment Error: {e}", file_id
+        self._log("ATTACHMENT STORED", "{} chunks, manifest signed. File id: {}", manifest["chunk_count"], manifest["file_id"])
+
+        notice = f"[Attachment] {manifest['filename']} ({manifest['size']} bytes) id={manifest['file_id']}"
+        success, msg = self.send_message(sender_user, recipient_name, notice)
+        return success, "Attachment sent securely." if success else msg, manifest["file_id"]
+
+    @instrumented("attachment_receive")
+    def receive_attachment(self, active_user, file_id, dest_path, workers=None):
+        """
+        Verifies and decrypts an attachment into dest_path (resumes if interrupted).
+        Returns (success, message).
+        """
+        try:
+            manifest = attachments.load_manifest(file_id)
+        except (OSError, ValueError):
+            return False, "Attachment not found."
+        sender_keys = self.user_manager.get_public_keys(manifest["sender"])
+        if not sender_keys:
+            return False, "Unknown sender"
+
+        self._log("ATTACHMENT RECEIVE", "Verifying manifest of '{}' from '{}'...", manifest["filename"], manifest["sender"])
+        try:
+            attachments.receive_attachment(active_user, sender_keys, file_id, dest_path,
+                                           workers=self.inbox_workers if workers is None else workers)
+        except (OSError, ValueError) as e:
+            self._log("SECURITY WARNING", "Attachment rejected: {}", e, level=WARNING)
+            return False, f"Attachment Error: {e}"
+        self._log("ATTACHMENT COMPLETE", "Saved {} bytes to '{}'.", manifest["size"], dest_path)
+        return True, "Attachment verified and saved."
+
+    def logout(self, active_user):
+        """
+        Forgets everything derived from the user's keys for this login: cached
+        ECDH secrets, opened messages and session state. The inbox worker pool
+        holds its own copies, so it is stopped (and restarted on the next inbox read).
+        """
+        username = active_user["username"]
+        forget_shared_secrets(active_user["ecdh_priv"])
+        with self._opened_lock:
+            for key in [key for key in self._opened if key[0] == username]:
+                del self._opened[key]
+        self._session_stores.pop(username, None)
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def close(self):
+        """Shuts down the inbox worker pool and the transport."""
+        self.transport.close()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.inbox_workers)
+        return self._executor
+
+    def _read_inbox_packets(self, username):
+        """I/O stage: fetches every live (message_id, packet) addressed to the user, sorted by timestamp."""
+        entries = self.transport.fetch_entries(username)
+        entries.sort(key=lambda entry: entry[1].get("timestamp", 0))
+        return entries
+
+    def list_inbox(self, active_user, offset=0, limit=INBOX_PAGE_SIZE):
+        """
+        Returns one page of message headers (id, sender, timestamp, size), newest first.
+        No decryption or verification happens here; see open_message.
+        """
+        with self.metrics.timer("inbox.list"):
+            return self.transport.list_headers(active_user["username"], offset, limit)
+
+    def open_message(self, active_user, message_id):
+        """
+        Decrypts and verifies a single message from list_inbox.
+        Results are memoized per user, so reopening a message costs nothing.
+        Returns the same dict as check_inbox, plus its "id".
+        """
+        key = (active_user["username"], message_id)
+        with self._opened_lock:
+            cached = self._opened.get(key)
+            if cached is not None:
+                self._opened.move_to_end(key)
+        if cached is not None:
+            self.metrics.inc("inbox.open_cached")
+            return cached
+
+        packet = self.transport.get_packet(active_user["username"], message_id)
+        if packet is None or packet.get("recipient") != active_user["username"]:
+            return {"id": message_id, "sender": None, "error": "Message not found"}
+        # Not discarded here: that would shift the positions list_inbox pages are based on
+        verdict = self._screen(active_user["username"], [(message_id, packet)], discard=False)[0]
+        if verdict in (DUPLICATE, INVALID):
+            # Already shown under its first id (or forged); callers skip "rejected" entries
+            return {"id": message_id, "sender": packet.get("sender"), "error": f"Rejected ({verdict})", "rejected": True}
+        if verdict == STALE:
+            return {"id": message_id, "sender": packet.get("sender"), "error": "Stale message (possible replay)"}
+
+        sender_keys = self.user_manager.get_public_keys(packet["sender"])
+        if not sender_keys:
+            logs, message, timings = [], {"sender": packet["sender"], "error": "Unknown sender"}, []
+        else:
+            logs, message, timings = _open_packet(packet, active_user["ecdh_priv"], sender_keys,
+                                                  self.events.min_level, self.verify_cache,
+                                                  self._job_session_root(active_user, packet, sender_keys))
+        self._replay(logs, message, timings)
+        message["id"] = message_id
+        self.transport.mark_read(active_user["username"], [message_id])
+
+        # Unknown senders may register later, so only real crypto results are kept
+        if sender_keys:
+            with self._opened_lock:
+                self._opened[key] = message
+                if len(self._opened) > OPENED_CACHE_SIZE:
+                    self._opened.popitem(last=False)
+        return message
+
+    def watch_inbox(self, active_user, callback, interval=None):
+        """
+        Starts an InboxWatcher (core/watcher.py) for the user.
+        callback(entries) gets only newly arrived (message_id, packet) pairs, on
+        the watcher thread; pass the ids to open_message to read them.
+        Returns the watcher; call stop() on it when done.
+        """
+        kwargs = {} if interval is None else {"interval": interval}
+        return InboxWatcher(self.transport, active_user["username"], callback, **kwargs).start()
+
     def check_inbox(self, active_user):
         """Reads all messages destined for the active user."""
-        messages = []
-        found_count = 0
-        
-        # Scan directory for files
-        for filename in os.listdir(MESSAGES_DIR):
-            if not filename.endswith(".msg"):
-                continue
-            
-            filepath = os.path.join(MESSAGES_DIR, filename)
-            try:
-                with open(filepath, "r") as f:
-                    packet = json.load(f)
-            except:
-                continue
+        return [message for _, _, message in self.iter_inbox(active_user)]
 
-            # Check if this message is for me
-            if packet.get("recipient") != active_user["username"]:
-                continue
+    @instrumented("inbox")
+    def iter_inbox(self, active_user, cancel_event=None):
+        """
+        Same as check_inbox, but yields (done, total, message) as soon as each
+        message (in timestamp order) has been decrypted and verified.
+        :param cancel_event: Optional threading.Event; when set, processing stops early.
+        """
+        with self.metrics.timer("inbox.fetch"):
+            entries = self._read_inbox_packets(active_user["username"])
+
+        # Known packets are sorted out with hash lookups only (see core/seen_index.py)
+        verdicts = self._screen(active_user["username"], entries)
+        stale = {message_id for (message_id, _), verdict in zip(entries, verdicts) if verdict == STALE}
+        entries = [entry for entry, verdict in zip(entries, verdicts) if verdict not in (DUPLICATE, INVALID)]
+        packets = [packet for _, packet in entries]
+        total = len(packets)
 
-            found_count += 1
+        # Build one crypto job per packet; unknown senders are resolved right here
+        results = [None] * total
+        jobs = []
+        for index, (message_id, packet) in enumerate(entries):
             sender_name = packet["sender"]
+            if message_id in stale:
+                results[index] = ([(WARNING, "SECURITY WARNING", "Stale message from {} (possible replay).", (sender_name,))],
+                                  {"sender": sender_name, "error": "Stale message (possible replay)"}, [])
+                continue
             
-            # --- START LOGGING FOR RECEIVER ---
-            self._log("INBOX RECEIVE", f"Processing new message from '{sender_name}'...")
-
             # 1. Get Sender's Public Keys (for verification and ECDH)
             sender_keys = self.user_manager.get_public_keys(sender_name)
             if not sender_keys:
-                messages.append({"sender": sender_name, "error": "Unknown sender"})
+                results[index] = ([(INFO, "INBOX RECEIVE", "Processing new message from '{}'...", (sender_name,))],
+                                  {"sender": sender_name, "error": "Unknown sender"}, [])
                 continue
+            jobs.append((index, packet, active_user["ecdh_priv"], sender_keys, self.events.min_level, self.verify_cache,
+                         self._job_session_root(active_user, packet, sender_keys)))
 
-            # 2. Compute Shared Secret (ECDH) to decrypt
-            # Using My Private + Sender's Public
-            try:
-                shared_secret = compute_shared_secret(active_user["ecdh_priv"], sender_keys["ecdh"])
-                self._log("ECDH (RECEIVER)", f"Computed Shared Secret: {shared_secret.hex().upper()}\n[CHECK] Compare this with Sender's log to verify match.")
-            except:
-                messages.append({"sender": sender_name, "error": "ECDH Failed"})
-                continue
+        # Crypto stage: serial, or fanned out to the process pool in chunks
+        futures = []
+        if self.inbox_workers > 1 and len(jobs) > INBOX_CHUNK_SIZE:
+            executor = self._get_executor()
+            futures = [executor.submit(_open_packet_chunk, jobs[i:i + INBOX_CHUNK_SIZE])
+                       for i in range(0, len(jobs), INBOX_CHUNK_SIZE)]
+            processed = (future.result() for future in futures)
+        else:
+            processed = (_open_packet_chunk([job]) for job in jobs)
 
-            # 3. Decrypt (GOST)
-            iv = hex_to_bytes(packet["iv"])
-            ciphertext = hex_to_bytes(packet["ciphertext"])
-            
-            self._log("DECRYPTION START", f"Received Ciphertext: {packet['ciphertext']}\nIV: {packet['iv']}\nDecrypting using Shared Secret...")
-
-            try:
-                decrypted_bytes = decrypt_cbc(ciphertext, shared_secret, iv)
-                decrypted_text_str = bytes_to_str(decrypted_bytes)
-                self._log("DECRYPTION SUCCESS", f"Decrypted Content: '{decrypted_text_str}'")
-            except Exception as e:
-                self._log("DECRYPTION ERROR", f"Failed to decrypt: {e}")
-                messages.append({"sender": sender_name, "error": "Decryption Failed"})
-                continue
+        # Replay the worker logs in order so the monitor shows the same trace as before
+        next_index = 0
+        try:
+            for chunk in processed:
+                for index, logs, message, timings in chunk:
+                    results[index] = (logs, message, timings)
+                while next_index < total and results[next_index] is not None:
+                    logs, message, timings = results[next_index]
+                    results[next_index] = None
+                    next_index += 1
+                    self._replay(logs, message, timings)
+                    yield next_index, total, message
+                if cancel_event is not None and cancel_event.is_set():
+                    self._log("INBOX CANCELLED", "Stopped after {} of {} messages.", next_index, total)
+                    return
+            # Trailing entries that needed no crypto (e.g. unknown senders)
+            while next_index < total:
+                logs, message, timings = results[next_index]
+                next_index += 1
+                self._replay(logs, message, timings)
+                yield next_index, total, message
+        finally:
+            for future in futures:
+                future.cancel()
+            # Delivered messages count as read, so compaction may archive them
+            self.transport.mark_read(active_user["username"], [message_id for message_id, _ in entries[:next_index]])
 
-            # 4. Verify Signature (DSA)
-            # Using Sender's DSA Public Key
-            signature = tuple(packet["signature"]) # Convert list back to tuple
-            self._log("SIGNATURE VERIFICATION", f"Verifying signature {signature} against decrypted content...")
-            
-            is_valid = verify_signature(sender_keys["dsa"], decrypted_bytes, signature)
+    def _job_session_root(self, active_user, packet, sender_keys):
+        """Session root for a ratchet packet (resolved here so workers need no session state), else None."""
+        if "mac" not in packet:
+            return None
+        try:
+            return self._session_root(active_user, packet, sender_keys)
+        except (KeyError, TypeError, ValueError):
+            # Malformed session header; _open_packet rejects the packet
+            return None
 
-            status = "Verified" if is_valid else "FAKE/TAMPERED"
-            
-            if is_valid:
-                self._log("VERIFICATION RESULT", "Signature VALID. The message is authentic and has not been changed.")
-            else:
-                self._log("SECURITY WARNING", f"Invalid signature detected from {sender_name}!")
+    def _replay(self, logs, message, timings):
+        """Re-emits a worker's log events and stage timings in this process."""
+        for level, title, details, args in logs:
+            self._log(title, details, *args, level=level)
+        for stage, seconds in timings:
+            self.metrics.observe(f"inbox.{stage}", seconds)
+        self.metrics.inc("inbox.errors" if "error" in message else "inbox.messages")
+        if message.get("status") == "FAKE/TAMPERED":
+            self.metrics.inc("inbox.invalid_signatures")
+
+def _open_packet_chunk(jobs):
+    """Runs _open_packet over a list of (index, packet, ecdh_priv, sender_keys, log_level, cache_path, session_root) jobs."""
+    return [(index,) + _open_packet(packet, ecdh_priv, sender_keys, log_level, cache_path, session_root)
+            for index, packet, ecdh_priv, sender_keys, log_level, cache_path, session_root in jobs]
+
+def signed_bytes(packet, msg_bytes):
+    """What a format-2 DSA signature covers: the SIGNED_FIELDS of the packet, then the text."""
+    header = json.dumps([packet.get(field) for field in SIGNED_FIELDS], separators=(",", ":"))
+    return str_to_bytes(header) + b"\x00" + msg_bytes
+
+_shared_secrets = OrderedDict()
+_shared_secrets_lock = threading.Lock()
+
+def _shared_secret_for(my_ecdh_priv, peer_x, peer_y):
+    # Re-reading mail from the same peer reuses the ECDH result (memory only, never persisted)
+    key = (my_ecdh_priv, peer_x, peer_y)
+    with _shared_secrets_lock:
+        secret = _shared_secrets.get(key)
+        if secret is not None:
+            _shared_secrets.move_to_end(key)
+            return secret
+    secret = compute_shared_secret(my_ecdh_priv, (peer_x, peer_y))
+    with _shared_secrets_lock:
+        _shared_secrets[key] = secret
+        if len(_shared_secrets) > SHARED_SECRET_CACHE_SIZE:
+            _shared_secrets.popitem(last=False)
+    return secret
+
+def forget_shared_secrets(my_ecdh_priv):
+    """Drops this process's cached ECDH results for one private key."""
+    with _shared_secrets_lock:
+        for key in [key for key in _shared_secrets if key[0] == my_ecdh_priv]:
+            del _shared_secrets[key]
+
+def _open_packet(packet, my_ecdh_priv, sender_keys, log_level=DEBUG, cache_path=None, session_root=None):
+    """
+    Decrypts and verifies a single packet.
+    Runs in worker processes, so instead of calling the monitor it returns
+    the log events, the result dict and the stage timings: (logs, message, timings).
+    Events below log_level are not recorded at all.
+    With cache_path set, signature results are looked up in / stored to the verification cache.
+    Session (ratchet) packets are checked against session_root instead, see core/sessions.py.
+    """
+    logs = []
+    timings = []
+
+    def log(level, title, details, *args):
+        if level >= log_level:
+            logs.append((level, title, details, args))
+
+    sender_name = packet["sender"]
+    
+    # --- START LOGGING FOR RECEIVER ---
+    log(INFO, "INBOX RECEIVE", "Processing new message from '{}'...", sender_name)
+
+    if "mac" in packet:
+        message = _open_session_packet(packet, session_root, log, timings)
+        return logs, message, timings
+
+    # 2. Compute Shared Secret (ECDH) to decrypt
+    # Using My Private + Sender's Public
+    try:
+        start = time.perf_counter()
+        peer_x, peer_y = sender_keys["ecdh"]
+        shared_secret = _shared_secret_for(my_ecdh_priv, peer_x, peer_y)
+        timings.append(("ecdh", time.perf_counter() - start))
+        log(DEBUG, "ECDH (RECEIVER)", "Computed Shared Secret: {}\n[CHECK] Compare this with Sender's log to verify match.", Hex(shared_secret, upper=True))
+    except:
+        return logs, {"sender": sender_name, "error": "ECDH Failed"}, timings
+
+    # 3. Decrypt (GOST)
+    iv = hex_to_bytes(packet["iv"])
+    ciphertext = hex_to_bytes(packet["ciphertext"])
+    
+    log(DEBUG, "DECRYPTION START", "Received Ciphertext: {}\nIV: {}\nDecrypting using Shared Secret...", Hex(ciphertext), Hex(iv))
+
+    try:
+        start = time.perf_counter()
+        decrypted_bytes = decrypt_cbc(ciphertext, shared_secret, iv)
+        timings.append(("decrypt", time.perf_counter() - start))
+        if packet.get("compression"):
+            start = time.perf_counter()
+            decrypted_bytes = decompress(decrypted_bytes, packet["compression"])
+            timings.append(("decompress", time.perf_counter() - start))
+        decrypted_text_str = bytes_to_str(decrypted_bytes)
+        log(DEBUG, "DECRYPTION SUCCESS", "Decrypted Content: '{}'", decrypted_text_str)
+    except Exception as e:
+        log(ERROR, "DECRYPTION ERROR", "Failed to decrypt: {}", e)
+        return logs, {"sender": sender_name, "error": "Decryption Failed"}, timings
+
+    # 4. Verify Signature (DSA)
+    # Using Sender's DSA Public Key
+    signature = tuple(packet["signature"]) # Convert list back to tuple
+    log(DEBUG, "SIGNATURE VERIFICATION", "Verifying signature {} against decrypted content...", signature)
+    
+    start = time.perf_counter()
+    if packet.get("sig_format") == SIGNATURE_FORMAT:
+        signed = signed_bytes(packet, decrypted_bytes)
+    elif (packet.get("timestamp") or 0) < LEGACY_SIGNATURES_UNTIL:
+        signed = decrypted_bytes
+    else:
+        # Text-only signature on a packet dated after format 2: its timestamp may have been replaced
+        signed = None
+        log(WARNING, "SECURITY WARNING", "Legacy signature with a new timestamp from {}!", sender_name)
+    if signed is None:
+        is_valid = False
+    elif cache_path:
+        is_valid = get_cache(cache_path).verify(verify_signature, sender_keys["dsa"], signed, signature)
+    else:
+        is_valid = verify_signature(sender_keys["dsa"], signed, signature)
+    timings.append(("verify", time.perf_counter() - start))
+
+    status = "Verified" if is_valid else "FAKE/TAMPERED"
+    
+    if is_valid:
+        log(INFO, "VERIFICATION RESULT", "Signature VALID. The message is authentic and has not been changed.")
+    else:
+        log(WARNING, "SECURITY WARNING", "Invalid signature detected from {}!", sender_name)
+
+    return logs, {
+        "sender": sender_name,
+        "timestamp": packet["timestamp"],
+        "content": decrypted_text_str,
+        "status": status
+    }, timings
+
+def _open_session_packet(packet, session_root, log, timings):
+    """Ratchet packet: derive the message keys, check the HMAC, then decrypt. No curve operations."""
+    sender_name = packet["sender"]
+    session = packet.get("session") or {}
+    n = session.get("n")
+    # n is bounded so a forged header cannot make us hash forever
+    if session_root is None or not isinstance(n, int) or not 1 <= n <= SESSION_MAX_MESSAGES:
+        log(WARNING, "SECURITY WARNING", "Unusable session header from {}!", sender_name)
+        return {"sender": sender_name, "error": "Invalid session"}
+
+    start = time.perf_counter()
+    chain_key = session_layer.chain_key_at(session_root, n)
+    enc_key, mac_key = session_layer.message_keys(chain_key)
+    is_valid = session_layer.verify_packet_mac(mac_key, packet)
+    timings.append(("verify", time.perf_counter() - start))
+    log(DEBUG, "SESSION KEY (RATCHET)", "Session {} message #{}: key derived from chain key {}.",
+        session.get("id"), n, Hex(chain_key, upper=True))
 
-            messages.append({
-                "sender": sender_name,
-                "timestamp": packet["timestamp"],
-                "content": bytes_to_str(decrypted_bytes),
-                "status": status
-            })
+    if not is_valid:
+        log(WARNING, "SECURITY WARNING", "Invalid session MAC from {}!", sender_name)
+        return {"sender": sender_name, "timestamp": packet["timestamp"], "content": "", "status": "FAKE/TAMPERED"}
 
-            # Delete file after reading (optional, to avoid re-reading logs repeatedly)
-            # os.remove(filepath) 
+    try:
+        start = time.perf_counter()
+        decrypted_bytes = decrypt_cbc(hex_to_bytes(packet["ciphertext"]), enc_key, hex_to_bytes(packet["iv"]))
+        timings.append(("decrypt", time.perf_counter() - start))
+        if packet.get("compression"):
+            start = time.perf_counter()
+            decrypted_bytes = decompress(decrypted_bytes, packet["compression"])
+            timings.append(("decompress", time.perf_counter() - start))
+        content = bytes_to_str(decrypted_bytes)
+    except Exception as e:
+        log(ERROR, "DECRYPTION ERROR", "Failed to decrypt: {}", e)
+        return {"sender": sender_name, "error": "Decryption Failed"}
 
-        return messages
\ No newline at end of file
+    log(INFO, "VERIFICATION RESULT", "Session MAC VALID. The message is authentic and has not been changed.")
+    return {
+        "sender": sender_name,
+        "timestamp": packet["timestamp"],
+        "content": content,
+        "status": "Verified"
+    }
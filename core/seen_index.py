@@ -0,0 +1,191 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+SEEN_INDEX_FILE = os.path.join("data", "seen_index.sqlite")
+# Ids not seen for this long are forgotten; unknown packets older than this are rejected as replays
+SEEN_WINDOW = 30 * 24 * 3600
+# Last-seen times are refreshed at most this often (re-reading the inbox should not write every time)
+REFRESH_AFTER = SEEN_WINDOW // 4
+BLOOM_BITS = 1 << 20
+BLOOM_HASHES = 7
+
+# Verdicts of SeenIndex.check
+NEW, SEEN, DUPLICATE, STALE, INVALID = "new", "seen", "duplicate", "stale", "invalid"
+
+def message_id_for(packet):
+    """
+    Message id = SHA-256 over sender, recipient, IV and ciphertext (first 128 bits).
+    Any change to those fields breaks decryption or authentication, so a replayed
+    packet cannot get a fresh id without also becoming unreadable.
+    """
+    h = hashlib.sha256()
+    for field in ("sender", "recipient", "iv", "ciphertext"):
+        h.update(str(packet.get(field, "")).encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()[:32]
+
+
+class BloomFilter:
+    def __init__(self, bits=BLOOM_BITS, hashes=BLOOM_HASHES):
+        self.bits = bits
+        self.hashes = hashes
+        self._array = bytearray(bits // 8)
+
+    def _positions(self, key: str):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, key):
+        for p in self._positions(key):
+            self._array[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, key):
+        return all(self._array[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+
+class SeenIndex:
+    """
+    Per-recipient set of message ids already accepted, with where each was stored.
+    An in-memory Bloom filter answers "definitely new" without touching the
+    SQLite table, which holds the exact entries and their last-seen time.
+    """
+    def __init__(self, path=None, window=SEEN_WINDOW):
+        self.path = path or SEEN_INDEX_FILE
+        self.window = window
+        self._lock = threading.Lock()
+        self._blooms = {}
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._db = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS seen (recipient TEXT NOT NULL, message_id TEXT NOT NULL, "
+                         "location TEXT NOT NULL, last_seen REAL NOT NULL, PRIMARY KEY (recipient, message_id))")
+        self._db.commit()
+
+    def _bloom(self, recipient):
+        bloom = self._blooms.get(recipient)
+        if bloom is None:
+            bloom = self._blooms[recipient] = BloomFilter()
+            for (message_id,) in self._db.execute("SELECT message_id FROM seen WHERE recipient = ?", (recipient,)):
+                bloom.add(message_id)
+        return bloom
+
+    def check(self, recipient, packet, location, now=None, stored=None):
+        """
+        Classifies a packet before any crypto:
+          NEW       first sighting (recorded),
+          SEEN      the same stored copy read again,
+          DUPLICATE the id is already stored elsewhere (re-dropped or replayed),
+          STALE     unknown, older than the window and not stored by the transport
+                    (a replay we can no longer tell apart),
+          INVALID   the packet's message_id does not match its contents.
+        :param stored: Locations the transport itself stored for the recipient (header
+                       index, live and archived), or None. Old packets there are not STALE.
+        """
+        return self.check_many(recipient, [(packet, location)], now, stored)[0]
+
+    def check_many(self, recipient, items, now=None, stored=None):
+        """check() for a list of (packet, location) pairs, with a single commit."""
+        now = time.time() if now is None else now
+        with self._lock:
+            bloom = self._bloom(recipient)
+            verdicts = [self._check(recipient, bloom, packet, location, now, stored) for packet, location in items]
+            self._db.commit()
+        return verdicts
+
+    def _lookup(self, recipient, message_id, location, now):
+        row = self._db.execute("SELECT location, last_seen FROM seen WHERE recipient = ? AND message_id = ?",
+                               (recipient, message_id)).fetchone()
+        if row is None:
+            return None
+        stored_location, last_seen = row
+        if stored_location != location:
+            return DUPLICATE
+        if now - last_seen > REFRESH_AFTER:
+            self._db.execute("UPDATE seen SET last_seen = ? WHERE recipient = ? AND message_id = ?",
+                             (now, recipient, message_id))
+        return SEEN
+
+    def _check(self, recipient, bloom, packet, location, now, stored=None):
+        message_id = message_id_for(packet)
+        if packet.get("message_id", message_id) != message_id:
+            return INVALID
+        # A Bloom miss means "never seen by this process", so only hits need the table
+        if message_id in bloom:
+            verdict = self._lookup(recipient, message_id, location, now)
+            if verdict is not None:
+                return verdict
+        if (packet.get("timestamp") or 0) < now - self.window and (stored is None or location not in stored):
+            # The Bloom filter only knows this process's ids; another process may have recorded it
+            verdict = self._lookup(recipient, message_id, location, now)
+            return STALE if verdict is None else verdict
+        inserted = self._db.execute("INSERT OR IGNORE INTO seen (recipient, message_id, location, last_seen) "
+                                    "VALUES (?, ?, ?, ?)", (recipient, message_id, location, now)).rowcount
+        bloom.add(message_id)
+        if not inserted:
+            # Recorded meanwhile by another process
+            return self._lookup(recipient, message_id, location, now)
+        return NEW
+
+    def relocate(self, recipient, packet, old_location, new_location):
+        """
+        Points the packet's entry at the new location of its stored copy (e.g. an id
+        renamed when mail moved to another shard), so reading it there is not a
+        DUPLICATE. Returns True if an entry was updated.
+        """
+        with self._lock:
+            updated = self._db.execute("UPDATE seen SET location = ? WHERE recipient = ? AND message_id = ? "
+                                       "AND location = ?",
+                                       (new_location, recipient, message_id_for(packet), old_location)).rowcount > 0
+            self._db.commit()
+            return updated
+
+    def expire(self, now=None, keep=None):
+        """
+        Forgets ids not seen within the window. Returns the number removed.
+        :param keep: Optional {recipient: locations still stored}; those entries are kept
+                     (and refreshed), so a stored message never loses its entry.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            cutoff = now - self.window
+            if keep is None:
+                removed = self._db.execute("DELETE FROM seen WHERE last_seen < ?", (cutoff,)).rowcount
+            else:
+                rows = self._db.execute("SELECT recipient, message_id, location FROM seen WHERE last_seen < ?",
+                                        (cutoff,)).fetchall()
+                kept = [(now, recipient, message_id) for recipient, message_id, location in rows
+                        if location in keep.get(recipient, ())]
+                gone = [(recipient, message_id) for recipient, message_id, location in rows
+                        if location not in keep.get(recipient, ())]
+                self._db.executemany("UPDATE seen SET last_seen = ? WHERE recipient = ? AND message_id = ?", kept)
+                self._db.executemany("DELETE FROM seen WHERE recipient = ? AND message_id = ?", gone)
+                removed = len(gone)
+            self._db.commit()
+            if removed:
+                # Bloom filters cannot delete; rebuild them from the table on next use
+                self._blooms.clear()
+            return removed
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# One index per file per process (SQLite connections must not cross fork())
+_open_indexes = {}
+
+def get_seen_index(path=None):
+    path = os.path.abspath(path or SEEN_INDEX_FILE)
+    key = (os.getpid(), path)
+    index = _open_indexes.get(key)
+    if index is None:
+        index = _open_indexes[key] = SeenIndex(path)
+    return index
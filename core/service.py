@@ -0,0 +1,299 @@
+import os
+import sys
+import zlib
+import json
+import socket
+import asyncio
+import secrets
+import argparse
+import multiprocessing
+from collections import deque
+
+# Adjust paths (in case running not as a module)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.relay import HEADER, MAX_FRAME_SIZE, read_frame, encode_frame
+from core.keydir import PublicKeyDirectory, KEYDIR_SIZE
+from crypto.elliptic_curve import precompute_base_table
+
+DEFAULT_SOCKET = os.path.join("data", "service.sock")
+
+# ======================================================
+# Multi-process service mode
+# ======================================================
+# Clients speak the relay's framing (4-byte length + JSON, see core/relay.py):
+#   {"id": 1, "op": "register", "user": ..., "password": ...}
+#   {"id": 2, "op": "login",    "user": ..., "password": ...}   -> {"token": ...}
+#   {"id": 3, "op": "send",     "user": ..., "token": ..., "to": ..., "message": ...}
+#   {"id": 4, "op": "inbox",    "user": ..., "token": ...[, "offset": 0, "limit": 20]}
+#   {"id": 5, "op": "logout",   "user": ..., "token": ...}
+# Replies echo the id and carry "ok" plus op-specific fields.
+# An asyncio front end routes every request by crc32(user) to one of N worker
+# processes, so a user's logged-in keys, session ratchets and ECDH caches stay
+# hot in a single worker. Workers share a public-key directory in shared
+# memory (core/keydir.py). The fixed-base curve table is built before the workers
+# are forked, so they share its pages.
+
+def route(username, workers):
+    """Worker index for a user (stable across restarts)."""
+    return zlib.crc32(str(username).encode("utf-8")) % workers
+
+
+class _Worker:
+    """Request handler living in a worker process."""
+    def __init__(self, directory, users_lock):
+        from core.user_manager import UserManager
+        from core.secure_messenger import SecureMessenger
+        self.user_manager = UserManager(users_lock=users_lock, directory=directory)
+        # Each worker is already one of N processes; no nested pool
+        self.messenger = SecureMessenger(self.user_manager, inbox_workers=0)
+        self.logged_in = {}  # token -> active user
+
+    def _active_user(self, request):
+        user = self.logged_in.get(request.get("token"))
+        if user is None or user["username"] != request.get("user"):
+            raise PermissionError("Not logged in")
+        return user
+
+    def handle(self, request):
+        op = request.get("op")
+        username = request.get("user")
+        if op == "register":
+            success, msg = self.user_manager.register(username, request.get("password", ""))
+            reply = {"ok": success, "message": msg}
+            if success:
+                # The front end publishes these to the shared directory
+                reply["public_keys"] = {username: self.user_manager.get_public_keys(username)}
+            return reply
+        if op == "login":
+            user, msg = self.user_manager.login(username, request.get("password", ""))
+            if not user:
+                return {"ok": False, "message": msg}
+            token = secrets.token_hex(16)
+            self.logged_in[token] = user
+            return {"ok": True, "message": msg, "token": token}
+        if op == "send":
+            success, msg = self.messenger.send_message(self._active_user(request), request.get("to"), request.get("message", ""))
+            return {"ok": success, "message": msg}
+        if op == "inbox":
+            user = self._active_user(request)
+            if "offset" in request or "limit" in request:
+                headers = self.messenger.list_inbox(user, request.get("offset", 0), request.get("limit", 20))
+                messages = [self.messenger.open_message(user, h["id"]) for h in headers]
+            else:
+                messages = self.messenger.check_inbox(user)
+            return {"ok": True, "messages": messages}
+        if op == "logout":
+            user = self.logged_in.pop(request.get("token"), None)
+            # Other logins of the same user keep the caches
+            if user and not any(u["username"] == user["username"] for u in self.logged_in.values()):
+                self.messenger.logout(user)
+            return {"ok": True}
+        return {"ok": False, "error": f"Unknown op '{op}'"}
+
+
+def _worker_main(conn, directory_name, users_lock):
+    directory = PublicKeyDirectory(directory_name)
+    worker = _Worker(directory, users_lock)
+    while True:
+        try:
+            item = conn.recv()
+        except EOFError:
+            break
+        if item is None:
+            break
+        rid, request = item
+        try:
+            reply = worker.handle(request)
+        except PermissionError as e:
+            reply = {"ok": False, "error": str(e)}
+        except Exception as e:
+            reply = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        conn.send((rid, reply))
+    worker.messenger.close()
+    directory.close()
+
+
+class ServiceServer:
+    def __init__(self, workers=None, keydir_size=KEYDIR_SIZE):
+        """
+        :param workers: Number of worker processes (defaults to the CPU count).
+        """
+        self.worker_count = workers or os.cpu_count() or 1
+        self.keydir_size = keydir_size
+        self.directory = None
+        self._processes = []
+        self._conns = []
+        self._queues = []
+        self._busy = []
+        self._pending = {}
+        self._next_rid = 0
+        self._keys = {}
+        self._server = None
+
+    async def start(self, path=None, host=None, port=None):
+        """Starts the workers, then listens on a Unix socket (path) or TCP (host/port)."""
+        from core.user_manager import UserManager
+
+        # 1. Read-mostly data, prepared before forking so every worker shares it
+        precompute_base_table()
+        user_manager = UserManager()
+        self._keys = {name: user_manager.get_public_keys(name) for name in user_manager.users}
+        self.directory = PublicKeyDirectory(create=True, size=self.keydir_size)
+        self.directory.publish(self._keys)
+
+        # 2. Worker pool (fork where available: table pages are shared copy-on-write)
+        methods = multiprocessing.get_all_start_methods()
+        ctx = multiprocessing.get_context("fork" if "fork" in methods else None)
+        users_lock = ctx.Lock()
+        loop = asyncio.get_running_loop()
+        for index in range(self.worker_count):
+            parent_conn, child_conn = ctx.Pipe()
+            process = ctx.Process(target=_worker_main, args=(child_conn, self.directory.name, users_lock), daemon=True)
+            process.start()
+            child_conn.close()
+            self._processes.append(process)
+            self._conns.append(parent_conn)
+            self._queues.append(deque())
+            self._busy.append(False)
+            loop.add_reader(parent_conn.fileno(), self._on_reply, index)
+
+        # 3. Client socket
+        if path:
+            if os.path.exists(path):
+                os.remove(path)
+            self._server = await asyncio.start_unix_server(self._handle, path=path)
+        else:
+            self._server = await asyncio.start_server(self._handle, host or "127.0.0.1", port or 0)
+        return self._server
+
+    @property
+    def port(self):
+        return self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+        loop = asyncio.get_running_loop()
+        for conn in self._conns:
+            loop.remove_reader(conn.fileno())
+            conn.send(None)
+        for process in self._processes:
+            process.join()
+        self.directory.close()
+        self.directory.unlink()
+
+    # --- dispatch ---
+    def _submit(self, request):
+        """Queues a request on the user's worker; returns a future for the reply."""
+        index = route(request.get("user"), self.worker_count)
+        self._next_rid += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[self._next_rid] = future
+        self._queues[index].append((self._next_rid, request))
+        self._pump(index)
+        return future
+
+    def _pump(self, index):
+        # One request in flight per worker: it is serial anyway, and a worker
+        # blocked on a large reply can then never wait for us to read a request
+        if not self._busy[index] and self._queues[index]:
+            self._busy[index] = True
+            self._conns[index].send(self._queues[index].popleft())
+
+    def _on_reply(self, index):
+        conn = self._conns[index]
+        while conn.poll():
+            rid, reply = conn.recv()
+            self._busy[index] = False
+            keys = reply.pop("public_keys", None)
+            if keys:
+                self._keys.update(keys)
+                self.directory.publish(self._keys)
+            future = self._pending.pop(rid)
+            if not future.cancelled():
+                future.set_result(reply)
+        self._pump(index)
+
+    async def _handle(self, reader, writer):
+        tasks = set()
+
+        async def answer(request):
+            reply = await self._submit(request)
+            reply["id"] = request.get("id")
+            writer.write(encode_frame(reply))
+            await writer.drain()
+
+        try:
+            while True:
+                request = await read_frame(reader)
+                if request is None:
+                    break
+                # Requests of one connection may be pipelined; replies carry their id
+                task = asyncio.ensure_future(answer(request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+class ServiceClient:
+    """Small blocking client (one request at a time) for scripts and tests."""
+    def __init__(self, path=None, host="127.0.0.1", port=None):
+        if path:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.connect(path)
+        else:
+            self._sock = socket.create_connection((host, port))
+        self._next_id = 0
+
+    def _recv_exact(self, n):
+        data = bytearray()
+        while len(data) < n:
+            chunk = self._sock.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError("Service closed the connection")
+            data += chunk
+        return bytes(data)
+
+    def request(self, op, **fields):
+        self._next_id += 1
+        self._sock.sendall(encode_frame({"id": self._next_id, "op": op, **fields}))
+        (length,) = HEADER.unpack(self._recv_exact(HEADER.size))
+        if length > MAX_FRAME_SIZE:
+            raise ValueError("Frame too large")
+        return json.loads(self._recv_exact(length))
+
+    def close(self):
+        self._sock.close()
+
+
+async def serve(workers=None, path=None, host=None, port=None):
+    server = ServiceServer(workers)
+    await server.start(path=path, host=host, port=port)
+    where = path or f"{host or '127.0.0.1'}:{server.port}"
+    print(f"Service listening on {where} with {server.worker_count} workers")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m core.service", description="Serve register/login/send/inbox over a local socket.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (defaults to CPU count).")
+    parser.add_argument("--path", default=None, help=f"Unix socket path (default {DEFAULT_SOCKET} unless --port is given).")
+    parser.add_argument("--port", type=int, default=None, help="Listen on TCP 127.0.0.1:PORT instead.")
+    args = parser.parse_args(argv)
+    path = args.path or (None if args.port else DEFAULT_SOCKET)
+    try:
+        asyncio.run(serve(args.workers, path=path, port=args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+import os
+import json
+import hmac
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from crypto.backends import encrypt_cbc, decrypt_cbc
+from utils import generate_iv, bytes_to_hex, hex_to_bytes, int_to_bytes, str_to_bytes
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+SESSIONS_DIR = os.path.join("data", "sessions")
+# A new (ECDH + DSA authenticated) session is started after this many messages or seconds
+SESSION_MAX_MESSAGES = 1000
+SESSION_MAX_AGE = 24 * 3600
+# Incoming session roots remembered per user; a pruned root is derived again
+# (one ECDH + ticket check) if an old session's mail is read later
+INCOMING_SESSIONS_MAX = 256
+# The session log is rewritten once it holds this many records beyond the live state
+LOG_COMPACT_SLACK = 1024
+
+# ======================================================
+# Symmetric session ratchet
+# ======================================================
+# The first message from A to B is sent as before (ECDH secret + DSA
+# signature) and opens a session. The session header {"id", "created",
+# "ticket"} is covered by that signature, and the ticket is A's DSA signature
+# over ticket_bytes(A, B, id, created). Every later packet of the session
+# repeats the header, so B only accepts ratchet packets for sessions A really
+# opened (the ticket is checked once per session). Both sides derive
+#     root = SHA-256("session-root" || ECDH secret || id || A || B)
+#     ck_1 = SHA-256("chain" || root),  ck_n+1 = SHA-256("chain" || ck_n)
+# and message n >= 1 uses
+#     GOST key = SHA-256("message" || ck_n),  MAC key = SHA-256("mac" || ck_n)
+# with an HMAC-SHA256 tag over the packet instead of a DSA signature. Only
+# the two ECDH key holders can derive the chain, so the tag authenticates
+# the sender; unlike the signature it does not prove authorship to a third party.
+
+def _sha256(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part)
+    return h.digest()
+
+def new_session_id():
+    return bytes_to_hex(os.urandom(16))
+
+def ticket_bytes(sender, recipient, session_id, created):
+    """What the session ticket (a DSA signature by the sender) covers."""
+    return str_to_bytes(json.dumps(["session-ticket", sender, recipient, session_id, created], separators=(",", ":")))
+
+def session_root(shared_secret, session_id, sender, recipient):
+    return _sha256(b"session-root", shared_secret, hex_to_bytes(session_id),
+                   str_to_bytes(sender), b"\x00", str_to_bytes(recipient))
+
+def chain_step(chain_key):
+    return _sha256(b"chain", chain_key)
+
+def chain_key_at(root, n):
+    """ck_n, n >= 1 (at most SESSION_MAX_MESSAGES hashes)."""
+    chain_key = root
+    for _ in range(n):
+        chain_key = chain_step(chain_key)
+    return chain_key
+
+def message_keys(chain_key):
+    """Returns (GOST key, MAC key) for the message that uses chain_key."""
+    return _sha256(b"message", chain_key), _sha256(b"mac", chain_key)
+
+def packet_mac(mac_key, packet):
+    """HMAC-SHA256 over every packet field except the tag itself."""
+    fields = {k: v for k, v in packet.items() if k != "mac"}
+    data = str_to_bytes(json.dumps(fields, sort_keys=True, separators=(",", ":")))
+    return hmac.new(mac_key, data, hashlib.sha256).hexdigest()
+
+def verify_packet_mac(mac_key, packet):
+    return hmac.compare_digest(packet_mac(mac_key, packet), packet.get("mac", ""))
+
+
+class SessionStore:
+    """
+    Session state of one user, kept as an append-only log in
+    SESSIONS_DIR/<user>.log: one record per line, each GOST-encrypted under a
+    key derived from the user's ECDH private key (the log holds chain roots),
+    the same way users.json protects the private keys with the password.
+
+    Every change runs under an flock on <user>.lock after reading the records
+    other processes appended, so processes sending as the same user never
+    reuse a (session, n) pair. A send appends one short "next" record instead
+    of rewriting the store; the log is compacted once it has LOG_COMPACT_SLACK
+    records more than the live state.
+    """
+    def __init__(self, user, directory=None):
+        """
+        :param user: Logged-in user dict (needs "username" and "ecdh_priv").
+        """
+        self.username = user["username"]
+        directory = directory or SESSIONS_DIR
+        self.path = os.path.join(directory, f"{self.username}.log")
+        self._lock_path = os.path.join(directory, f"{self.username}.lock")
+        self._key = _sha256(b"session-store", int_to_bytes(user["ecdh_priv"], 32))
+        self._lock = threading.RLock()
+        self.outgoing = {}              # recipient -> {"id", "peer_ecdh", "root", "n", "created", "ticket"}
+        self.incoming = OrderedDict()   # "sender/id" -> {"root", "created"}, least recently used first
+        self._chain = {}                # recipient -> (id, n, ck_n), so a send hashes once
+        self._records = 0
+        self._offset = 0
+        self._inode = None
+        with self._locked():
+            self._refresh()
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+            if fcntl is None:
+                yield
+                return
+            with open(self._lock_path, "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    # Log records
+    # ======================================================
+
+    def _encode(self, record):
+        iv = generate_iv(8)
+        ciphertext = encrypt_cbc(str_to_bytes(json.dumps(record)), self._key, iv)
+        return f"{bytes_to_hex(iv)}:{bytes_to_hex(ciphertext)}\n".encode("ascii")
+
+    def _decode(self, line):
+        try:
+            iv, ciphertext = line.decode("ascii").strip().split(":")
+            return json.loads(decrypt_cbc(hex_to_bytes(ciphertext), self._key, hex_to_bytes(iv)))
+        except (ValueError, UnicodeDecodeError):
+            # An unreadable record only costs a fresh handshake
+            return None
+
+    def _apply(self, record):
+        op = record.get("op")
+        if op == "out":
+            self.outgoing[record["to"]] = {key: record[key] for key in ("id", "peer_ecdh", "root", "n", "created", "ticket")}
+        elif op == "next":
+            state = self.outgoing.get(record["to"])
+            if state is not None and state["id"] == record["id"]:
+                state["n"] = max(state["n"], record["n"] + 1)
+        elif op == "in":
+            self.incoming[record["key"]] = {"root": record["root"], "created": record["created"]}
+            self.incoming.move_to_end(record["key"])
+            while len(self.incoming) > INCOMING_SESSIONS_MAX:
+                self.incoming.popitem(last=False)
+
+    def _refresh(self):
+        """Applies the records appended since the last read (caller holds _locked)."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            st = None
+        if st is None or st.st_ino != self._inode or st.st_size < self._offset:
+            # First read, or another process compacted the log: start over
+            self.outgoing, self.incoming, self._chain = {}, OrderedDict(), {}
+            self._records = self._offset = 0
+            self._inode = st.st_ino if st is not None else None
+        if st is None or st.st_size == self._offset:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            for line in f:
+                self._offset += len(line)
+                self._records += 1
+                record = self._decode(line)
+                if record is not None:
+                    try:
+                        self._apply(record)
+                    except (KeyError, TypeError):
+                        continue
+
+    def _append(self, record):
+        """Appends one record (caller holds _locked and has refreshed)."""
+        line = self._encode(record)
+        with open(self.path, "ab") as f:
+            f.write(line)
+            self._inode = os.fstat(f.fileno()).st_ino
+        self._offset += len(line)
+        self._records += 1
+        self._apply(record)
+        if self._records > len(self.outgoing) + len(self.incoming) + LOG_COMPACT_SLACK:
+            self._compact()
+
+    def _compact(self, now=None):
+        """Rewrites the log with only the live sessions (caller holds _locked)."""
+        now = time.time() if now is None else now
+        self.outgoing = {recipient: state for recipient, state in self.outgoing.items()
+                         if not self._expired(state, now)}
+        for key in [key for key, entry in self.incoming.items() if now - entry["created"] > SESSION_MAX_AGE]:
+            del self.incoming[key]
+        records = [dict(state, op="out", to=recipient) for recipient, state in self.outgoing.items()]
+        records += [{"op": "in", "key": key, **entry} for key, entry in self.incoming.items()]
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            for record in records:
+                f.write(self._encode(record))
+        os.replace(tmp, self.path)
+        self._inode = os.stat(self.path).st_ino
+        self._offset = os.path.getsize(self.path)
+        self._records = len(records)
+
+    @staticmethod
+    def _expired(state, now):
+        return state["n"] > SESSION_MAX_MESSAGES or now - state["created"] > SESSION_MAX_AGE
+
+    # Sessions
+    # ======================================================
+
+    def next_outgoing(self, recipient, peer_ecdh, now=None):
+        """
+        Reserves the next message of the session with recipient. Returns
+        (header, chain_key), header being the packet's "session" field, or None
+        when a new session has to be started (no session yet, too old or too
+        long, or the recipient's key changed).
+        """
+        now = time.time() if now is None else now
+        with self._locked():
+            self._refresh()
+            state = self.outgoing.get(recipient)
+            if state is None or state["peer_ecdh"] != list(peer_ecdh) or self._expired(state, now):
+                return None
+            n = state["n"]
+            self._append({"op": "next", "to": recipient, "id": state["id"], "n": n})
+
+            # Step on from the last chain key this process derived, if it is behind n
+            session_id, known_n, chain_key = self._chain.get(recipient, (None, 0, None))
+            if session_id != state["id"] or known_n > n:
+                known_n, chain_key = 0, hex_to_bytes(state["root"])
+            for _ in range(n - known_n):
+                chain_key = chain_step(chain_key)
+            self._chain[recipient] = (state["id"], n, chain_key)
+            header = {"id": state["id"], "n": n, "created": state["created"], "ticket": state["ticket"]}
+            return header, chain_key
+
+    def start_outgoing(self, recipient, peer_ecdh, shared_secret, session):
+        """
+        Records a session once its opening message (carrying the signed header
+        session = {"id", "created", "ticket"}) has been delivered.
+        """
+        root = session_root(shared_secret, session["id"], self.username, recipient)
+        with self._locked():
+            self._refresh()
+            self._append({
+                "op": "out",
+                "to": recipient,
+                "id": session["id"],
+                "peer_ecdh": list(peer_ecdh),
+                "root": bytes_to_hex(root),
+                "n": 1,
+                "created": session["created"],
+                "ticket": list(session["ticket"]),
+            })
+        return session["id"]
+
+    def incoming_root(self, sender, session_id, derive_root):
+        """
+        Root of a session started by sender. derive_root() (ticket check + ECDH)
+        only runs the first time a session is seen; it raises ValueError for a
+        session the sender did not open.
+        """
+        key = f"{sender}/{session_id}"
+        with self._lock:
+            entry = self.incoming.get(key)
+            if entry is not None:
+                self.incoming.move_to_end(key)
+                return hex_to_bytes(entry["root"])
+        root = derive_root()
+        with self._locked():
+            self._refresh()
+            if key not in self.incoming:
+                self._append({"op": "in", "key": key, "root": bytes_to_hex(root), "created": time.time()})
+        return root
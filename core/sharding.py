@@ -0,0 +1,223 @@
+import os
+import json
+import bisect
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from core.transport import FileTransport, MESSAGES_DIR
+from core.seen_index import get_seen_index
+
+# Storage roots for messages, separated by os.pathsep (e.g. /disk1/messages:/disk2/messages)
+ROOTS_ENV = "MESSAGE_ROOTS"
+# Points per root on the hash ring; more points spread recipients more evenly
+VNODES = 64
+
+# ======================================================
+# Consistent hashing of recipients over storage roots
+# ======================================================
+# Every root owns VNODES points on a 64-bit ring and a recipient belongs to the
+# first point at or after SHA-256(username). All of a recipient's mail (live
+# files, index, read log, archive) lives on that one root, so every
+# per-user operation touches a single shard. Adding a root only takes over
+# the arcs in front of its own points (about 1/N of the recipients); the
+# rebalancer moves exactly those users.
+
+def _ring_hash(key):
+    return int.from_bytes(hashlib.sha256(key.encode("utf-8")).digest()[:8], "big")
+
+class HashRing:
+    def __init__(self, nodes, vnodes=VNODES):
+        self.nodes = list(nodes)
+        if not self.nodes:
+            raise ValueError("A hash ring needs at least one node")
+        points = sorted((_ring_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes))
+        self._hashes = [h for h, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node_for(self, key):
+        i = bisect.bisect(self._hashes, _ring_hash(key)) % len(self._hashes)
+        return self._owners[i]
+
+
+def configured_roots():
+    """Roots from $MESSAGE_ROOTS, or the single default MESSAGES_DIR."""
+    roots = [root for root in os.environ.get(ROOTS_ENV, "").split(os.pathsep) if root]
+    return roots or [MESSAGES_DIR]
+
+def default_transport():
+    """The transport SecureMessenger uses when none is given."""
+    roots = configured_roots()
+    return FileTransport(roots[0]) if len(roots) == 1 else ShardedTransport(roots)
+
+
+class ShardedTransport:
+    """
+    Spreads recipients over several transports (usually one FileTransport per
+    disk) with a HashRing. Implements the FileTransport interface by routing
+    each call to the recipient's shard; batch calls (deliver_many,
+    fetch_entries_many, recipients) run on the shards in parallel threads.
+    """
+    def __init__(self, shards, vnodes=VNODES):
+        """
+        :param shards: Storage root paths (each becomes a FileTransport), or a
+                       {name: transport} dict, e.g. RelayTransports to local stand-in relays.
+                       Names (paths) place the shards on the ring, so keep them stable.
+        """
+        if not isinstance(shards, dict):
+            shards = {os.path.normpath(root): FileTransport(root) for root in shards}
+        self.shards = shards
+        self.ring = HashRing(shards, vnodes)
+        self._pool = ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix="shard")
+
+    def shard_for(self, username):
+        return self.shards[self.ring.node_for(username)]
+
+    def _per_shard(self, items, key, fn):
+        """Groups items by shard and runs fn(transport, group) for every group, in parallel."""
+        groups = {}
+        for item in items:
+            groups.setdefault(self.ring.node_for(key(item)), []).append(item)
+        if len(groups) <= 1:
+            return [fn(self.shards[name], group) for name, group in groups.items()]
+        futures = [self._pool.submit(fn, self.shards[name], group) for name, group in groups.items()]
+        return [future.result() for future in futures]
+
+    # --- writes ---
+    def deliver(self, packet):
+        return self.shard_for(packet["recipient"]).deliver(packet)
+
+    def deliver_many(self, packets):
+        """Delivers a batch; packets of different shards are written concurrently."""
+        def deliver_group(transport, group):
+            if hasattr(transport, "deliver_many"):
+                return transport.deliver_many(group)
+            for packet in group:
+                transport.deliver(packet)
+        self._per_shard(packets, lambda packet: packet["recipient"], deliver_group)
+
+    def mark_read(self, username, message_ids):
+        return self.shard_for(username).mark_read(username, message_ids)
+
+    def discard(self, username, message_ids):
+        return self.shard_for(username).discard(username, message_ids)
+
+    def archive(self, username, message_ids, algorithm="lzma"):
+        return self.shard_for(username).archive(username, message_ids, algorithm)
+
+    def expire(self, username, message_ids):
+        return self.shard_for(username).expire(username, message_ids)
+
+    # --- reads ---
+    def fetch(self, username):
+        return self.shard_for(username).fetch(username)
+
+    def fetch_entries(self, username):
+        return self.shard_for(username).fetch_entries(username)
+
+    def fetch_entries_many(self, usernames):
+        """{username: [(message_id, packet), ...]} for many users, reading the shards concurrently."""
+        result = {}
+        def fetch_group(transport, group):
+            return {username: transport.fetch_entries(username) for username in group}
+        for part in self._per_shard(usernames, lambda username: username, fetch_group):
+            result.update(part)
+        return result
+
+    def list_headers(self, username, offset=0, limit=20):
+        return self.shard_for(username).list_headers(username, offset, limit)
+
+    def changes(self, username, cursor=None):
+        return self.shard_for(username).changes(username, cursor)
+
+    def headers(self, username):
+        return self.shard_for(username).headers(username)
+
+    def get_packet(self, username, message_id):
+        return self.shard_for(username).get_packet(username, message_id)
+
+    def read_ids(self, username):
+        return self.shard_for(username).read_ids(username)
+
+    def recipients(self):
+        futures = [self._pool.submit(transport.recipients) for transport in self.shards.values()]
+        return sorted({name for future in futures for name in future.result()})
+
+    # --- listeners ---
+    def add_listener(self, fn):
+        for transport in self.shards.values():
+            transport.add_listener(fn)
+
+    def remove_listener(self, fn):
+        for transport in self.shards.values():
+            transport.remove_listener(fn)
+
+    # --- rebalancing ---
+    def rebalance(self, retired=(), dry_run=False, seen_index=None):
+        """
+        Moves every recipient stored on a root the ring does not assign it to
+        (after roots were added, or away from retired roots). Sources are
+        drained in parallel. Returns {"users": [[user, from, to], ...], "messages": n}.
+        :param retired: Roots that are no longer part of the ring but still hold mail.
+        :param seen_index: Path of the seen-message index to update for messages
+                           renamed on the way, or None.
+        """
+        for transport in self.shards.values():
+            if not isinstance(transport, FileTransport):
+                raise ValueError("Only file shards can be rebalanced")
+        index = get_seen_index(seen_index) if seen_index and not dry_run else None
+        sources = dict(self.shards)
+        for root in retired:
+            sources.setdefault(os.path.normpath(root), FileTransport(root))
+
+        def drain(name):
+            source = sources[name]
+            moves, count = [], 0
+            for username in sorted(stored_users(source)):
+                owner = self.ring.node_for(username)
+                if owner == name:
+                    continue
+                moves.append([username, name, owner])
+                if not dry_run:
+                    count += source.move_user(username, self.shards[owner],
+                                              on_rename=self._relocator(index, username, owner) if index else None)
+            return moves, count
+
+        futures = [self._pool.submit(drain, name) for name in sources]
+        users, messages = [], 0
+        for future in futures:
+            moves, count = future.result()
+            users += moves
+            messages += count
+        return {"users": users, "messages": messages}
+
+    def _relocator(self, index, username, owner):
+        """on_rename callback for move_user: a renamed message keeps its seen-index entry, or it would read as a DUPLICATE."""
+        def relocate(old_id, new_id):
+            packet = self.shards[owner].get_packet(username, new_id)
+            if packet is not None:
+                index.relocate(username, packet, old_id, new_id)
+        return relocate
+
+    def close(self):
+        for transport in self.shards.values():
+            transport.close()
+        self._pool.shutdown()
+
+
+def stored_users(transport):
+    """Recipients with mail on a FileTransport, including mail stored before the header index existed."""
+    users = set(transport.recipients())
+    for filename in os.listdir(transport.messages_dir):
+        if not filename.endswith(".msg"):
+            continue
+        # Ids are <recipient>_<time>[_<n>].msg
+        stem = filename[:-len(".msg")]
+        if stem.rsplit("_", 1)[0] in users or stem.rsplit("_", 2)[0] in users:
+            continue
+        try:
+            with open(os.path.join(transport.messages_dir, filename), "r") as f:
+                recipient = json.load(f).get("recipient")
+        except (OSError, ValueError):
+            continue
+        if recipient:
+            users.add(recipient)
+    return users
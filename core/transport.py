@@ -0,0 +1,618 @@
+import os
+import json
+import time
+import shutil
+import asyncio
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from core.relay import RelayClient
+from core.compression import compress, decompress
+
+# Optional: OS file locks, so other processes' appends survive index rewrites
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+MESSAGES_DIR = os.path.join("data", "messages")
+# Per-recipient header index (one JSON line per delivered packet, oldest first)
+INDEX_DIRNAME = "index"
+# Compressed segments of read mail, see FileTransport.archive
+ARCHIVE_DIRNAME = "archive"
+SEGMENTS_FILE = "segments.jsonl"
+
+def packet_header(message_id, packet):
+    """Cheap metadata shown before a message is opened (no crypto involved)."""
+    return {
+        "id": message_id,
+        "sender": packet.get("sender"),
+        "timestamp": packet.get("timestamp"),
+        "size": len(packet.get("ciphertext", "")) // 2,
+    }
+
+def _pack_segment(packets, algorithm):
+    """Returns (raw JSON, payload, algorithm used) of an archive segment."""
+    raw = json.dumps(packets).encode("utf-8")
+    payload, used = compress(raw, algorithm, min_bytes=0)
+    return raw, payload, used
+
+def read_last_lines(path, skip, count, block_size=8192):
+    """
+    Returns up to count lines of a text file, newest (last) first, after
+    skipping the skip newest ones. Reads backwards from the end, so the cost
+    depends on skip + count, not on the file size.
+    """
+    wanted = skip + count
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        buffer = b""
+        lines = []
+        while position > 0 and len(lines) <= wanted:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            buffer = f.read(step) + buffer
+            parts = buffer.split(b"\n")
+            # parts[0] may be a partial line unless we reached the start of the file
+            buffer = parts[0]
+            lines = [line for line in parts[1:] if line] + lines
+        if position == 0 and buffer:
+            lines = [buffer] + lines
+    lines.reverse()
+    return [line.decode("utf-8") for line in lines[skip:wanted]]
+
+def _read_json_lines(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.endswith("\n")]
+
+@lru_cache(maxsize=8)
+def _load_segment(path, mtime, algorithm, raw_size):
+    """Decompressed {message_id: packet} of one archive segment (mtime invalidates the cache)."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if algorithm:
+        data = decompress(data, algorithm, limit=raw_size)
+    return json.loads(data)
+
+class FileTransport:
+    """
+    Original "network simulation": every packet is a .msg file in MESSAGES_DIR
+    and receivers scan the directory.
+    Read mail can be moved into compressed archive segments
+    (ARCHIVE_DIRNAME/<user>/), so the live directory only holds new mail;
+    see core/retention.py for the policies and the background compaction.
+    """
+    def __init__(self, messages_dir=None):
+        self.messages_dir = messages_dir or MESSAGES_DIR
+        self.index_dir = os.path.join(self.messages_dir, INDEX_DIRNAME)
+        self.archive_dir = os.path.join(self.messages_dir, ARCHIVE_DIRNAME)
+        if not os.path.exists(self.index_dir):
+            os.makedirs(self.index_dir)
+        # Guards the index/read logs, which the compaction thread rewrites
+        self._lock = threading.RLock()
+        self._read_cache = {}
+        self._segment_maps = {}
+        self._locked_users = set()
+        self._listeners = []
+
+    def add_listener(self, fn):
+        """fn(recipient) is called after every deliver() through this object (see core/watcher.py)."""
+        self._listeners.append(fn)
+
+    def remove_listener(self, fn):
+        if fn in self._listeners:
+            self._listeners.remove(fn)
+
+    def _index_path(self, username):
+        return os.path.join(self.index_dir, f"{username}.idx")
+
+    def _read_log_path(self, username):
+        return os.path.join(self.index_dir, f"{username}.read")
+
+    def _segments_path(self, username):
+        return os.path.join(self.archive_dir, username, SEGMENTS_FILE)
+
+    @contextmanager
+    def _user_lock(self, username):
+        """
+        Serialises changes to a user's index, read log and segment list: the
+        thread lock, plus an flock on index/<user>.lock shared with other
+        processes (CLI send, service workers, loadgen) that append while
+        retention rewrites. Re-entrant within a thread.
+        """
+        with self._lock:
+            if fcntl is None or username in self._locked_users:
+                yield
+                return
+            with open(os.path.join(self.index_dir, f"{username}.lock"), "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                self._locked_users.add(username)
+                try:
+                    yield
+                finally:
+                    self._locked_users.discard(username)
+                    # Closing the file releases the flock
+
+    def _append_index(self, username, header):
+        with self._user_lock(username), open(self._index_path(username), "a") as f:
+            f.write(json.dumps(header) + "\n")
+
+    def _ensure_index(self, username):
+        """Builds the header index once from the .msg files (for mail stored before the index existed)."""
+        path = self._index_path(username)
+        with self._user_lock(username):
+            if os.path.exists(path):
+                return path
+            headers = [packet_header(message_id, packet) for message_id, packet in self._scan(username)]
+            headers.sort(key=lambda h: h["timestamp"] or 0)
+            self._rewrite_lines(path, [json.dumps(header) for header in headers])
+        return path
+
+    def _rewrite_lines(self, path, lines):
+        with open(path + ".tmp", "w") as f:
+            for line in lines:
+                f.write(line + "\n")
+        os.replace(path + ".tmp", path)
+
+    def _unused_id(self, recipient, base, taken=()):
+        filename = f"{base}.msg"
+        counter = 1
+        # Several messages inside the same second must not overwrite each other,
+        # nor reuse the id of one that was already read or archived
+        while (os.path.exists(os.path.join(self.messages_dir, filename)) or filename in taken
+               or filename in self.read_ids(recipient) or filename in self._segment_map(recipient)):
+            filename = f"{base}_{counter}.msg"
+            counter += 1
+        return filename
+
+    def deliver(self, packet):
+        """Saves the packet to a file. Returns a short description for the monitor."""
+        recipient = packet["recipient"]
+        base = f"{recipient}_{int(time.time())}"
+        # Index first: a one-time rebuild must not pick up the new file as well
+        self._ensure_index(recipient)
+        taken = set()
+        while True:
+            filename = self._unused_id(recipient, base, taken)
+            try:
+                # Exclusive create: a sender in another process may have picked the same id meanwhile
+                with open(os.path.join(self.messages_dir, filename), "x") as f:
+                    json.dump(packet, f)
+                break
+            except FileExistsError:
+                taken.add(filename)
+        self._append_index(packet["recipient"], packet_header(filename, packet))
+        for fn in list(self._listeners):
+            fn(packet["recipient"])
+        return f"Message packet saved to '{filename}'."
+
+    def fetch(self, username):
+        """Returns every live (not archived) packet addressed to the user."""
+        return [packet for _, packet in self._scan(username)]
+
+    def fetch_entries(self, username):
+        """Same as fetch, as (message_id, packet) pairs."""
+        return list(self._scan(username))
+
+    def list_headers(self, username, offset=0, limit=20):
+        """Headers of the user's mail, newest first, without reading the message files."""
+        path = self._ensure_index(username)
+        return [json.loads(line) for line in read_last_lines(path, offset, limit)]
+
+    def changes(self, username, cursor=None):
+        """
+        Returns (new (message_id, packet) pairs, cursor) since cursor, read from
+        the header index. Without a cursor nothing is returned and the cursor
+        points at the current end. Costs one stat() when nothing changed.
+        """
+        path = self._ensure_index(username)
+        st = os.stat(path)
+        if cursor is None:
+            last = read_last_lines(path, 0, 1)
+            return [], (st.st_ino, st.st_size, json.loads(last[0])["id"] if last else None)
+        inode, offset, last_id = cursor
+        if st.st_ino == inode and st.st_size == offset:
+            return [], cursor
+
+        if st.st_ino == inode and st.st_size > offset:
+            # Appended lines only; a torn last line is picked up next time
+            with open(path, "rb") as f:
+                f.seek(offset)
+                data = f.read(st.st_size - offset)
+            complete = data[:data.rfind(b"\n") + 1]
+            headers = [json.loads(line) for line in complete.splitlines() if line]
+            offset += len(complete)
+        else:
+            # The index was rewritten (retention removes lines, order is kept):
+            # everything after the last id already reported is new
+            with self._lock:
+                st = os.stat(path)
+                headers = _read_json_lines(path)
+            inode, offset = st.st_ino, st.st_size
+            ids = [h["id"] for h in headers]
+            headers = headers[ids.index(last_id) + 1:] if last_id in ids else headers
+
+        entries = []
+        for header in headers:
+            packet = self.get_packet(username, header["id"])
+            if packet is not None:
+                entries.append((header["id"], packet))
+        if headers:
+            last_id = headers[-1]["id"]
+        return entries, (inode, offset, last_id)
+
+    def headers(self, username):
+        """Every header of the user's mail (live and archived), oldest first."""
+        with self._lock:
+            return _read_json_lines(self._ensure_index(username))
+
+    def recipients(self):
+        """Users that have a header index (i.e. received mail since the index was introduced)."""
+        return [name[:-len(".idx")] for name in os.listdir(self.index_dir) if name.endswith(".idx")]
+
+    def get_packet(self, username, message_id):
+        """Loads a single packet by id, from the live directory or the archive; None if it is gone."""
+        if os.path.basename(message_id) != message_id:
+            return None
+        try:
+            with open(os.path.join(self.messages_dir, message_id), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+        meta = self._segment_map(username).get(message_id)
+        if meta is None:
+            return None
+        path = os.path.join(self.archive_dir, username, meta["segment"])
+        try:
+            segment = _load_segment(path, os.path.getmtime(path), meta["algorithm"], meta["raw_size"])
+        except (OSError, ValueError):
+            return None
+        return segment.get(message_id)
+
+    def _segment_map(self, username):
+        """message_id -> segment entry, reloaded when segments.jsonl changes."""
+        path = self._segments_path(username)
+        try:
+            stamp = os.stat(path).st_mtime_ns
+        except OSError:
+            return {}
+        cached = self._segment_maps.get(username)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        mapping = {}
+        for meta in _read_json_lines(path):
+            for message_id in meta["ids"]:
+                mapping[message_id] = meta
+        self._segment_maps[username] = (stamp, mapping)
+        return mapping
+
+    # --------------------------------------------------
+    # Read state, archiving and expiry (used by core/retention.py)
+    # --------------------------------------------------
+    def read_ids(self, username):
+        with self._lock:
+            if username not in self._read_cache:
+                path = self._read_log_path(username)
+                ids = set()
+                if os.path.exists(path):
+                    with open(path, "r") as f:
+                        ids = {line[:-1] for line in f if line.endswith("\n")}
+                self._read_cache[username] = ids
+            return self._read_cache[username]
+
+    def mark_read(self, username, message_ids):
+        """Appends newly read ids to the user's read log (an append-only text file)."""
+        with self._user_lock(username):
+            seen = self.read_ids(username)
+            new = [message_id for message_id in message_ids if message_id not in seen]
+            if not new:
+                return
+            with open(self._read_log_path(username), "a") as f:
+                f.write("".join(message_id + "\n" for message_id in new))
+            seen.update(new)
+
+    def discard(self, username, message_ids):
+        """Drops packets rejected by the seen index (duplicates, forged ids)."""
+        return self.expire(username, message_ids)
+
+    def archive(self, username, message_ids, algorithm="lzma"):
+        """
+        Moves live messages into one new compressed segment and removes their .msg files.
+        The segment is written before anything is deleted, so a crash leaves at
+        most a duplicate (live copies win on lookup). Returns the number archived.
+        """
+        packets = {}
+        for message_id in message_ids:
+            try:
+                with open(os.path.join(self.messages_dir, message_id), "r") as f:
+                    packets[message_id] = json.load(f)
+            except (OSError, ValueError):
+                continue
+        if not packets:
+            return 0
+        # Compressed before taking the lock, so senders are not held up by it
+        raw, payload, used = _pack_segment(packets, algorithm)
+
+        directory = os.path.join(self.archive_dir, username)
+        with self._user_lock(username):
+            # A concurrent compaction (another GC thread or process) may have archived some meanwhile
+            archived = self._segment_map(username)
+            live = {message_id: packet for message_id, packet in packets.items() if message_id not in archived
+                    and os.path.exists(os.path.join(self.messages_dir, message_id))}
+            if not live:
+                return 0
+            if len(live) != len(packets):
+                packets = live
+                raw, payload, used = _pack_segment(packets, algorithm)
+
+            # The segment name is picked and written under the lock, so two runs never share one
+            os.makedirs(directory, exist_ok=True)
+            numbers = [int(name.split(".")[0]) for name in os.listdir(directory) if name.endswith(".seg")]
+            segment = f"{max(numbers, default=0) + 1:08d}.seg"
+            with open(os.path.join(directory, segment + ".tmp"), "wb") as f:
+                f.write(payload)
+            os.replace(os.path.join(directory, segment + ".tmp"), os.path.join(directory, segment))
+
+            meta = {"segment": segment, "algorithm": used, "raw_size": len(raw), "ids": list(packets),
+                    "last_timestamp": max((p.get("timestamp") or 0) for p in packets.values())}
+            with open(self._segments_path(username), "a") as f:
+                f.write(json.dumps(meta) + "\n")
+            for message_id in packets:
+                os.remove(os.path.join(self.messages_dir, message_id))
+        return len(packets)
+
+    def expire(self, username, message_ids):
+        """
+        Deletes messages for good: live files, archive segments whose every
+        message expired, and their index/read-log lines. Returns the number removed.
+        """
+        expired = set(message_ids)
+        if not expired:
+            return 0
+        with self._user_lock(username):
+            # Under the lock, so a concurrent archive() never loses a file it is moving
+            for message_id in expired:
+                path = os.path.join(self.messages_dir, message_id)
+                if os.path.basename(message_id) == message_id and os.path.exists(path):
+                    os.remove(path)
+            # Another process may have appended read marks since they were cached
+            self._read_cache.pop(username, None)
+            headers = self.headers(username)
+            remaining = {h["id"] for h in headers} - expired
+            segments_path = self._segments_path(username)
+            if os.path.exists(segments_path):
+                kept = []
+                for meta in _read_json_lines(segments_path):
+                    if remaining.isdisjoint(meta["ids"]):
+                        os.remove(os.path.join(self.archive_dir, username, meta["segment"]))
+                    else:
+                        # Partly expired segments stay until their last message expires
+                        kept.append(json.dumps(meta))
+                self._rewrite_lines(segments_path, kept)
+
+            self._rewrite_lines(self._index_path(username),
+                                [json.dumps(h) for h in headers if h["id"] not in expired])
+            read = self.read_ids(username) - expired
+            self._rewrite_lines(self._read_log_path(username), sorted(read))
+            self._read_cache[username] = read
+        return len(expired)
+
+    def move_user(self, username, target, on_rename=None):
+        """
+        Moves all of the user's mail (live files, archive segments, header index
+        and read log) to another FileTransport, e.g. a different storage root
+        (see core/sharding.py). Mail the target already holds for the user is
+        kept; clashing ids of moved messages are renamed. Everything is copied
+        before the source is removed, so an interrupted move can simply be
+        repeated. Returns the number of messages moved.
+        :param on_rename: Called as on_rename(old_id, new_id) for every renamed
+                          message once the target holds it under the new id.
+        """
+        # Fixed lock order (by root), so two moves in opposite directions cannot deadlock
+        first, second = sorted((self, target), key=lambda transport: os.path.abspath(transport.messages_dir))
+        with first._user_lock(username), second._user_lock(username):
+            self._read_cache.pop(username, None)
+            target._read_cache.pop(username, None)
+            headers = self.headers(username)
+            if not headers and not os.path.exists(self._segments_path(username)):
+                return 0
+            existing = target.headers(username)
+            taken = {h["id"] for h in existing}
+            segments = _read_json_lines(self._segments_path(username))
+            stored = {message_id for meta in segments
+                      if os.path.exists(os.path.join(self.archive_dir, username, meta["segment"]))
+                      for message_id in meta["ids"]}
+            # Headers the target already has and whose message is gone here were moved by an interrupted run
+            headers = [h for h in headers if h["id"] not in taken or h["id"] in stored
+                       or os.path.exists(os.path.join(self.messages_dir, h["id"]))]
+            # New names also avoid the ids still to be moved, so one clash never forces another rename
+            avoid = taken | {h["id"] for h in headers}
+            renamed = {}
+            for header in headers:
+                if header["id"] in taken:
+                    renamed[header["id"]] = target._unused_id(username, header["id"][:-len(".msg")], avoid)
+                    avoid.add(renamed[header["id"]])
+                taken.add(renamed.get(header["id"], header["id"]))
+
+            # 1. Live files
+            for header in headers:
+                source = os.path.join(self.messages_dir, header["id"])
+                if os.path.exists(source):
+                    shutil.move(source, os.path.join(target.messages_dir, renamed.get(header["id"], header["id"])))
+
+            # 2. Archive segments (re-numbered; rewritten only when an id had to change)
+            target_dir = os.path.join(target.archive_dir, username)
+            for meta in segments:
+                source = os.path.join(self.archive_dir, username, meta["segment"])
+                if not os.path.exists(source):
+                    continue
+                os.makedirs(target_dir, exist_ok=True)
+                numbers = [int(name.split(".")[0]) for name in os.listdir(target_dir) if name.endswith(".seg")]
+                segment = f"{max(numbers, default=0) + 1:08d}.seg"
+                if renamed.keys() & set(meta["ids"]):
+                    packets = _load_segment(source, os.path.getmtime(source), meta["algorithm"], meta["raw_size"])
+                    raw, payload, used = _pack_segment({renamed.get(k, k): v for k, v in packets.items()}, meta["algorithm"])
+                    with open(os.path.join(target_dir, segment + ".tmp"), "wb") as f:
+                        f.write(payload)
+                    os.replace(os.path.join(target_dir, segment + ".tmp"), os.path.join(target_dir, segment))
+                    os.remove(source)
+                    meta = dict(meta, algorithm=used, raw_size=len(raw))
+                else:
+                    shutil.move(source, os.path.join(target_dir, segment))
+                meta = dict(meta, segment=segment, ids=[renamed.get(k, k) for k in meta["ids"]])
+                with open(target._segments_path(username), "a") as f:
+                    f.write(json.dumps(meta) + "\n")
+
+            # 3. Index and read log, merged in timestamp order
+            moved = [dict(h, id=renamed.get(h["id"], h["id"])) for h in headers]
+            merged = sorted(existing + moved, key=lambda h: h["timestamp"] or 0)
+            target._rewrite_lines(target._index_path(username), [json.dumps(h) for h in merged])
+            read = target.read_ids(username) | {renamed.get(k, k) for k in self.read_ids(username)}
+            target._rewrite_lines(target._read_log_path(username), sorted(read))
+            target._read_cache[username] = read
+            if on_rename:
+                for old_id, new_id in renamed.items():
+                    on_rename(old_id, new_id)
+
+            # 4. Drop the source copy
+            for path in (self._index_path(username), self._read_log_path(username)):
+                if os.path.exists(path):
+                    os.remove(path)
+            shutil.rmtree(os.path.join(self.archive_dir, username), ignore_errors=True)
+            self._read_cache.pop(username, None)
+            self._segment_maps.pop(username, None)
+        for fn in list(target._listeners):
+            fn(username)
+        return len(headers)
+
+    def _scan(self, username):
+        """Yields (message_id, packet) for every .msg file addressed to the user."""
+        for filename in os.listdir(self.messages_dir):
+            if not filename.endswith(".msg"):
+                continue
+
+            filepath = os.path.join(self.messages_dir, filename)
+            try:
+                with open(filepath, "r") as f:
+                    packet = json.load(f)
+            except:
+                continue
+
+            # Check if this message is for me
+            if packet.get("recipient") != username:
+                continue
+            yield filename, packet
+
+    def close(self):
+        pass
+
+
+class RelayTransport:
+    """
+    Delivers packets through a relay server (see core/relay.py).
+    The asyncio client runs on a background event loop thread so the
+    synchronous SecureMessenger API stays unchanged. Packets pushed by the
+    relay are kept in a local mailbox that fetch() reads from.
+    """
+    def __init__(self, host="127.0.0.1", port=None, path=None, on_packet=None):
+        """
+        :param host/port: TCP address of the relay, or
+        :param path: Unix socket path of the relay.
+        :param on_packet: Optional function called (from the loop thread) for every pushed packet.
+        """
+        self.on_packet = on_packet
+        self._mailboxes = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        self._client = RelayClient(host=host, port=port, path=path, on_deliver=self._on_deliver)
+        self._call(self._client.connect())
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def _on_deliver(self, packet):
+        with self._lock:
+            self._mailboxes.setdefault(packet.get("recipient"), []).append(packet)
+        if self.on_packet:
+            self.on_packet(packet)
+        for fn in list(self._listeners):
+            fn(packet.get("recipient"))
+
+    def add_listener(self, fn):
+        """fn(recipient) is called (from the loop thread) for every pushed packet."""
+        self._listeners.append(fn)
+
+    def remove_listener(self, fn):
+        if fn in self._listeners:
+            self._listeners.remove(fn)
+
+    def changes(self, username, cursor=None):
+        """Returns (new (message_id, packet) pairs, cursor); the cursor is the mailbox length."""
+        entries = self.fetch_entries(username)
+        if cursor is None:
+            return [], len(entries)
+        return entries[cursor:], len(entries)
+
+    def deliver(self, packet):
+        """Sends the packet to the relay. Returns a short description for the monitor."""
+        self._call(self._client.send(packet))
+        return f"Message packet relayed to '{packet['recipient']}'."
+
+    def deliver_many(self, packets):
+        """Pipelines many packets over the connection and waits for all acknowledgements."""
+        async def send_all():
+            await asyncio.gather(*(self._client.send(p) for p in packets))
+        self._call(send_all())
+
+    def subscribe(self, username):
+        """Registers the user as online; queued offline packets are pushed immediately."""
+        with self._lock:
+            self._mailboxes.setdefault(username, [])
+        self._call(self._client.subscribe(username))
+
+    def fetch(self, username):
+        """Returns every packet received for the user so far."""
+        if username not in self._mailboxes:
+            self.subscribe(username)
+        with self._lock:
+            return list(self._mailboxes.get(username, []))
+
+    def fetch_entries(self, username):
+        """Same as fetch, as (message_id, packet) pairs."""
+        return [(f"{username}:{i}", packet) for i, packet in enumerate(self.fetch(username))]
+
+    def mark_read(self, username, message_ids):
+        # Mailboxes live in memory only; nothing to compact
+        pass
+
+    def discard(self, username, message_ids):
+        # Ids are mailbox positions, so entries stay in place (they are screened again cheaply)
+        pass
+
+    def list_headers(self, username, offset=0, limit=20):
+        """Headers of the user's mailbox, newest first. Ids are "<user>:<position>"."""
+        packets = self.fetch(username)
+        end = len(packets) - offset
+        return [packet_header(f"{username}:{i}", packets[i]) for i in range(end - 1, max(end - limit, 0) - 1, -1)]
+
+    def get_packet(self, username, message_id):
+        owner, _, position = message_id.rpartition(":")
+        if owner != username:
+            return None
+        with self._lock:
+            mailbox = self._mailboxes.get(username, [])
+            if position.isdigit() and int(position) < len(mailbox):
+                return mailbox[int(position)]
+        return None
+
+    def close(self):
+        self._call(self._client.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
@@ -1,29 +1,44 @@
 import json
 import os
 import hashlib
-from crypto.ecdh import generate_keys as gen_ecdh
-from crypto.dsa import generate_keys as gen_dsa
-from crypto.gost import encrypt_cbc, decrypt_cbc
+from contextlib import contextmanager
+from crypto.ecdh import generate_keys as gen_ecdh, generate_keys_batch as gen_ecdh_batch
+from crypto.dsa import generate_keys as gen_dsa, generate_keys_batch as gen_dsa_batch
+from crypto.backends import encrypt_cbc, decrypt_cbc
+from core.metrics import REGISTRY, instrumented
+from core.events import EventLog, CallbackSubscriber, DEBUG, INFO, WARNING
 from utils import bytes_to_hex, hex_to_bytes, int_to_bytes, bytes_to_int, str_to_bytes, bytes_to_str
 
 DATA_DIR = "data"
 USERS_FILE = os.path.join(DATA_DIR, "users.json")
 
 class UserManager:
-    def __init__(self, debug_callback=None):
+    def __init__(self, debug_callback=None, events=None, metrics=None, users_lock=None, directory=None):
         """
         Initialize the User Manager.
         :param debug_callback: A function to call for logging events (used by the GUI Monitor).
+        :param events: Shared EventLog; a private one is created if omitted.
+        :param metrics: MetricsRegistry for per-stage latencies (defaults to the process-wide one).
+        :param users_lock: Lock shared by processes that register users into the same users.json
+                           (e.g. multiprocessing.Lock in core/service.py). users.json is then
+                           re-read under the lock before every write.
+        :param directory: Optional shared PublicKeyDirectory (core/keydir.py) consulted for
+                          users this process has not loaded.
         """
         self.debug_callback = debug_callback
+        self.events = events or EventLog()
+        self.metrics = metrics or REGISTRY
+        self.users_lock = users_lock
+        self.directory = directory
+        if debug_callback:
+            self.events.subscribe(CallbackSubscriber(debug_callback))
         if not os.path.exists(DATA_DIR):
             os.makedirs(DATA_DIR)
         self.users = self._load_users()
 
-    def _log(self, title, details):
-        """Helper function to send logs to the monitor if a callback is set."""
-        if self.debug_callback:
-            self.debug_callback(title, details)
+    def _log(self, title, details, *args, level=INFO):
+        """Helper function to record an event (formatting is deferred, see core/events.py)."""
+        self.events.emit(level, title, details, *args)
 
     def _load_users(self):
         if not os.path.exists(USERS_FILE):
@@ -42,21 +57,9 @@ class UserManager:
         """Creates a 32-byte key from the password for encrypting the private keys locally."""
         return hashlib.sha256(str_to_bytes(password)).digest()
 
-    def register(self, username, password):
-        if username in self.users:
-            return False, "Username already exists."
-
-        self._log("REGISTER START", f"Starting registration for user: {username}")
-
-        # 1. Generate new keys for the user
-        self._log("KEY GEN", "Generating DSA (Signature) & ECDH (Key Exchange) key pairs...")
-        dsa_priv, dsa_pub = gen_dsa()
-        ecdh_priv, ecdh_pub = gen_ecdh()
-        
-        self._log("KEYS GENERATED", f"DSA Public: {dsa_pub}\nECDH Public: {ecdh_pub}\n[Private keys are kept in memory]")
-
-        # 2. Encrypt private keys using the user's password (so we don't save them raw)
-        self._log("LOCAL ENCRYPTION", "Deriving encryption key from User Password (SHA-256)...")
+    def _build_user_record(self, password, dsa_priv, dsa_pub, ecdh_priv, ecdh_pub):
+        """Encrypts the private keys with the password and returns the users.json entry."""
+        self._log("LOCAL ENCRYPTION", "Deriving encryption key from User Password (SHA-256)...", level=DEBUG)
         pwd_key = self._derive_key_from_password(password)
         
         # Use a zero IV for local key storage simplicity (or random and store it)
@@ -66,48 +69,128 @@ class UserManager:
         dsa_priv_bytes = int_to_bytes(dsa_priv)
         ecdh_priv_bytes = int_to_bytes(ecdh_priv)
 
-        self._log("PROTECTING KEYS", "Encrypting private keys using GOST (CBC Mode) before saving to disk...")
+        self._log("PROTECTING KEYS", "Encrypting private keys using GOST (CBC Mode) before saving to disk...", level=DEBUG)
         # Encrypt
-        enc_dsa_priv = encrypt_cbc(dsa_priv_bytes, pwd_key, iv)
-        enc_ecdh_priv = encrypt_cbc(ecdh_priv_bytes, pwd_key, iv)
+        with self.metrics.timer("register.protect"):
+            enc_dsa_priv = encrypt_cbc(dsa_priv_bytes, pwd_key, iv)
+            enc_ecdh_priv = encrypt_cbc(ecdh_priv_bytes, pwd_key, iv)
 
-        # 3. Save public data and encrypted private data
-        self.users[username] = {
+        # Public data and encrypted private data
+        return {
             "dsa_public": dsa_pub,   # Tuple (G, Y, etc) or just public point/value
             "ecdh_public": ecdh_pub, # Point (x, y)
             "enc_dsa_priv": bytes_to_hex(enc_dsa_priv),
             "enc_ecdh_priv": bytes_to_hex(enc_ecdh_priv)
         }
-        self._save_users()
+
+    @contextmanager
+    def _users_transaction(self):
+        """Context for a users.json update; with a shared lock, also picks up other processes' users."""
+        if self.users_lock is None:
+            yield
+            return
+        with self.users_lock:
+            self.users = self._load_users()
+            yield
+
+    @instrumented("register")
+    def register(self, username, password):
+        with self._users_transaction():
+            return self._register(username, password)
+
+    def _register(self, username, password):
+        if username in self.users:
+            return False, "Username already exists."
+
+        self._log("REGISTER START", "Starting registration for user: {}", username)
+
+        # 1. Generate new keys for the user
+        self._log("KEY GEN", "Generating DSA (Signature) & ECDH (Key Exchange) key pairs...", level=DEBUG)
+        with self.metrics.timer("register.keygen"):
+            dsa_priv, dsa_pub = gen_dsa()
+            ecdh_priv, ecdh_pub = gen_ecdh()
+        
+        self._log("KEYS GENERATED", "DSA Public: {}\nECDH Public: {}\n[Private keys are kept in memory]", dsa_pub, ecdh_pub, level=DEBUG)
+
+        # 2. Encrypt private keys using the user's password (so we don't save them raw)
+        self.users[username] = self._build_user_record(password, dsa_priv, dsa_pub, ecdh_priv, ecdh_pub)
+        with self.metrics.timer("register.save"):
+            self._save_users()
+        self.metrics.inc("register.users")
         
         self._log("REGISTER COMPLETE", "User data saved to users.json successfully.")
         return True, "Registration successful."
 
+    def register_many(self, credentials):
+        """
+        Registers many users at once.
+        :param credentials: Iterable of (username, password) pairs.
+        :return: List of (username, success, message) tuples, in input order.
+        Key pairs are generated in batches and users.json is written only once.
+        """
+        with self._users_transaction():
+            return self._register_many(credentials)
+
+    def _register_many(self, credentials):
+        results = []
+        pending = []
+        seen = set()
+        for username, password in credentials:
+            if username in self.users or username in seen:
+                results.append((username, False, "Username already exists."))
+                continue
+            seen.add(username)
+            pending.append((len(results), username, password))
+            results.append(None)
+
+        if not pending:
+            return results
+
+        self._log("BULK REGISTER START", "Generating key pairs for {} users...", len(pending))
+        with self.metrics.timer("register.keygen_batch"):
+            dsa_pairs = gen_dsa_batch(len(pending))
+            ecdh_pairs = gen_ecdh_batch(len(pending))
+
+        for (index, username, password), (dsa_priv, dsa_pub), (ecdh_priv, ecdh_pub) in zip(pending, dsa_pairs, ecdh_pairs):
+            self.users[username] = self._build_user_record(password, dsa_priv, dsa_pub, ecdh_priv, ecdh_pub)
+            results[index] = (username, True, "Registration successful.")
+        with self.metrics.timer("register.save"):
+            self._save_users()
+        self.metrics.inc("register.users", len(pending))
+
+        self._log("BULK REGISTER COMPLETE", "{} users saved to users.json successfully.", len(pending))
+        return results
+
+    @instrumented("login")
     def login(self, username, password):
+        if username not in self.users:
+            # Another process may have registered the user since users.json was loaded
+            self.users = self._load_users()
         if username not in self.users:
             return None, "User not found."
 
-        self._log("LOGIN ATTEMPT", f"User: {username} is trying to log in.")
+        self._log("LOGIN ATTEMPT", "User: {} is trying to log in.", username)
 
         user_data = self.users[username]
         pwd_key = self._derive_key_from_password(password)
         iv = bytes(8)
 
         try:
-            self._log("DECRYPTION START", "Attempting to decrypt private keys with provided password...")
+            self._log("DECRYPTION START", "Attempting to decrypt private keys with provided password...", level=DEBUG)
             
             # Attempt to decrypt private keys
             enc_dsa = hex_to_bytes(user_data["enc_dsa_priv"])
             enc_ecdh = hex_to_bytes(user_data["enc_ecdh_priv"])
 
-            dsa_priv_bytes = decrypt_cbc(enc_dsa, pwd_key, iv)
-            ecdh_priv_bytes = decrypt_cbc(enc_ecdh, pwd_key, iv)
+            with self.metrics.timer("login.decrypt"):
+                dsa_priv_bytes = decrypt_cbc(enc_dsa, pwd_key, iv)
+                ecdh_priv_bytes = decrypt_cbc(enc_ecdh, pwd_key, iv)
 
             # Convert back to int
             dsa_priv = bytes_to_int(dsa_priv_bytes)
             ecdh_priv = bytes_to_int(ecdh_priv_bytes)
             
-            self._log("DECRYPTION SUCCESS", "Private keys restored into memory.")
+            self._log("DECRYPTION SUCCESS", "Private keys restored into memory.", level=DEBUG)
 
             # If successful, return a User session object (dict or class)
             # This object stays in memory only while the program runs
@@ -118,16 +201,18 @@ class UserManager:
                 "ecdh_priv": ecdh_priv,
                 "ecdh_pub": user_data["ecdh_public"]
             }
+            self.metrics.inc("login.success")
             return active_user, "Login successful."
             
         except Exception as e:
-            self._log("LOGIN FAILED", "Decryption failed. Wrong password or corrupted data.")
+            self._log("LOGIN FAILED", "Decryption failed. Wrong password or corrupted data.", level=WARNING)
+            self.metrics.inc("login.failure")
             return None, "Incorrect password or corrupted data."
 
     def get_public_keys(self, username):
         """Returns the public keys of a target user (for sending them a message)."""
         if username not in self.users:
-            return None
+            return self.directory.get(username) if self.directory else None
         return {
             "dsa": self.users[username]["dsa_public"],
             "ecdh": self.users[username]["ecdh_public"]
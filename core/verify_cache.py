@@ -0,0 +1,121 @@
+import os
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+VERIFY_CACHE_FILE = os.path.join("data", "verify_cache.sqlite")
+DEFAULT_MAX_ENTRIES = 100000
+DEFAULT_MEMORY_ENTRIES = 4096
+# Eviction runs once per this many inserts rather than on every write
+EVICT_EVERY = 256
+
+def cache_key(public_key, message: bytes, signature) -> bytes:
+    """
+    SHA-256 over (public key, SHA-256(message), r, s).
+    The signer's public key is part of the key, so rotating a key makes all
+    of its old entries unreachable.
+    """
+    x, y = public_key
+    r, s = signature
+    h = hashlib.sha256()
+    h.update(x.to_bytes(32, "big") + y.to_bytes(32, "big"))
+    h.update(hashlib.sha256(message).digest())
+    h.update(r.to_bytes(32, "big") + s.to_bytes(32, "big"))
+    return h.digest()
+
+
+class VerificationCache:
+    """
+    Remembers signature verification results: an in-memory LRU in front of a
+    size-bounded SQLite table (oldest entries are evicted first).
+    """
+    def __init__(self, path=None, max_entries=DEFAULT_MAX_ENTRIES, memory_entries=DEFAULT_MEMORY_ENTRIES):
+        self.path = path or VERIFY_CACHE_FILE
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._inserts = 0
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._db = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS verified (key BLOB PRIMARY KEY, valid INTEGER NOT NULL)")
+        self._db.commit()
+
+    def _remember(self, key, valid):
+        self._memory[key] = valid
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Returns True/False for a cached result, or None if unknown."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+            row = self._db.execute("SELECT valid FROM verified WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, bool(row[0]))
+            return bool(row[0])
+
+    def put(self, key, valid):
+        with self._lock:
+            self._remember(key, valid)
+            self._db.execute("INSERT OR REPLACE INTO verified (key, valid) VALUES (?, ?)", (key, int(valid)))
+            self._inserts += 1
+            if self._inserts % EVICT_EVERY == 0:
+                self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        # rowid grows with insertion order, so this drops the oldest entries
+        self._db.execute(
+            "DELETE FROM verified WHERE rowid <= (SELECT MAX(rowid) FROM verified) - ?",
+            (self.max_entries,))
+
+    def verify(self, verify_fn, public_key, message: bytes, signature):
+        """Returns verify_fn(public_key, message, signature), consulting the cache first."""
+        try:
+            key = cache_key(public_key, message, signature)
+        except (TypeError, ValueError, OverflowError):
+            # Malformed keys/signatures are not cacheable; let verify_fn reject them
+            return verify_fn(public_key, message, signature)
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        valid = verify_fn(public_key, message, signature)
+        self.put(key, valid)
+        return valid
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._db.execute("DELETE FROM verified")
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# One cache per file per process (inbox worker processes open their own connection)
+_open_caches = {}
+
+def get_cache(path=None):
+    path = path or VERIFY_CACHE_FILE
+    # SQLite connections must not cross fork(), so the pid is part of the key
+    key = (os.getpid(), path)
+    cache = _open_caches.get(key)
+    if cache is None:
+        cache = _open_caches[key] = VerificationCache(path)
+    return cache
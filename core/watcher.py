@@ -0,0 +1,64 @@
+import threading
+
+# Fallback polling period in seconds (deliveries from this process wake the watcher immediately)
+POLL_INTERVAL = 0.2
+
+class InboxWatcher:
+    """
+    Reports new mail for one user without rescanning the inbox.
+    Uses transport.changes(username, cursor), which for FileTransport is a
+    stat() of the user's append-only header index plus a read of the appended
+    lines, and for RelayTransport a look at the mailbox length. Deliveries made
+    through the same transport object wake the watcher at once; anything else
+    (other processes, the relay) is picked up by polling every interval seconds.
+    callback(entries) runs on the watcher thread with the new (message_id, packet) pairs.
+    """
+    def __init__(self, transport, username, callback, interval=POLL_INTERVAL):
+        self.transport = transport
+        self.username = username
+        self.callback = callback
+        self.interval = interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        # Start at the current end: only mail arriving from now on is reported
+        _, self._cursor = transport.changes(username)
+
+    def start(self):
+        if self._thread is None:
+            self.transport.add_listener(self._on_delivery)
+            self._thread = threading.Thread(target=self._loop, name=f"inbox-watcher-{self.username}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        self.transport.remove_listener(self._on_delivery)
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def _on_delivery(self, recipient):
+        if recipient == self.username:
+            self._wake.set()
+
+    def poll(self):
+        """Checks once; returns the new entries (also passed to the callback)."""
+        entries, self._cursor = self.transport.changes(self.username, self._cursor)
+        if entries:
+            self.callback(entries)
+        return entries
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.poll()
+            except Exception:
+                # A transient read error (e.g. an index rewrite in progress) or a failing
+                # callback must not end the watcher
+                continue
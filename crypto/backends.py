@@ -0,0 +1,180 @@
+import os
+import warnings
+from crypto import gost, gost_tables
+from crypto.elliptic_curve import G, ORDER, point_add, scalar_mult, scalar_mult_fast, scalar_mult_many_fast
+
+# ======================================================
+# Crypto backend registry
+# ======================================================
+# A backend bundles the primitives the rest of the project calls through this
+# module: curve scalar multiplication / point addition and GOST block + CBC.
+# The active backend comes from set_backend() or the CRYPTO_BACKEND environment
+# variable. Before first use it is self-tested against known-answer vectors and
+# against the reference implementation; a failing backend is never used.
+
+BACKEND_ENV = "CRYPTO_BACKEND"
+DEFAULT_BACKEND = "tables"
+REFERENCE = "reference"
+
+class Backend:
+    def __init__(self, name, scalar_mult, point_add, encrypt_block, decrypt_block, encrypt_cbc, decrypt_cbc,
+                 scalar_mult_many=None):
+        """
+        :param scalar_mult_many: Optional batch form (scalars, point) -> [k * point];
+                                 defaults to calling scalar_mult once per scalar.
+        """
+        self.name = name
+        self.scalar_mult = scalar_mult
+        self.scalar_mult_many = scalar_mult_many or (lambda scalars, point: [scalar_mult(k, point) for k in scalars])
+        self.point_add = point_add
+        self.encrypt_block = encrypt_block
+        self.decrypt_block = decrypt_block
+        self.encrypt_cbc = encrypt_cbc
+        self.decrypt_cbc = decrypt_cbc
+
+    def __repr__(self):
+        return f"<Backend {self.name}>"
+
+
+BACKENDS = {}
+_active = None
+
+def register_backend(backend):
+    BACKENDS[backend.name] = backend
+
+# Pure-Python reference: the original code, the source of truth
+register_backend(Backend(REFERENCE, scalar_mult, point_add,
+                         gost._encrypt_block, gost._decrypt_block, gost.encrypt_cbc, gost.decrypt_cbc))
+
+# Jacobian-coordinate curve math + table-driven GOST
+register_backend(Backend("tables", scalar_mult_fast, point_add,
+                         gost_tables.encrypt_block, gost_tables.decrypt_block,
+                         gost_tables.encrypt_cbc, gost_tables.decrypt_cbc, scalar_mult_many_fast))
+
+# Optional: NumPy-vectorized CBC decryption
+try:
+    from crypto import gost_numpy
+except ImportError:
+    gost_numpy = None
+if gost_numpy is not None:
+    register_backend(Backend("numpy", scalar_mult_fast, point_add,
+                             gost_numpy.encrypt_block, gost_numpy.decrypt_block,
+                             gost_numpy.encrypt_cbc, gost_numpy.decrypt_cbc, scalar_mult_many_fast))
+
+
+# Known-answer vectors
+# ======================================================
+
+# secp256k1 multiples of G (published values)
+CURVE_VECTORS = [
+    (2, (0xC6047F9441ED7D6D3045406E95C07CD85C778E4B8CEF3CA7ABAC09B95C709EE5,
+         0x1AE168FEA63DC339A3C58419466CEAEEF7F632653266D0E1236431A950CFE52A)),
+    (3, (0xF9308A019258C31049344F85F89D5229B531C845836F99B08601F113BCE036F9,
+         0x388F7B0F632DE8140FE337E62A37F3566500A99934C2231B6CB9FD7584B8E672)),
+]
+
+# GOST with this project's S-box, key = 00 01 .. 1f (recorded from the reference implementation)
+GOST_KEY = bytes(range(32))
+GOST_BLOCK_VECTOR = (bytes(range(8)), bytes.fromhex("3ca0f53919383efa"))
+GOST_CBC_VECTOR = (b"GOST 28147-89 known answer", bytes(8),
+                   bytes.fromhex("075128fbdf3b56fc3ba4a8d9ddadd53281fe2709ab515f9466010f3b4d8f0186"))
+
+def self_test(backend, rounds=8):
+    """
+    Checks a backend against the known-answer vectors and, with random inputs,
+    against the reference backend. Returns a list of failure descriptions (empty = pass).
+    """
+    failures = []
+    reference = BACKENDS[REFERENCE]
+
+    def check(label, fn):
+        try:
+            if not fn():
+                failures.append(label)
+        except Exception as e:
+            failures.append(f"{label}: {e!r}")
+
+    # 1. Known answers
+    for k, expected in CURVE_VECTORS:
+        check(f"scalar_mult KAT k={k}", lambda: tuple(backend.scalar_mult(k, G)) == expected)
+    check("scalar_mult_many KAT", lambda: [tuple(p) for p in backend.scalar_mult_many([k for k, _ in CURVE_VECTORS], G)]
+                                          == [expected for _, expected in CURVE_VECTORS])
+    subkeys = gost._generate_subkeys(GOST_KEY)
+    block, expected_block = GOST_BLOCK_VECTOR
+    check("encrypt_block KAT", lambda: backend.encrypt_block(block, subkeys) == expected_block)
+    check("decrypt_block KAT", lambda: backend.decrypt_block(expected_block, subkeys) == block)
+    plaintext, iv, expected_cbc = GOST_CBC_VECTOR
+    check("encrypt_cbc KAT", lambda: backend.encrypt_cbc(plaintext, GOST_KEY, iv) == expected_cbc)
+    check("decrypt_cbc KAT", lambda: backend.decrypt_cbc(expected_cbc, GOST_KEY, iv) == plaintext)
+
+    if backend is reference:
+        return failures
+
+    # 2. Differential checks against the reference on random inputs
+    k = int.from_bytes(os.urandom(32), "big") % ORDER or 1
+    point = reference.scalar_mult(k, G)
+    scalar = int.from_bytes(os.urandom(32), "big") % ORDER or 1
+    check("scalar_mult vs reference", lambda: tuple(backend.scalar_mult(scalar, point)) == tuple(reference.scalar_mult(scalar, point)))
+    check("scalar_mult(G) vs reference", lambda: tuple(backend.scalar_mult(scalar, G)) == tuple(reference.scalar_mult(scalar, G)))
+    check("scalar_mult_many vs reference", lambda: backend.scalar_mult_many([scalar, k, 0], point)
+                                                   == reference.scalar_mult_many([scalar, k, 0], point))
+    for i in range(rounds):
+        key, iv = os.urandom(32), os.urandom(8)
+        subkeys = gost._generate_subkeys(key)
+        block = os.urandom(8)
+        check("encrypt_block vs reference", lambda: backend.encrypt_block(block, subkeys) == reference.encrypt_block(block, subkeys))
+        # Sizes straddle the NumPy vectorization threshold
+        data = os.urandom(i * 97)
+        expected = reference.encrypt_cbc(data, key, iv)
+        check(f"encrypt_cbc vs reference ({len(data)} bytes)", lambda: backend.encrypt_cbc(data, key, iv) == expected)
+        check(f"decrypt_cbc vs reference ({len(data)} bytes)", lambda: backend.decrypt_cbc(expected, key, iv) == data)
+    return failures
+
+def set_backend(name):
+    """Selects and self-tests a backend. Raises ValueError if it is unknown or fails."""
+    global _active
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown crypto backend '{name}' (available: {', '.join(sorted(BACKENDS))})")
+    failures = self_test(BACKENDS[name])
+    if failures:
+        raise ValueError(f"Crypto backend '{name}' failed its self-test: {'; '.join(failures)}")
+    _active = BACKENDS[name]
+    return _active
+
+def get_backend():
+    """Returns the active backend, resolving CRYPTO_BACKEND on first use."""
+    global _active
+    if _active is None:
+        name = os.environ.get(BACKEND_ENV, DEFAULT_BACKEND)
+        try:
+            set_backend(name)
+        except ValueError as e:
+            # Never run on an unverified engine: fall back to the reference code
+            warnings.warn(f"{e}; falling back to '{REFERENCE}'")
+            _active = BACKENDS[REFERENCE]
+    return _active
+
+
+# Dispatchers used by ecdh, dsa, UserManager and SecureMessenger
+# ======================================================
+
+def scalar_mult_active(k, point):
+    return get_backend().scalar_mult(k, point)
+
+def scalar_mult_many_active(scalars, point):
+    return get_backend().scalar_mult_many(scalars, point)
+
+def point_add_active(p1, p2):
+    return get_backend().point_add(p1, p2)
+
+def encrypt_cbc(plaintext: bytes, key: bytes, iv: bytes) -> bytes:
+    return get_backend().encrypt_cbc(plaintext, key, iv)
+
+def decrypt_cbc(ciphertext: bytes, key: bytes, iv: bytes) -> bytes:
+    return get_backend().decrypt_cbc(ciphertext, key, iv)
+
+
+if __name__ == "__main__":
+    for name, backend in sorted(BACKENDS.items()):
+        result = self_test(backend)
+        print(f"{name:<10} {'OK' if not result else 'FAILED: ' + '; '.join(result)}")
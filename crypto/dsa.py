@@ -1,5 +1,6 @@
 import os
 from hashlib import sha256
+from crypto.backends import point_add_active, scalar_mult_active, scalar_mult_many_active
 from crypto.elliptic_curve import G, ORDER, POINT_INFINITY, is_on_curve, point_add, scalar_mult
 
 def hash_to_int(message: bytes) -> int:
@@ -23,16 +24,29 @@ def generate_keys():
         private_key = int.from_bytes(os.urandom(32), "big") % ORDER
         if private_key != 0:
             break
-    public_key = scalar_mult(private_key, G)
+    public_key = scalar_mult_active(private_key, G)
     return private_key, public_key
 
+def generate_keys_batch(n: int):
+    """
+    Generates n key pairs through the active backend's batch primitive
+    (the "tables" backend shares one modular inversion across the batch).
+    """
+    private_keys = []
+    while len(private_keys) < n:
+        private_key = int.from_bytes(os.urandom(32), "big") % ORDER
+        if private_key != 0:
+            private_keys.append(private_key)
+    public_keys = scalar_mult_many_active(private_keys, G)
+    return list(zip(private_keys, public_keys))
+
 def sign_message(private_key: int, message: bytes):
     z = hash_to_int(message) % ORDER
     while True:
         k = int.from_bytes(os.urandom(32), "big") % ORDER
         if k == 0:
             continue
-        R = scalar_mult(k, G)
+        R = scalar_mult_active(k, G)
         r = R[0] % ORDER
         if r == 0:
             continue
@@ -52,7 +66,7 @@ def verify_signature(public_key, message: bytes, signature):
     w = mod_inv(s, ORDER)
     u1 = (z * w) % ORDER
     u2 = (r * w) % ORDER
-    point = point_add(scalar_mult(u1, G), scalar_mult(u2, public_key))
+    point = point_add_active(scalar_mult_active(u1, G), scalar_mult_active(u2, public_key))
     if point is POINT_INFINITY:
         return False
     v = point[0] % ORDER
@@ -1,5 +1,6 @@
 import os
 from crypto.elliptic_curve import G, ORDER, POINT_INFINITY, is_on_curve, scalar_mult
+from crypto.backends import scalar_mult_active, scalar_mult_many_active
 from utils import int_to_bytes
 from utils import hash_bytes
 
@@ -8,13 +9,26 @@ def generate_keys():
         private_key = int.from_bytes(os.urandom(32), "big") % ORDER
         if private_key != 0:
             break
-    public_key = scalar_mult(private_key, G)
+    public_key = scalar_mult_active(private_key, G)
     return private_key, public_key
 
+def generate_keys_batch(n: int):
+    """
+    Generates n key pairs through the active backend's batch primitive
+    (the "tables" backend shares one modular inversion across the batch).
+    """
+    private_keys = []
+    while len(private_keys) < n:
+        private_key = int.from_bytes(os.urandom(32), "big") % ORDER
+        if private_key != 0:
+            private_keys.append(private_key)
+    public_keys = scalar_mult_many_active(private_keys, G)
+    return list(zip(private_keys, public_keys))
+
 def compute_shared_secret(my_private_key, other_public_key):
     if not is_on_curve(other_public_key):
         raise ValueError("Invalid public key received")
-    shared_point = scalar_mult(my_private_key, other_public_key)
+    shared_point = scalar_mult_active(my_private_key, other_public_key)
     if shared_point is POINT_INFINITY:
         raise ValueError("Invalid shared secret (point at infinity)")
     x_coord = shared_point[0]
@@ -45,3 +45,142 @@ def scalar_mult(k, point):
         addend = point_add(addend, addend)
         k >>= 1
     return result
+
+# Jacobian coordinates (X, Y, Z) represent the affine point (X/Z^2, Y/Z^3).
+# They avoid a modular inversion per addition, so the only inversion is the
+# final conversion back to affine form.
+JACOBIAN_INFINITY = (1, 1, 0)
+
+def _jacobian_double(p):
+    X1, Y1, Z1 = p
+    if Z1 == 0 or Y1 == 0:
+        return JACOBIAN_INFINITY
+    YY = Y1 * Y1 % P
+    S = 4 * X1 * YY % P
+    M = (3 * X1 * X1 + A * pow(Z1, 4, P)) % P
+    X3 = (M * M - 2 * S) % P
+    Y3 = (M * (S - X3) - 8 * YY * YY) % P
+    Z3 = 2 * Y1 * Z1 % P
+    return (X3, Y3, Z3)
+
+def _jacobian_add(p1, p2):
+    if p1[2] == 0:
+        return p2
+    if p2[2] == 0:
+        return p1
+    X1, Y1, Z1 = p1
+    X2, Y2, Z2 = p2
+    Z1Z1 = Z1 * Z1 % P
+    Z2Z2 = Z2 * Z2 % P
+    U1 = X1 * Z2Z2 % P
+    U2 = X2 * Z1Z1 % P
+    S1 = Y1 * Z2 * Z2Z2 % P
+    S2 = Y2 * Z1 * Z1Z1 % P
+    if U1 == U2:
+        if S1 != S2:
+            return JACOBIAN_INFINITY
+        return _jacobian_double(p1)
+    H = (U2 - U1) % P
+    R = (S2 - S1) % P
+    HH = H * H % P
+    HHH = H * HH % P
+    V = U1 * HH % P
+    X3 = (R * R - HHH - 2 * V) % P
+    Y3 = (R * (V - X3) - S1 * HHH) % P
+    Z3 = H * Z1 * Z2 % P
+    return (X3, Y3, Z3)
+
+def scalar_mult_jacobian(k, point):
+    """Like scalar_mult, but returns the result in Jacobian coordinates."""
+    if k % ORDER == 0 or point is POINT_INFINITY:
+        return JACOBIAN_INFINITY
+    result = JACOBIAN_INFINITY
+    addend = (point[0], point[1], 1)
+    while k:
+        if k & 1:
+            result = _jacobian_add(result, addend)
+        addend = _jacobian_double(addend)
+        k >>= 1
+    return result
+
+def batch_to_affine(points):
+    """
+    Converts a list of Jacobian points to affine form using Montgomery's
+    simultaneous inversion trick: one modular inversion for the whole batch
+    plus three multiplications per point.
+    """
+    # 1. Prefix products of the non-zero Z coordinates
+    prefix = []
+    acc = 1
+    for X, Y, Z in points:
+        prefix.append(acc)
+        if Z != 0:
+            acc = acc * Z % P
+
+    # 2. Single inversion, then walk backwards peeling off each Z^-1
+    inv = pow(acc, P - 2, P)
+    result = [POINT_INFINITY] * len(points)
+    for i in range(len(points) - 1, -1, -1):
+        X, Y, Z = points[i]
+        if Z == 0:
+            continue
+        z_inv = inv * prefix[i] % P
+        inv = inv * Z % P
+        z_inv2 = z_inv * z_inv % P
+        result[i] = (X * z_inv2 % P, Y * z_inv2 * z_inv % P)
+    return result
+
+# Fixed-base table for G: BASE_TABLE[i][d - 1] = d * 2^(BASE_WINDOW * i) * G.
+# k * G then needs one addition per window and no doublings. Built on first
+# use (or by precompute_base_table(), e.g. before forking worker processes so
+# they all share the pages).
+BASE_WINDOW = 4
+_base_table = None
+
+def precompute_base_table():
+    global _base_table
+    if _base_table is None:
+        rows = []
+        base = (G_X, G_Y, 1)
+        for _ in range((ORDER.bit_length() + BASE_WINDOW - 1) // BASE_WINDOW):
+            row = [base]
+            for _ in range((1 << BASE_WINDOW) - 2):
+                row.append(_jacobian_add(row[-1], base))
+            rows.append(row)
+            for _ in range(BASE_WINDOW):
+                base = _jacobian_double(base)
+        # Affine entries (Z = 1) keep every later addition cheap
+        flat = batch_to_affine([p for row in rows for p in row])
+        width = (1 << BASE_WINDOW) - 1
+        _base_table = [[(x, y, 1) for x, y in flat[i:i + width]] for i in range(0, len(flat), width)]
+    return _base_table
+
+def _scalar_mult_base_jacobian(k):
+    k %= ORDER
+    table = precompute_base_table()
+    mask = (1 << BASE_WINDOW) - 1
+    result = JACOBIAN_INFINITY
+    i = 0
+    while k:
+        digit = k & mask
+        if digit:
+            result = _jacobian_add(result, table[i][digit - 1])
+        k >>= BASE_WINDOW
+        i += 1
+    return result
+
+def scalar_mult_base(k):
+    """k * G using the fixed-base table."""
+    return batch_to_affine([_scalar_mult_base_jacobian(k)])[0]
+
+def scalar_mult_fast(k, point):
+    """Same result as scalar_mult, computed in Jacobian coordinates with a single inversion."""
+    if point == G:
+        return scalar_mult_base(k)
+    return batch_to_affine([scalar_mult_jacobian(k, point)])[0]
+
+def scalar_mult_many_fast(scalars, point):
+    """[k * point for k in scalars], sharing one inversion across the batch (see batch_to_affine)."""
+    if point == G:
+        return batch_to_affine([_scalar_mult_base_jacobian(k) for k in scalars])
+    return batch_to_affine([scalar_mult_jacobian(k, point) for k in scalars])
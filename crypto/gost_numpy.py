@@ -0,0 +1,47 @@
+import numpy as np
+from crypto.gost import BLOCK_SIZE, _unpad, _generate_subkeys
+from crypto import gost_tables
+from crypto.gost_tables import T0, T1, T2, T3, _key_schedule
+
+# ======================================================
+# NumPy GOST 28147-89 (optional backend)
+# ======================================================
+# CBC decryption has no dependency between blocks, so every block goes through
+# the 32 rounds at once as a uint32 vector. CBC encryption is inherently
+# sequential and uses the table-driven implementation.
+
+# Below this many bytes the per-call NumPy overhead outweighs vectorization
+MIN_VECTOR_BYTES = 512
+
+_T0, _T1, _T2, _T3 = (np.array(t, dtype=np.uint32) for t in (T0, T1, T2, T3))
+
+def _crypt_many(n1, n2, schedule):
+    for k in schedule:
+        x = n2 + np.uint32(k)  # wraps modulo 2^32
+        n1, n2 = n2, n1 ^ _T0[x & 0xFF] ^ _T1[(x >> 8) & 0xFF] ^ _T2[(x >> 16) & 0xFF] ^ _T3[x >> 24]
+    return n2, n1
+
+encrypt_block = gost_tables.encrypt_block
+decrypt_block = gost_tables.decrypt_block
+encrypt_cbc = gost_tables.encrypt_cbc
+
+def decrypt_cbc(ciphertext: bytes, key: bytes, iv: bytes) -> bytes:
+    if len(ciphertext) < MIN_VECTOR_BYTES:
+        return gost_tables.decrypt_cbc(ciphertext, key, iv)
+    if len(key) != 32:
+        raise ValueError("GOST key must be 256 bits")
+    if len(iv) != BLOCK_SIZE:
+        raise ValueError("IV must be 64 bits")
+    if len(ciphertext) % BLOCK_SIZE:
+        raise ValueError("Ciphertext is not a whole number of blocks")
+
+    schedule = _key_schedule(_generate_subkeys(key))[::-1]
+    blocks = np.frombuffer(ciphertext, dtype="<u4").reshape(-1, 2).astype(np.uint32)
+    left, right = _crypt_many(blocks[:, 0], blocks[:, 1], schedule)
+
+    # CBC: XOR every decrypted block with the previous ciphertext block (or IV)
+    prev = np.frombuffer(iv + ciphertext[:-BLOCK_SIZE], dtype="<u4").reshape(-1, 2)
+    plain = np.empty_like(blocks)
+    plain[:, 0] = left ^ prev[:, 0]
+    plain[:, 1] = right ^ prev[:, 1]
+    return _unpad(plain.astype("<u4").tobytes())
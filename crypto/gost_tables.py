@@ -0,0 +1,83 @@
+from crypto.gost import BLOCK_SIZE, S_BOX, _pad, _unpad, _generate_subkeys
+
+# ======================================================
+# Table-driven GOST 28147-89 (same results as crypto/gost.py)
+# ======================================================
+# The eight 4-bit S-boxes are merged into four 8-bit tables, and the
+# rotate-left-11 is folded into the table entries (rotation distributes over
+# the OR of disjoint bit groups). One round is then four lookups and three XORs.
+
+def _rotl11(x: int) -> int:
+    return ((x << 11) | (x >> (32 - 11))) & 0xFFFFFFFF
+
+def _build_tables():
+    tables = []
+    for j in range(4):
+        low, high = S_BOX[2 * j], S_BOX[2 * j + 1]
+        tables.append([
+            _rotl11((low[b & 0xF] | (high[b >> 4] << 4)) << (8 * j))
+            for b in range(256)
+        ])
+    return tables
+
+T0, T1, T2, T3 = _build_tables()
+
+def _key_schedule(subkeys):
+    # Encryption order: K0..K7 three times, then K7..K0
+    return list(subkeys) * 3 + list(reversed(subkeys))
+
+def _crypt(n1: int, n2: int, schedule):
+    t0, t1, t2, t3 = T0, T1, T2, T3
+    for k in schedule:
+        x = (n2 + k) & 0xFFFFFFFF
+        n1, n2 = n2, n1 ^ t0[x & 0xFF] ^ t1[(x >> 8) & 0xFF] ^ t2[(x >> 16) & 0xFF] ^ t3[x >> 24]
+    # Output: Right || Left
+    return n2, n1
+
+def encrypt_block(block: bytes, subkeys) -> bytes:
+    n1, n2 = _crypt(int.from_bytes(block[:4], "little"), int.from_bytes(block[4:], "little"), _key_schedule(subkeys))
+    return n1.to_bytes(4, "little") + n2.to_bytes(4, "little")
+
+def decrypt_block(block: bytes, subkeys) -> bytes:
+    schedule = _key_schedule(subkeys)[::-1]
+    n1, n2 = _crypt(int.from_bytes(block[:4], "little"), int.from_bytes(block[4:], "little"), schedule)
+    return n1.to_bytes(4, "little") + n2.to_bytes(4, "little")
+
+def _check(key, iv):
+    if len(key) != 32:
+        raise ValueError("GOST key must be 256 bits")
+    if len(iv) != BLOCK_SIZE:
+        raise ValueError("IV must be 64 bits")
+
+def encrypt_cbc(plaintext: bytes, key: bytes, iv: bytes) -> bytes:
+    """GOST-CBC encryption working on 64-bit integers instead of byte strings."""
+    _check(key, iv)
+    schedule = _key_schedule(_generate_subkeys(key))
+    data = _pad(plaintext)
+    out = bytearray(len(data))
+
+    prev = int.from_bytes(iv, "little")
+    for offset in range(0, len(data), BLOCK_SIZE):
+        # CBC: XOR with previous ciphertext (or IV) BEFORE encryption
+        x = int.from_bytes(data[offset:offset + BLOCK_SIZE], "little") ^ prev
+        n1, n2 = _crypt(x & 0xFFFFFFFF, x >> 32, schedule)
+        prev = n1 | (n2 << 32)
+        out[offset:offset + BLOCK_SIZE] = prev.to_bytes(8, "little")
+    return bytes(out)
+
+def decrypt_cbc(ciphertext: bytes, key: bytes, iv: bytes) -> bytes:
+    """GOST-CBC decryption working on 64-bit integers instead of byte strings."""
+    _check(key, iv)
+    if len(ciphertext) % BLOCK_SIZE:
+        raise ValueError("Ciphertext is not a whole number of blocks")
+    schedule = _key_schedule(_generate_subkeys(key))[::-1]
+    out = bytearray(len(ciphertext))
+
+    prev = int.from_bytes(iv, "little")
+    for offset in range(0, len(ciphertext), BLOCK_SIZE):
+        # CBC: Decrypt, THEN XOR with previous ciphertext (or IV)
+        c = int.from_bytes(ciphertext[offset:offset + BLOCK_SIZE], "little")
+        n1, n2 = _crypt(c & 0xFFFFFFFF, c >> 32, schedule)
+        out[offset:offset + BLOCK_SIZE] = ((n1 | (n2 << 32)) ^ prev).to_bytes(8, "little")
+        prev = c
+    return _unpad(bytes(out))
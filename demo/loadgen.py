@@ -0,0 +1,103 @@
+import os
+import sys
+import time
+import random
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+# Adjust paths (in case running not as a module)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.user_manager import UserManager
+from core.secure_messenger import SecureMessenger
+
+# Same flow as demo/scenario.py (ECDH -> DSA sign -> GOST encrypt, then
+# decrypt -> verify), but through SecureMessenger for many users at once.
+
+_worker = {}
+
+def _init_worker(data_root):
+    # Every worker process works inside the shared temporary data dir
+    os.chdir(data_root)
+    um = UserManager()
+    _worker["messenger"] = SecureMessenger(um, inbox_workers=0)
+
+def _send(job):
+    sender, recipient, text = job
+    start = time.perf_counter()
+    ok, _ = _worker["messenger"].send_message(sender, recipient, text)
+    return ok, time.perf_counter() - start
+
+def _read_inbox(user):
+    start = time.perf_counter()
+    messages = _worker["messenger"].check_inbox(user)
+    verified = sum(1 for m in messages if m.get("status") == "Verified")
+    return len(messages), verified, time.perf_counter() - start
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": ordered[-1]}
+
+def run_loadgen(users=4, messages=20, concurrency=None, message_size=64, seed=None):
+    """
+    Simulates `users` users exchanging `messages` messages in total, using
+    `concurrency` worker processes, in a throwaway data directory.
+    Returns a dict with throughput and latency percentiles (seconds).
+    """
+    rng = random.Random(seed)
+    concurrency = concurrency or os.cpu_count() or 1
+    old_cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            # 1. Register and log in everyone (batched key generation)
+            um = UserManager()
+            names = [f"user{i}" for i in range(users)]
+            um.register_many([(name, f"pw-{name}") for name in names])
+            sessions = {name: um.login(name, f"pw-{name}")[0] for name in names}
+
+            # 2. Random sender -> recipient pairs
+            jobs = []
+            for _ in range(messages):
+                sender, recipient = rng.sample(names, 2) if users > 1 else (names[0], names[0])
+                jobs.append((sessions[sender], recipient, "x" * message_size))
+
+            with ProcessPoolExecutor(max_workers=concurrency, initializer=_init_worker, initargs=(tmp,)) as pool:
+                # 3. Send phase
+                start = time.perf_counter()
+                sends = list(pool.map(_send, jobs, chunksize=max(1, len(jobs) // (concurrency * 4))))
+                send_elapsed = time.perf_counter() - start
+
+                # 4. Receive phase: every user reads their inbox
+                start = time.perf_counter()
+                inboxes = list(pool.map(_read_inbox, [sessions[name] for name in names]))
+                inbox_elapsed = time.perf_counter() - start
+        finally:
+            os.chdir(old_cwd)
+
+    sent_ok = sum(1 for ok, _ in sends if ok)
+    received = sum(count for count, _, _ in inboxes)
+    verified = sum(v for _, v, _ in inboxes)
+    return {
+        "users": users,
+        "messages": messages,
+        "concurrency": concurrency,
+        "message_size": message_size,
+        "sent": sent_ok,
+        "received": received,
+        "verified": verified,
+        "send_seconds": send_elapsed,
+        "send_throughput": sent_ok / send_elapsed if send_elapsed else None,
+        "send_latency": percentiles([t for _, t in sends]),
+        "inbox_seconds": inbox_elapsed,
+        "inbox_throughput": received / inbox_elapsed if inbox_elapsed else None,
+        "inbox_latency": percentiles([t for _, _, t in inboxes]),
+    }
+
+if __name__ == "__main__":
+    import json
+    print(json.dumps(run_loadgen(), indent=4))
@@ -1,6 +1,11 @@
+import queue
 import tkinter as tk
 from core.user_manager import UserManager
 from core.secure_messenger import SecureMessenger
+from core.events import EventLog, DEBUG
+from core.transport import FileTransport
+from core.sharding import ShardedTransport
+from core.retention import Compactor, GarbageCollector
 from gui.auth_frame import AuthFrame
 from gui.chat_frame import ChatFrame
 from gui.monitor_window import MonitorWindow 
@@ -15,13 +20,19 @@ class CryptologyGUI(tk.Tk):
         self.monitor = MonitorWindow(self)
         self.monitor.withdraw() # Hide initially
 
-        # Define the callback function that Core will use to log events
-        def on_core_log(title, data):
-            self.monitor.log_event(title, data)
-
-        # --- 2. Initialize Core Logic with Logger ---
-        self.user_manager = UserManager(debug_callback=on_core_log)
-        self.messenger = SecureMessenger(self.user_manager, debug_callback=on_core_log)
+        # --- 2. Initialize Core Logic with a shared event log ---
+        # The monitor only subscribes while it is visible, so hidden = no formatting cost
+        self.events = EventLog()
+        self._monitor_seen = 0.0
+        # Events may come from background worker threads; only the Tk thread touches widgets
+        self._event_queue = queue.Queue()
+        self.user_manager = UserManager(events=self.events)
+        self.messenger = SecureMessenger(self.user_manager, events=self.events)
+        # Archives read mail in the background so inbox scans stay proportional to new mail
+        self.gc = None
+        if isinstance(self.messenger.transport, (FileTransport, ShardedTransport)):
+            self.gc = GarbageCollector(Compactor(self.messenger.transport, seen_index=self.messenger.seen_index),
+                                       events=self.events).start()
 
         # --- 3. Setup Main UI Container ---
         self.container = tk.Frame(self)
@@ -41,6 +52,7 @@ class CryptologyGUI(tk.Tk):
 
         # Show initial screen
         self.show_frame("Auth")
+        self._drain_events()
 
     def create_menu(self):
         menubar = tk.Menu(self)
@@ -52,10 +64,32 @@ class CryptologyGUI(tk.Tk):
         
         self.config(menu=menubar)
 
+    def on_core_event(self, event):
+        self._event_queue.put(event)
+
+    def _drain_events(self):
+        while True:
+            try:
+                event = self._event_queue.get_nowait()
+            except queue.Empty:
+                break
+            self._monitor_seen = event.time
+            self.monitor.log_event(event.title, event.details)
+        self.after(100, self._drain_events)
+
     def show_monitor(self):
+        # Catch up on events kept in the ring buffer while the monitor was hidden
+        for event in self.events.recent():
+            if event.time > self._monitor_seen:
+                self.on_core_event(event)
+        self.events.subscribe(self.on_core_event, level=DEBUG)
         self.monitor.deiconify() # Show the window
         self.monitor.lift()      # Bring to front
 
+    def hide_monitor(self):
+        self.events.unsubscribe(self.on_core_event)
+        self.monitor.withdraw()
+
     def show_frame(self, page_name):
         frame = self.frames[page_name]
         frame.tkraise()
@@ -66,6 +100,10 @@ class CryptologyGUI(tk.Tk):
         self.show_frame("Chat")
 
     def logout(self):
+        self.frames["Chat"].cancel_loading()
+        self.frames["Chat"].stop_watching()
+        if self.frames["Chat"].current_user:
+            self.messenger.logout(self.frames["Chat"].current_user)
         self.show_frame("Auth")
 
     def run(self):
@@ -0,0 +1,66 @@
+import queue
+import threading
+
+class BackgroundTask:
+    """
+    Runs a function on a worker thread and hands its output back to the Tk
+    main loop through a queue polled with after(), so the window never blocks
+    on crypto work.
+    work(emit, cancel_event) may call emit(item) any number of times; each item
+    is passed to on_item on the Tk thread. Its return value (or exception) goes
+    to on_done(result, error).
+    """
+    def __init__(self, widget, work, on_item=None, on_done=None, poll_ms=50, max_items_per_poll=50):
+        self.widget = widget
+        self.work = work
+        self.on_item = on_item
+        self.on_done = on_done
+        self.poll_ms = poll_ms
+        self.max_items_per_poll = max_items_per_poll
+        self.cancel_event = threading.Event()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._finished = False
+
+    @property
+    def running(self):
+        return self._thread is not None and not self._finished
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self.widget.after(self.poll_ms, self._poll)
+        return self
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def detach(self):
+        """Cancels the task and drops its callbacks, so nothing it still produces reaches the UI."""
+        self.cancel_event.set()
+        self.on_item = None
+        self.on_done = None
+
+    def _run(self):
+        try:
+            result = self.work(lambda item: self._queue.put(("item", item)), self.cancel_event)
+            self._queue.put(("done", (result, None)))
+        except Exception as e:
+            self._queue.put(("done", (None, e)))
+
+    def _poll(self):
+        # Handle a bounded number of items per tick so rendering never starves the UI
+        for _ in range(self.max_items_per_poll):
+            try:
+                kind, payload = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "item":
+                if self.on_item and not self.cancel_event.is_set():
+                    self.on_item(payload)
+            else:
+                self._finished = True
+                if self.on_done:
+                    self.on_done(*payload)
+                return
+        self.widget.after(self.poll_ms, self._poll)
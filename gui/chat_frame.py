@@ -1,10 +1,27 @@
+import queue
 import tkinter as tk
 from tkinter import messagebox, scrolledtext
+from gui.background import BackgroundTask
+
+# Messages fetched (and decrypted) per page
+PAGE_SIZE = 20
+# Scrolling below this fraction of the text loads the next page
+LOAD_MORE_AT = 0.95
+# How often mail pushed by the inbox watcher is rendered
+NEW_MAIL_POLL_MS = 100
 
 class ChatFrame(tk.Frame):
     def __init__(self, parent, controller):
         super().__init__(parent)
         self.controller = controller
+        self.current_user = None
+        self.inbox_task = None
+        self.loaded_count = 0
+        self.has_more = False
+        self.displayed_ids = set()
+        self.watcher = None
+        # Filled by the watcher thread, drained on the Tk thread
+        self._new_mail = queue.Queue()
         
         # Header
         self.lbl_welcome = tk.Label(self, text="Welcome", font=("Arial", 14))
@@ -14,12 +31,19 @@ class ChatFrame(tk.Frame):
         top_frame = tk.Frame(self)
         top_frame.pack(fill=tk.X, padx=10)
         tk.Button(top_frame, text="Refresh Inbox", command=self.load_messages).pack(side=tk.LEFT)
+        self.btn_cancel = tk.Button(top_frame, text="Cancel", command=self.cancel_loading, state='disabled')
+        self.btn_cancel.pack(side=tk.LEFT, padx=5)
+        self.lbl_progress = tk.Label(top_frame, text="")
+        self.lbl_progress.pack(side=tk.LEFT, padx=5)
         tk.Button(top_frame, text="Logout", command=self.controller.logout).pack(side=tk.RIGHT)
 
         # Messages Area
         tk.Label(self, text="Inbox:").pack(anchor=tk.W, padx=10, pady=(10,0))
         self.txt_display = scrolledtext.ScrolledText(self, height=10, state='disabled')
         self.txt_display.pack(padx=10, pady=5, fill=tk.BOTH, expand=True)
+        self.txt_display.config(yscrollcommand=self._on_scroll)
+        self.btn_more = tk.Button(self, text="Load more", command=self.load_next_page, state='disabled')
+        self.btn_more.pack(padx=10, anchor=tk.E)
 
         # Send Area
         send_frame = tk.Frame(self, bd=1, relief=tk.SUNKEN)
@@ -33,29 +57,139 @@ class ChatFrame(tk.Frame):
         self.entry_msg = tk.Entry(send_frame)
         self.entry_msg.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
         
-        tk.Button(send_frame, text="Send", command=self.send_msg).pack(side=tk.LEFT, padx=5)
+        self.btn_send = tk.Button(send_frame, text="Send", command=self.send_msg)
+        self.btn_send.pack(side=tk.LEFT, padx=5)
+        self.after(NEW_MAIL_POLL_MS, self._drain_new_mail)
 
     def set_user(self, user_obj):
+        self.stop_watching()
         self.current_user = user_obj
         self.lbl_welcome.config(text=f"User: {user_obj['username']}")
         self.load_messages()
 
+        # New mail is pushed in as it arrives, no refresh needed
+        messenger = self.controller.messenger
+        def on_new_packets(entries):
+            # Watcher thread: decrypt/verify here so the Tk thread only renders
+            for message_id, _ in entries:
+                self._new_mail.put((user_obj["username"], messenger.open_message(user_obj, message_id)))
+        self.watcher = messenger.watch_inbox(user_obj, on_new_packets)
+
+    def stop_watching(self):
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+
     def load_messages(self):
+        # Only one inbox load at a time: a load still running is abandoned, not waited for
+        if self.inbox_task:
+            self.inbox_task.detach()
+            self.inbox_task = None
+        self.btn_cancel.config(state='disabled')
+
         # Clear display
         self.txt_display.config(state='normal')
         self.txt_display.delete(1.0, tk.END)
-        
-        # Fetch from core logic
-        msgs = self.controller.messenger.check_inbox(self.current_user)
-        
-        if not msgs:
-            self.txt_display.insert(tk.END, "No messages.\n")
+        self.txt_display.config(state='disabled')
+        self.loaded_count = 0
+        self.displayed_ids.clear()
+        self.has_more = True
+        self.load_next_page()
+
+    def load_next_page(self):
+        """Lists the next PAGE_SIZE headers and opens only those messages."""
+        if not self.has_more or (self.inbox_task and self.inbox_task.running):
+            return
+        self.lbl_progress.config(text="Loading inbox...")
+        self.btn_cancel.config(state='normal')
+        self.btn_more.config(state='disabled')
+
+        messenger = self.controller.messenger
+        user = self.current_user
+        offset = self.loaded_count
+
+        # Runs on the worker thread: decrypt/verify the page and stream entries back
+        def work(emit, cancel_event):
+            headers = messenger.list_inbox(user, offset, PAGE_SIZE)
+            for header in headers:
+                if cancel_event.is_set():
+                    break
+                emit(messenger.open_message(user, header["id"]))
+            return len(headers)
+
+        task = BackgroundTask(self, work, on_item=self._render_message,
+                              on_done=lambda count, error: self._inbox_loaded(task, count, error))
+        self.inbox_task = task.start()
+
+    def cancel_loading(self):
+        if self.inbox_task and self.inbox_task.running:
+            self.inbox_task.cancel()
+            self.lbl_progress.config(text="Cancelled.")
+            self.btn_cancel.config(state='disabled')
+
+    def _on_scroll(self, first, last):
+        self.txt_display.vbar.set(first, last)
+        # Also fires while a short page is rendered, so the view fills itself up
+        if float(last) >= LOAD_MORE_AT and self.has_more:
+            self.after_idle(self.load_next_page)
+
+    def _render_message(self, m, position=tk.END):
+        # A message pushed by the watcher may show up again in a page fetched meanwhile
+        if m.get("id") in self.displayed_ids:
+            return False
+        self.txt_display.config(state='normal')
+        if not self.displayed_ids:
+            # Drop a "No messages." placeholder
+            self.txt_display.delete(1.0, tk.END)
+        self.displayed_ids.add(m.get("id"))
+        # Pages are newest first, so every displayed message moves the next page's offset by one
+        self.loaded_count += 1
+        if m.get("rejected"):
+            # Duplicate/replayed packet: it still occupies a position in the listing
+            self.txt_display.config(state='disabled')
+            return False
+        self.lbl_progress.config(text=f"Loaded {self.loaded_count}")
+        if "error" in m:
+            display_str = f"From: {m['sender']} | ERROR: {m['error']}\n{'-'*30}\n"
         else:
-            for m in msgs:
-                display_str = f"From: {m['sender']} | {m['status']}\nContent: {m['content']}\n{'-'*30}\n"
-                self.txt_display.insert(tk.END, display_str)
-        
+            display_str = f"From: {m['sender']} | {m['status']}\nContent: {m['content']}\n{'-'*30}\n"
+        self.txt_display.insert(position, display_str)
         self.txt_display.config(state='disabled')
+        return True
+
+    def _drain_new_mail(self):
+        while True:
+            try:
+                username, m = self._new_mail.get_nowait()
+            except queue.Empty:
+                break
+            if not self.current_user or username != self.current_user["username"]:
+                continue
+            if self._render_message(m, position="1.0"):
+                self.lbl_progress.config(text=f"New message from {m['sender']}")
+        self.after(NEW_MAIL_POLL_MS, self._drain_new_mail)
+
+    def _inbox_loaded(self, task, count, error):
+        # A newer refresh has replaced this one
+        if task is not self.inbox_task:
+            return
+        self.btn_cancel.config(state='disabled')
+        if error:
+            self.lbl_progress.config(text="")
+            messagebox.showerror("Error", f"Failed to load inbox: {error}")
+        elif task.cancel_event.is_set():
+            self.lbl_progress.config(text="Cancelled.")
+            self.btn_more.config(state='normal')
+        elif not count and not self.loaded_count:
+            self.has_more = False
+            self.lbl_progress.config(text="")
+            self.txt_display.config(state='normal')
+            self.txt_display.insert(tk.END, "No messages.\n")
+            self.txt_display.config(state='disabled')
+        else:
+            self.has_more = count == PAGE_SIZE
+            self.btn_more.config(state='normal' if self.has_more else 'disabled')
+            self.lbl_progress.config(text=f"{self.loaded_count} messages" + (" (more below)" if self.has_more else ""))
 
     def send_msg(self):
         recipient = self.entry_recipient.get()
@@ -64,10 +198,23 @@ class ChatFrame(tk.Frame):
         if not recipient or not content:
             return
 
-        success, msg = self.controller.messenger.send_message(self.current_user, recipient, content)
-        
-        if success:
-            messagebox.showinfo("Sent", msg)
-            self.entry_msg.delete(0, tk.END)
-        else:
-            messagebox.showerror("Error", msg)
\ No newline at end of file
+        messenger = self.controller.messenger
+        user = self.current_user
+        self.btn_send.config(state='disabled')
+
+        def work(emit, cancel_event):
+            return messenger.send_message(user, recipient, content)
+
+        def on_done(result, error):
+            self.btn_send.config(state='normal')
+            if error:
+                messagebox.showerror("Error", str(error))
+                return
+            success, msg = result
+            if success:
+                messagebox.showinfo("Sent", msg)
+                self.entry_msg.delete(0, tk.END)
+            else:
+                messagebox.showerror("Error", msg)
+
+        BackgroundTask(self, work, on_done=on_done).start()
@@ -1,41 +1,112 @@
 import tkinter as tk
 from tkinter import scrolledtext
+from collections import deque
 import datetime
 
+# Events kept in memory (searchable) vs. lines kept in the Text widget
+MAX_STORED_EVENTS = 100000
+MAX_VISIBLE_LINES = 4000
+# Events arriving within one frame are rendered with a single insert
+FRAME_MS = 50
+
 class MonitorWindow(tk.Toplevel):
     def __init__(self, parent):
         super().__init__(parent)
         self.title("Cryptographic Workflow Monitor")
         self.geometry("500x600")
-        
+
         # Make sure checking this window doesn't close the main app, just hides it
-        self.protocol("WM_DELETE_WINDOW", self.withdraw)
+        self.protocol("WM_DELETE_WINDOW", parent.hide_monitor)
 
-        tk.Label(self, text="Real-Time Cryptographic Operations", 
+        tk.Label(self, text="Real-Time Cryptographic Operations",
                  font=("Courier New", 12, "bold"), bg="black", fg="#00ff00").pack(fill=tk.X)
 
+        # Filter box (searches the stored events, not the Text widget)
+        filter_frame = tk.Frame(self, bg="black")
+        filter_frame.pack(fill=tk.X)
+        tk.Label(filter_frame, text="Filter:", bg="black", fg="#00ff00").pack(side=tk.LEFT, padx=5)
+        self.filter_var = tk.StringVar()
+        self.filter_var.trace_add("write", lambda *_: self._schedule_refilter())
+        tk.Entry(filter_frame, textvariable=self.filter_var).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+
         # Scrolled Text Area for logs
         self.log_area = scrolledtext.ScrolledText(self, state='disabled', bg="black", fg="#00ff00", font=("Consolas", 10))
         self.log_area.pack(expand=True, fill=tk.BOTH)
 
+        # Styling tags (configured once)
+        self.log_area.tag_config("header", foreground="cyan", font=("Consolas", 10, "bold"))
+        self.log_area.tag_config("body", foreground="#00ff00")
+        self.log_area.tag_config("separator", foreground="gray")
+
+        self.stored_events = deque(maxlen=MAX_STORED_EVENTS)
+        self._pending = []
+        self._flush_job = None
+        self._refilter_job = None
+
     def log_event(self, title, details):
-        """Adds a new event to the monitor window."""
+        """Adds a new event to the monitor window (rendered on the next frame)."""
         timestamp = datetime.datetime.now().strftime("%H:%M:%S")
-        
+        event = (timestamp, title, details)
+        self.stored_events.append(event)
+        if self._matches(event, self.filter_var.get().lower()):
+            self._pending.append(event)
+            if self._flush_job is None:
+                self._flush_job = self.after(FRAME_MS, self._flush)
+
+    def _matches(self, event, needle):
+        if not needle:
+            return True
+        _, title, details = event
+        return needle in title.lower() or needle in details.lower()
+
+    def _render(self, events):
+        """Inserts events with one Text.insert call, trims old lines, scrolls once."""
+        args = []
+        for timestamp, title, details in events:
+            args += [f"\n[{timestamp}] === {title} ===\n", "header",
+                     f"{details}\n", "body",
+                     "-"*40 + "\n", "separator"]
+        if not args:
+            return
         self.log_area.config(state='normal')
-        
-        # Insert Header
-        self.log_area.insert(tk.END, f"\n[{timestamp}] === {title} ===\n", "header")
-        
-        # Insert Details
-        self.log_area.insert(tk.END, f"{details}\n", "body")
-        self.log_area.insert(tk.END, "-"*40 + "\n", "separator")
-        
+        self.log_area.insert(tk.END, *args)
+
+        # Keep the widget bounded: drop the oldest lines
+        line_count = int(self.log_area.index("end-1c").split(".")[0])
+        if line_count > MAX_VISIBLE_LINES:
+            self.log_area.delete("1.0", f"{line_count - MAX_VISIBLE_LINES + 1}.0")
+
         # Auto-scroll to bottom
         self.log_area.see(tk.END)
         self.log_area.config(state='disabled')
-        
-        # Styling tags
-        self.log_area.tag_config("header", foreground="cyan", font=("Consolas", 10, "bold"))
-        self.log_area.tag_config("body", foreground="#00ff00")
-        self.log_area.tag_config("separator", foreground="gray")
\ No newline at end of file
+
+    def _flush(self):
+        self._flush_job = None
+        events, self._pending = self._pending, []
+        self._render(events)
+
+    def _schedule_refilter(self):
+        # Debounce typing in the filter box
+        if self._refilter_job is not None:
+            self.after_cancel(self._refilter_job)
+        self._refilter_job = self.after(150, self._refilter)
+
+    def _refilter(self):
+        """Re-renders the newest matching stored events."""
+        self._refilter_job = None
+        needle = self.filter_var.get().lower()
+        matches = []
+        # Each event takes 4 lines, so this many events fill the widget
+        limit = MAX_VISIBLE_LINES // 4
+        for event in reversed(self.stored_events):
+            if self._matches(event, needle):
+                matches.append(event)
+                if len(matches) >= limit:
+                    break
+        matches.reverse()
+
+        self._pending = []
+        self.log_area.config(state='normal')
+        self.log_area.delete("1.0", tk.END)
+        self.log_area.config(state='disabled')
+        self._render(matches)
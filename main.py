@@ -1,6 +1,12 @@
 import sys
 
 def main():
+    # Any arguments switch to the scriptable, non-interactive CLI
+    # (e.g. python main.py inbox --user Daniel); see controllers/script_cli.py
+    if len(sys.argv) > 1:
+        from controllers.script_cli import run
+        sys.exit(run(sys.argv[1:]))
+
     print("=== Cryptology Project Launcher ===")
     print("1. Run CLI Mode")
     print("2. Run GUI Mode")
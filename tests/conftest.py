@@ -0,0 +1,12 @@
+import os
+import sys
+import pytest
+
+# The modules import each other from the repository root (core.*, crypto.*, utils)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Runs the test in an empty directory, since data/ paths are relative to the working directory."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,71 @@
+import os
+import pytest
+from crypto import gost, gost_tables, backends
+from crypto.backends import Backend, BACKENDS, REFERENCE, self_test, set_backend
+from crypto.elliptic_curve import G, scalar_mult, scalar_mult_fast
+
+# GOST with this project's S-box, key = 00 01 .. 1f (recorded from the reference implementation)
+KEY = bytes(range(32))
+BLOCK = bytes(range(8))
+BLOCK_CIPHERTEXT = bytes.fromhex("3ca0f53919383efa")
+CBC_PLAINTEXT = b"GOST 28147-89 known answer"
+CBC_CIPHERTEXT = bytes.fromhex("075128fbdf3b56fc3ba4a8d9ddadd53281fe2709ab515f9466010f3b4d8f0186")
+
+
+@pytest.fixture
+def restore_backend():
+    active = backends._active
+    yield
+    backends._active = active
+
+
+def test_reference_known_answers():
+    subkeys = gost._generate_subkeys(KEY)
+    assert gost._encrypt_block(BLOCK, subkeys) == BLOCK_CIPHERTEXT
+    assert gost.encrypt_cbc(CBC_PLAINTEXT, KEY, bytes(8)) == CBC_CIPHERTEXT
+
+def test_table_gost_known_answers():
+    subkeys = gost._generate_subkeys(KEY)
+    assert gost_tables.encrypt_block(BLOCK, subkeys) == BLOCK_CIPHERTEXT
+    assert gost_tables.decrypt_block(BLOCK_CIPHERTEXT, subkeys) == BLOCK
+    assert gost_tables.encrypt_cbc(CBC_PLAINTEXT, KEY, bytes(8)) == CBC_CIPHERTEXT
+    assert gost_tables.decrypt_cbc(CBC_CIPHERTEXT, KEY, bytes(8)) == CBC_PLAINTEXT
+
+@pytest.mark.parametrize("size", [0, 1, 7, 8, 9, 64, 1000])
+def test_table_gost_matches_reference(size):
+    key, iv, data = os.urandom(32), os.urandom(8), os.urandom(size)
+    ciphertext = gost.encrypt_cbc(data, key, iv)
+    assert gost_tables.encrypt_cbc(data, key, iv) == ciphertext
+    assert gost_tables.decrypt_cbc(ciphertext, key, iv) == data
+    assert gost.decrypt_cbc(ciphertext, key, iv) == data
+
+def test_table_gost_rejects_bad_input():
+    with pytest.raises(ValueError):
+        gost_tables.encrypt_cbc(b"x", bytes(16), bytes(8))
+    with pytest.raises(ValueError):
+        gost_tables.decrypt_cbc(bytes(12), KEY, bytes(8))
+
+@pytest.mark.parametrize("name", sorted(BACKENDS))
+def test_registered_backends_pass_self_test(name):
+    assert self_test(BACKENDS[name]) == []
+
+def test_batch_primitive_goes_through_the_active_backend(restore_backend):
+    point = scalar_mult(12345, G)
+    for name in sorted(BACKENDS):
+        set_backend(name)
+        assert backends.scalar_mult_many_active([3, 0, 7], point) == [scalar_mult(k, point) for k in (3, 0, 7)]
+
+def test_broken_backend_is_rejected(restore_backend):
+    reference = BACKENDS[REFERENCE]
+    # Off-by-one scalar multiplication, correct GOST
+    broken = Backend("broken", lambda k, point: scalar_mult_fast(k + 1, point), reference.point_add,
+                     reference.encrypt_block, reference.decrypt_block, reference.encrypt_cbc, reference.decrypt_cbc)
+    backends.register_backend(broken)
+    try:
+        assert self_test(broken)
+        with pytest.raises(ValueError):
+            set_backend("broken")
+        with pytest.raises(ValueError):
+            set_backend("no-such-backend")
+    finally:
+        BACKENDS.pop("broken")
@@ -0,0 +1,49 @@
+import os
+import zlib
+import lzma
+import pytest
+from core.compression import compress, decompress, COMPRESS_MIN_BYTES, ALGORITHMS
+
+TEXT = b"the quick brown fox jumps over the lazy dog " * 100
+
+
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_round_trip(algorithm):
+    payload, used = compress(TEXT, algorithm)
+    assert used == algorithm
+    assert len(payload) < len(TEXT)
+    assert decompress(payload, used) == TEXT
+
+def test_small_or_incompressible_data_is_sent_as_is():
+    small = b"x" * (COMPRESS_MIN_BYTES - 1)
+    assert compress(small) == (small, None)
+    noise = os.urandom(4096)
+    assert compress(noise) == (noise, None)
+    assert compress(TEXT, None) == (TEXT, None)
+
+def test_unknown_algorithm():
+    with pytest.raises(ValueError):
+        compress(TEXT, "brotli")
+    with pytest.raises(ValueError):
+        decompress(TEXT, "brotli")
+
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_limit_is_inclusive(algorithm):
+    payload, _ = compress(TEXT, algorithm)
+    assert decompress(payload, algorithm, limit=len(TEXT)) == TEXT
+    with pytest.raises(ValueError, match="size limit"):
+        decompress(payload, algorithm, limit=len(TEXT) - 1)
+
+@pytest.mark.parametrize("algorithm, pack", [("zlib", zlib.compress), ("lzma", lzma.compress)])
+def test_decompression_bomb_is_stopped(algorithm, pack):
+    # 64 MiB of zeros packs into a few kilobytes; decompression must stop at the limit
+    bomb = pack(bytes(64 * 1024 * 1024))
+    assert len(bomb) < 1024 * 1024
+    with pytest.raises(ValueError, match="size limit"):
+        decompress(bomb, algorithm, limit=1024 * 1024)
+
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_truncated_input_is_rejected(algorithm):
+    payload, _ = compress(TEXT, algorithm)
+    with pytest.raises((ValueError, lzma.LZMAError, zlib.error)):
+        decompress(payload[:len(payload) // 2], algorithm)
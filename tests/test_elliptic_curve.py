@@ -0,0 +1,102 @@
+import os
+import pytest
+from crypto.elliptic_curve import (G, P, ORDER, POINT_INFINITY, JACOBIAN_INFINITY, is_on_curve, point_add,
+                                   scalar_mult, scalar_mult_jacobian, scalar_mult_fast, scalar_mult_many_fast,
+                                   batch_to_affine, _jacobian_add, _jacobian_double,
+                                   precompute_base_table, scalar_mult_base, BASE_WINDOW)
+from crypto import dsa, ecdh
+
+# secp256k1 multiples of G (published values)
+G2 = (0xC6047F9441ED7D6D3045406E95C07CD85C778E4B8CEF3CA7ABAC09B95C709EE5,
+      0x1AE168FEA63DC339A3C58419466CEAEEF7F632653266D0E1236431A950CFE52A)
+G3 = (0xF9308A019258C31049344F85F89D5229B531C845836F99B08601F113BCE036F9,
+      0x388F7B0F632DE8140FE337E62A37F3566500A99934C2231B6CB9FD7584B8E672)
+
+def random_scalar():
+    return int.from_bytes(os.urandom(32), "big") % ORDER or 1
+
+def to_jacobian(point, z):
+    """The affine point with Jacobian coordinate Z = z."""
+    x, y = point
+    return (x * z * z % P, y * z * z * z % P, z)
+
+
+def test_reference_known_answers():
+    assert scalar_mult(1, G) == G
+    assert scalar_mult(2, G) == G2
+    assert scalar_mult(3, G) == G3
+
+def test_jacobian_matches_reference():
+    for k in (1, 2, 3, random_scalar(), ORDER - 1):
+        assert batch_to_affine([scalar_mult_jacobian(k, G)])[0] == scalar_mult(k, G)
+    assert batch_to_affine([_jacobian_double((G[0], G[1], 1))])[0] == G2
+    assert batch_to_affine([_jacobian_add((G[0], G[1], 1), to_jacobian(G2, 5))])[0] == G3
+
+def test_jacobian_edge_cases():
+    minus_g = (G[0], P - G[1])
+    assert scalar_mult(ORDER - 1, G) == minus_g
+    assert _jacobian_add((G[0], G[1], 1), (minus_g[0], minus_g[1], 1))[2] == 0
+    assert scalar_mult_jacobian(0, G) == JACOBIAN_INFINITY
+    assert scalar_mult_jacobian(ORDER, G) == JACOBIAN_INFINITY
+    assert scalar_mult_fast(ORDER, G2) is POINT_INFINITY
+
+def test_batch_to_affine_handles_mixed_z_and_infinity():
+    points = [G, G2, G3, scalar_mult(random_scalar(), G)]
+    jacobian = [to_jacobian(point, z) for point, z in zip(points, (1, 7, P - 2, 123456789))]
+    assert batch_to_affine(jacobian[:2] + [JACOBIAN_INFINITY] + jacobian[2:]) == points[:2] + [POINT_INFINITY] + points[2:]
+    assert batch_to_affine([]) == []
+
+def test_scalar_mult_many_matches_reference():
+    point = scalar_mult(random_scalar(), G)
+    scalars = [random_scalar() for _ in range(5)] + [0, 1]
+    assert scalar_mult_many_fast(scalars, point) == [scalar_mult(k, point) for k in scalars]
+    assert scalar_mult_many_fast(scalars, G) == [scalar_mult(k, G) for k in scalars]
+    assert point_add(scalar_mult(2, point), point) == scalar_mult_fast(3, point)
+
+def test_generate_keys_batch():
+    for generate in (ecdh.generate_keys_batch, dsa.generate_keys_batch):
+        pairs = generate(4)
+        assert len(pairs) == 4
+        for private_key, public_key in pairs:
+            assert 0 < private_key < ORDER
+            assert is_on_curve(public_key)
+            assert public_key == scalar_mult(private_key, G)
+
+def test_batch_keys_work_for_ecdh_and_dsa():
+    (a_priv, a_pub), (b_priv, b_pub) = ecdh.generate_keys_batch(2)
+    assert ecdh.compute_shared_secret(a_priv, b_pub) == ecdh.compute_shared_secret(b_priv, a_pub)
+    (priv, pub), = dsa.generate_keys_batch(1)
+    signature = dsa.sign_message(priv, b"message")
+    assert dsa.verify_signature(pub, b"message", signature)
+    assert not dsa.verify_signature(pub, b"messagf", signature)
+
+def test_fixed_base_table():
+    table = precompute_base_table()
+    assert precompute_base_table() is table
+    assert len(table) == (ORDER.bit_length() + BASE_WINDOW - 1) // BASE_WINDOW
+    assert all(len(row) == (1 << BASE_WINDOW) - 1 and all(z == 1 for _, _, z in row) for row in table)
+    assert table[0][0][:2] == G and table[0][1][:2] == G2 and table[0][2][:2] == G3
+    assert table[1][0][:2] == scalar_mult(1 << BASE_WINDOW, G)
+
+@pytest.mark.parametrize("k", [1, 2, 15, 16, 17, 255, 256, 1 << 255, ORDER - 1, ORDER + 5])
+def test_scalar_mult_base_matches_reference(k):
+    assert scalar_mult_base(k) == scalar_mult(k % ORDER, G)
+
+def test_scalar_mult_base_random_and_zero():
+    for _ in range(5):
+        k = random_scalar()
+        assert scalar_mult_base(k) == scalar_mult(k, G)
+        assert scalar_mult_fast(k, G) == scalar_mult(k, G)
+    assert scalar_mult_base(0) is POINT_INFINITY
+    assert scalar_mult_base(ORDER) is POINT_INFINITY
+
+def test_register_many(workdir):
+    from core.user_manager import UserManager
+    manager = UserManager()
+    results = manager.register_many([("alice", "pw1"), ("bob", "pw2"), ("alice", "pw3")])
+    assert [(name, ok) for name, ok, _ in results] == [("alice", True), ("bob", True), ("alice", False)]
+
+    # Keys survive the single users.json write and decrypt with each password
+    user, _ = UserManager().login("bob", "pw2")
+    assert scalar_mult(user["ecdh_priv"], G) == tuple(manager.get_public_keys("bob")["ecdh"])
+    assert scalar_mult(user["dsa_priv"], G) == tuple(manager.get_public_keys("bob")["dsa"])
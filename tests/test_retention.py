@@ -0,0 +1,148 @@
+import os
+import json
+import threading
+import pytest
+from core import transport as transport_module
+from core.transport import FileTransport
+from core.retention import RetentionPolicy, Compactor, GarbageCollector, KEEP_ALL
+from core.events import EventLog, CallbackSubscriber
+
+
+def make_packet(i, recipient="bob", timestamp=None):
+    return {"sender": "alice", "recipient": recipient, "timestamp": 1000.0 + i if timestamp is None else timestamp,
+            "iv": f"{i:016x}", "ciphertext": f"{i % 256:02x}" * 8}
+
+def deliver(transport, count, start=0, recipient="bob"):
+    for i in range(start, start + count):
+        transport.deliver(make_packet(i, recipient))
+    return [header["id"] for header in transport.headers(recipient)][-count:]
+
+def live_files(transport):
+    return sorted(name for name in os.listdir(transport.messages_dir) if name.endswith(".msg"))
+
+def segments(transport, username="bob"):
+    directory = os.path.join(transport.archive_dir, username)
+    return sorted(name for name in os.listdir(directory) if name.endswith(".seg")) if os.path.isdir(directory) else []
+
+def segment_ids(transport, username="bob"):
+    with open(transport._segments_path(username)) as f:
+        return [message_id for line in f for message_id in json.loads(line)["ids"]]
+
+
+# FileTransport.archive / expire
+# ======================================================
+
+def test_archive_keeps_messages_readable(tmp_path):
+    transport = FileTransport(str(tmp_path))
+    ids = deliver(transport, 5)
+    assert transport.archive("bob", ids[:3]) == 3
+    assert live_files(transport) == sorted(ids[3:])
+    assert segments(transport) == ["00000001.seg"]
+    for i, message_id in enumerate(ids):
+        assert transport.get_packet("bob", message_id) == make_packet(i)
+    # Already archived (or missing) ids are skipped
+    assert transport.archive("bob", ids[:3] + ["bob_missing.msg"]) == 0
+    assert transport.archive("bob", ids[3:], algorithm="zlib") == 2
+    assert segments(transport) == ["00000001.seg", "00000002.seg"]
+    assert sorted(segment_ids(transport)) == sorted(ids)
+
+def test_archive_rechecks_under_the_lock(tmp_path, monkeypatch):
+    first, second = FileTransport(str(tmp_path)), FileTransport(str(tmp_path))
+    ids = deliver(first, 3)
+    pack = transport_module._pack_segment
+
+    def pack_while_another_run_archives(packets, algorithm):
+        # The other compaction archives two of the messages after this one has read them
+        monkeypatch.setattr(transport_module, "_pack_segment", pack)
+        assert second.archive("bob", ids[:2]) == 2
+        return pack(packets, algorithm)
+
+    monkeypatch.setattr(transport_module, "_pack_segment", pack_while_another_run_archives)
+    assert first.archive("bob", ids) == 1
+    assert sorted(segment_ids(first)) == sorted(ids)
+    assert live_files(first) == []
+    for i, message_id in enumerate(ids):
+        assert first.get_packet("bob", message_id) == make_packet(i)
+
+def test_concurrent_archives_never_share_a_segment(tmp_path):
+    # Two transports stand in for the GUI's GarbageCollector and `main.py gc`
+    transports = [FileTransport(str(tmp_path)), FileTransport(str(tmp_path))]
+    ids = deliver(transports[0], 40)
+    barrier = threading.Barrier(2, timeout=10)
+    errors = []
+
+    def run(transport, mine):
+        try:
+            for message_id in mine:
+                barrier.wait()
+                transport.archive("bob", [message_id])
+        except Exception as e:
+            errors.append(e)
+            barrier.abort()
+
+    threads = [threading.Thread(target=run, args=(transport, ids[k::2])) for k, transport in enumerate(transports)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert len(segments(transports[0])) == 40
+    assert sorted(segment_ids(transports[0])) == sorted(ids)
+    for i, message_id in enumerate(ids):
+        assert FileTransport(str(tmp_path)).get_packet("bob", message_id) == make_packet(i)
+
+def test_expire(tmp_path):
+    transport = FileTransport(str(tmp_path))
+    ids = deliver(transport, 4)
+    transport.mark_read("bob", ids)
+    transport.archive("bob", ids[:2])
+
+    # A partly expired segment stays until its last message expires
+    assert transport.expire("bob", [ids[0], ids[2]]) == 2
+    assert segments(transport) == ["00000001.seg"]
+    assert transport.get_packet("bob", ids[2]) is None
+    assert transport.get_packet("bob", ids[1]) == make_packet(1)
+    assert [h["id"] for h in transport.headers("bob")] == [ids[1], ids[3]]
+    assert transport.read_ids("bob") == {ids[1], ids[3]}
+
+    assert transport.expire("bob", [ids[1]]) == 1
+    assert segments(transport) == []
+    assert live_files(transport) == [ids[3]]
+    assert transport.expire("bob", []) == 0
+
+
+# Retention policies and the compactor
+# ======================================================
+
+def test_retention_policy():
+    headers = [{"id": f"m{i}", "timestamp": 100.0 * i} for i in range(5)]
+    assert KEEP_ALL.expired(headers, now=1000.0) == set()
+    assert RetentionPolicy(max_count=2).expired(headers, now=1000.0) == {"m0", "m1", "m2"}
+    assert RetentionPolicy(max_age=750).expired(headers, now=1000.0) == {"m0", "m1", "m2"}
+    assert RetentionPolicy(max_age=950, max_count=4).expired(headers, now=1000.0) == {"m0"}
+
+def test_compactor_archives_read_mail_and_applies_retention(tmp_path):
+    transport = FileTransport(str(tmp_path))
+    ids = deliver(transport, 5)
+    deliver(transport, 1, start=10, recipient="carol")
+    transport.mark_read("bob", ids[1:4])
+
+    compactor = Compactor(transport, policies={"bob": RetentionPolicy(max_count=4)}, segment_size=2)
+    stats = compactor.run_once(now=2000.0)
+    # The oldest message expires; the other read ones go to segments of at most two
+    assert stats == {"bob": {"expired": 1, "archived": 3}, "carol": {"expired": 0, "archived": 0}}
+    assert segments(transport) == ["00000001.seg", "00000002.seg"]
+    assert sorted(live_files(transport)) == sorted([ids[4]] + [h["id"] for h in transport.headers("carol")])
+    assert [h["id"] for h in transport.headers("bob")] == ids[1:]
+    assert compactor.run_once(now=2000.0)["bob"] == {"expired": 0, "archived": 0}
+
+def test_garbage_collector_reports_failures():
+    class Broken:
+        def run_once(self):
+            raise OSError("disk full")
+
+    events = []
+    log = EventLog()
+    log.subscribe(CallbackSubscriber(lambda title, details: events.append((title, details))))
+    assert GarbageCollector(Broken(), events=log).run_now() is None
+    assert events == [("GC ERROR", "Compaction failed: disk full")]
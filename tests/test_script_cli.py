@@ -0,0 +1,27 @@
+import json
+from controllers.script_cli import run
+
+
+def output(capsys):
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+def test_import_users_reports_malformed_rows(workdir, capsys):
+    (workdir / "users.csv").write_text("username,password\nalice,pw\nbob\n,pw\ncarol,pw\n")
+    assert run(["import-users", "users.csv"]) == 1
+    lines = output(capsys)
+    assert [line["line"] for line in lines if "line" in line] == [3, 4]
+    assert [(line["user"], line["ok"]) for line in lines if "user" in line] == [("alice", True), ("carol", True)]
+
+def test_send_reports_malformed_lines_and_sends_the_rest(workdir, capsys):
+    run(["register", "alice", "pw"])
+    run(["register", "bob", "pw"])
+    capsys.readouterr()
+    (workdir / "jobs.jsonl").write_text('{"to": "bob", "message": "one"}\n{not json\n\n{"to": "bob"}\n[1]\n'
+                                        '{"to": "bob", "message": "two"}\n')
+    assert run(["send", "--user", "alice", "--password", "pw", "--file", "jobs.jsonl"]) == 1
+    lines = output(capsys)
+    assert [(line["line"], line["ok"]) for line in lines if "line" in line] == [(2, False), (4, False), (5, False)]
+    assert [line["ok"] for line in lines if "to" in line] == [True, True]
+
+    assert run(["inbox", "--user", "bob", "--password", "pw"]) == 0
+    assert [line["content"] for line in output(capsys)] == ["one", "two"]
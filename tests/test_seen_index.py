@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import sqlite3
+import types
+import pytest
+from core.seen_index import (BloomFilter, SeenIndex, message_id_for, SEEN_WINDOW,
+                             NEW, SEEN, DUPLICATE, STALE, INVALID)
+
+
+def make_packet(i, timestamp=None):
+    packet = {"sender": "alice", "recipient": "bob", "timestamp": time.time() if timestamp is None else timestamp,
+              "iv": f"{i:016x}", "ciphertext": "00" * 16}
+    packet["message_id"] = message_id_for(packet)
+    return packet
+
+@pytest.fixture
+def index(tmp_path):
+    index = SeenIndex(str(tmp_path / "seen.sqlite"))
+    yield index
+    index.close()
+
+
+def test_message_id():
+    packet = make_packet(1)
+    assert len(packet["message_id"]) == 32
+    # The id depends on the fields that decryption and authentication depend on, not on the timestamp
+    assert message_id_for(dict(packet, timestamp=0)) == packet["message_id"]
+    assert message_id_for(dict(packet, ciphertext="01" * 16)) != packet["message_id"]
+    assert message_id_for(dict(packet, recipient="carol")) != packet["message_id"]
+
+def test_bloom_filter():
+    bloom = BloomFilter(bits=1 << 16, hashes=7)
+    keys = [f"key-{i}" for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    # ~9.6 bits per key and 7 hashes: about 1% false positives
+    false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+    assert false_positives < 300
+
+def test_verdicts(index):
+    packet = make_packet(1)
+    assert index.check("bob", packet, "bob_1.msg") == NEW
+    assert index.check("bob", packet, "bob_1.msg") == SEEN
+    assert index.check("bob", packet, "bob_2.msg") == DUPLICATE
+    # Per recipient
+    assert index.check("carol", packet, "carol_1.msg") == NEW
+    assert index.check("bob", dict(packet, message_id="0" * 32), "bob_3.msg") == INVALID
+    assert index.check("bob", make_packet(2, timestamp=time.time() - SEEN_WINDOW - 60), "bob_4.msg") == STALE
+
+def test_check_many_and_persistence(index, tmp_path):
+    packets = [make_packet(i) for i in range(5)]
+    assert index.check_many("bob", [(p, f"bob_{i}.msg") for i, p in enumerate(packets)]) == [NEW] * 5
+    # A second process sees the committed entries
+    other = SeenIndex(index.path)
+    try:
+        assert other.check_many("bob", [(p, f"bob_{i}.msg") for i, p in enumerate(packets)]) == [SEEN] * 5
+        assert other.check("bob", packets[0], "bob_copy.msg") == DUPLICATE
+    finally:
+        other.close()
+
+def test_expire(index):
+    now = time.time()
+    old, recent = make_packet(1), make_packet(2)
+    index.check("bob", old, "bob_1.msg", now=now - SEEN_WINDOW - 60)
+    index.check("bob", recent, "bob_2.msg", now=now)
+    assert index.expire(now) == 1
+    assert index.expire(now) == 0
+    assert index.check("bob", recent, "bob_copy.msg", now=now) == DUPLICATE
+    # The forgotten id is new again (and only accepted because its packet is recent)
+    assert index.check("bob", old, "bob_1.msg", now=now) == NEW
+
+def test_compactor_expires_the_index(workdir):
+    from core.retention import Compactor, GarbageCollector
+    from core.transport import FileTransport
+    from core.events import EventLog
+    path = os.path.join("data", "seen.sqlite")
+    index = SeenIndex(path)
+    index.check("bob", make_packet(1), "bob_1.msg", now=time.time() - SEEN_WINDOW - 60)
+    index.close()
+
+    compactor = Compactor(FileTransport(), seen_index=path)
+    assert GarbageCollector(compactor, events=EventLog()).run_now() == {}
+    with sqlite3.connect(path) as db:
+        assert db.execute("SELECT COUNT(*) FROM seen").fetchone() == (0,)
+    assert compactor.expire_seen() == 0
+    assert Compactor(FileTransport()).expire_seen() == 0
+
+
+# Signed timestamps (the STALE check must not trust an unsigned field)
+# ======================================================
+
+@pytest.fixture
+def users(workdir):
+    from core.user_manager import UserManager
+    manager = UserManager()
+    manager.register_many([("alice", "pw"), ("bob", "pw")])
+    return manager, manager.login("alice", "pw")[0], manager.login("bob", "pw")[0]
+
+def write_packet(packet, name):
+    with open(os.path.join("data", "messages", name), "w") as f:
+        json.dump(packet, f)
+
+def only_packet():
+    name, = [name for name in os.listdir(os.path.join("data", "messages")) if name.endswith(".msg")]
+    with open(os.path.join("data", "messages", name)) as f:
+        return name, json.load(f)
+
+def test_replay_with_a_fresh_timestamp_is_rejected(users):
+    from core.secure_messenger import SecureMessenger
+    manager, alice, bob = users
+    SecureMessenger(manager, inbox_workers=0, sessions=False).send_message(alice, "bob", "hello")
+    name, packet = only_packet()
+    assert packet["sig_format"] == 2
+
+    reader = SecureMessenger(manager, inbox_workers=0, seen_index=None)
+    assert [m["status"] for m in reader.check_inbox(bob)] == ["Verified"]
+    os.remove(os.path.join("data", "messages", name))
+    write_packet(dict(packet, timestamp=packet["timestamp"] + 3600), "bob_replayed.msg")
+    assert [m["status"] for m in reader.check_inbox(bob)] == ["FAKE/TAMPERED"]
+
+def test_legacy_signatures(users):
+    from core.secure_messenger import SecureMessenger, LEGACY_SIGNATURES_UNTIL
+    from crypto.dsa import sign_message
+    manager, alice, bob = users
+    SecureMessenger(manager, inbox_workers=0, sessions=False).send_message(alice, "bob", "hello")
+    name, packet = only_packet()
+    os.remove(os.path.join("data", "messages", name))
+
+    # Text-only signature, as written before format 2
+    legacy = {k: v for k, v in packet.items() if k != "sig_format"}
+    legacy["signature"] = list(sign_message(alice["dsa_priv"], b"hello"))
+    reader = SecureMessenger(manager, inbox_workers=0, seen_index=None)
+    write_packet(dict(legacy, timestamp=LEGACY_SIGNATURES_UNTIL - 60), "bob_1.msg")
+    assert [m["status"] for m in reader.check_inbox(bob)] == ["Verified"]
+    write_packet(dict(legacy, timestamp=LEGACY_SIGNATURES_UNTIL + 60), "bob_1.msg")
+    assert [m["status"] for m in reader.check_inbox(bob)] == ["FAKE/TAMPERED"]
+
+def test_old_entry_recorded_by_another_process_is_not_stale(index):
+    now = time.time()
+    packet = make_packet(1)
+    other = SeenIndex(index.path)
+    try:
+        # This process builds its Bloom filter before the other one records the packet
+        assert index.check("bob", make_packet(2), "bob_2.msg", now=now) == NEW
+        assert other.check("bob", packet, "bob_1.msg", now=now) == NEW
+        later = now + SEEN_WINDOW + 60
+        assert index.check("bob", packet, "bob_1.msg", now=later) == SEEN
+        assert index.check("bob", packet, "bob_copy.msg", now=later) == DUPLICATE
+    finally:
+        other.close()
+
+def test_old_packets_stored_by_the_transport_are_not_stale(index):
+    old = make_packet(1, timestamp=time.time() - SEEN_WINDOW - 60)
+    assert index.check("bob", old, "bob_1.msg", stored={"bob_1.msg"}) == NEW
+    assert index.check("bob", old, "bob_1.msg") == SEEN
+    assert index.check("bob", make_packet(2, timestamp=old["timestamp"]), "bob_2.msg", stored={"bob_1.msg"}) == STALE
+
+def test_expire_keeps_entries_of_stored_messages(index):
+    now = time.time()
+    index.check("bob", make_packet(1), "bob_1.msg", now=now - SEEN_WINDOW - 60)
+    index.check("bob", make_packet(2), "bob_2.msg", now=now - SEEN_WINDOW - 60)
+    assert index.expire(now, keep={"bob": {"bob_1.msg"}}) == 1
+    assert index.check("bob", make_packet(1), "bob_copy.msg", now=now) == DUPLICATE
+    # Kept entries are refreshed, not re-examined on every run
+    assert index.expire(now + 60, keep={}) == 0
+
+
+def send_at(manager, sender, recipient, text, timestamp, monkeypatch):
+    """Sends a message whose (signed) timestamp lies in the past."""
+    from core import secure_messenger
+    from core.secure_messenger import SecureMessenger
+    with monkeypatch.context() as patch:
+        patch.setattr(secure_messenger, "time", types.SimpleNamespace(time=lambda: timestamp,
+                                                                      perf_counter=time.perf_counter))
+        SecureMessenger(manager, inbox_workers=0, sessions=False).send_message(sender, recipient, text)
+
+def test_old_unread_mail_is_delivered(users, monkeypatch):
+    from core.secure_messenger import SecureMessenger
+    manager, alice, bob = users
+    send_at(manager, alice, "bob", "from last month", time.time() - 31 * 24 * 3600, monkeypatch)
+    inbox = SecureMessenger(manager, inbox_workers=0).check_inbox(bob)
+    assert [(m.get("status"), m.get("content")) for m in inbox] == [("Verified", "from last month")]
+
+def test_old_packet_outside_the_transport_is_stale(users, monkeypatch):
+    from core.secure_messenger import SecureMessenger
+    manager, alice, bob = users
+    send_at(manager, alice, "bob", "old", time.time() - 31 * 24 * 3600, monkeypatch)
+    name, packet = only_packet()
+    os.remove(os.path.join("data", "messages", name))
+    # Dropped next to the store, never delivered through the transport
+    write_packet(packet, "bob_dropped.msg")
+    inbox = SecureMessenger(manager, inbox_workers=0).check_inbox(bob)
+    assert [m.get("error") for m in inbox] == ["Stale message (possible replay)"]
+
+def test_archived_mail_survives_seen_index_expiry(users):
+    from core.secure_messenger import SecureMessenger
+    from core.retention import Compactor
+    from core.seen_index import SEEN_INDEX_FILE
+    manager, alice, bob = users
+    messenger = SecureMessenger(manager, inbox_workers=0, sessions=False)
+    messenger.send_message(alice, "bob", "keep me")
+    assert [m["content"] for m in messenger.check_inbox(bob)] == ["keep me"]
+
+    compactor = Compactor(messenger.transport, seen_index=SEEN_INDEX_FILE)
+    assert compactor.run_once()["bob"]["archived"] == 1
+    assert compactor.expire_seen(now=time.time() + 40 * 24 * 3600) == 0
+
+    header, = messenger.transport.list_headers("bob")
+    reader = SecureMessenger(manager, inbox_workers=0, sessions=False)
+    message = reader.open_message(bob, header["id"])
+    assert (message.get("status"), message.get("content")) == ("Verified", "keep me")
@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import hmac
+import hashlib
+import pytest
+from core import sessions
+from core.sessions import (SessionStore, chain_key_at, chain_step, message_keys, packet_mac, verify_packet_mac,
+                           session_root, new_session_id, SESSION_MAX_MESSAGES, SESSION_MAX_AGE)
+from utils import hex_to_bytes
+
+ROOT = bytes(range(32))
+PEER = (1, 2)
+
+
+def sha256(data):
+    return hashlib.sha256(data).digest()
+
+def make_store(directory, ecdh_priv=12345, username="alice"):
+    return SessionStore({"username": username, "ecdh_priv": ecdh_priv}, directory=str(directory))
+
+def open_session(store, recipient="bob", created=None):
+    session = {"id": new_session_id(), "created": time.time() if created is None else created, "ticket": [1, 2]}
+    store.start_outgoing(recipient, PEER, b"s" * 32, session)
+    return session
+
+
+def test_chain_derivation():
+    assert chain_step(ROOT) == sha256(b"chain" + ROOT)
+    assert chain_key_at(ROOT, 1) == chain_step(ROOT)
+    assert chain_key_at(ROOT, 3) == sha256(b"chain" + sha256(b"chain" + sha256(b"chain" + ROOT)))
+    enc_key, mac_key = message_keys(ROOT)
+    assert enc_key == sha256(b"message" + ROOT) and mac_key == sha256(b"mac" + ROOT)
+    assert enc_key != mac_key
+
+def test_session_root_binds_direction_and_id():
+    session_id = new_session_id()
+    root = session_root(b"k" * 32, session_id, "alice", "bob")
+    assert root == sha256(b"session-root" + b"k" * 32 + hex_to_bytes(session_id) + b"alice\x00bob")
+    assert root != session_root(b"k" * 32, session_id, "bob", "alice")
+    assert root != session_root(b"k" * 32, new_session_id(), "alice", "bob")
+
+def test_packet_mac():
+    packet = {"sender": "alice", "recipient": "bob", "ciphertext": "00ff", "session": {"id": "ab", "n": 1}}
+    canonical = json.dumps(packet, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    packet["mac"] = packet_mac(ROOT, packet)
+    assert packet["mac"] == hmac.new(ROOT, canonical, hashlib.sha256).hexdigest()
+    assert verify_packet_mac(ROOT, packet)
+    assert not verify_packet_mac(bytes(32), packet)
+    for field, value in (("ciphertext", "00fe"), ("session", {"id": "ab", "n": 2}), ("extra", 1)):
+        assert not verify_packet_mac(ROOT, dict(packet, **{field: value}))
+    assert not verify_packet_mac(ROOT, {k: v for k, v in packet.items() if k != "mac"})
+
+
+def test_outgoing_ratchet(tmp_path):
+    store = make_store(tmp_path)
+    assert store.next_outgoing("bob", PEER) is None
+    session = open_session(store, created=1000.0)
+    root = session_root(b"s" * 32, session["id"], "alice", "bob")
+    for n in (1, 2, 3):
+        header, chain_key = store.next_outgoing("bob", PEER, now=1001.0)
+        assert header == dict(session, n=n)
+        assert chain_key == chain_key_at(root, n)
+
+def test_outgoing_session_expiry(tmp_path):
+    store = make_store(tmp_path)
+    open_session(store, created=1000.0)
+    assert store.next_outgoing("bob", (3, 4), now=1001.0) is None
+    assert store.next_outgoing("bob", PEER, now=1000.0 + SESSION_MAX_AGE + 1) is None
+    store.outgoing["bob"]["n"] = SESSION_MAX_MESSAGES + 1
+    assert store.next_outgoing("bob", PEER, now=1001.0) is None
+
+def test_stores_of_the_same_user_never_reuse_a_position(tmp_path):
+    # Two stores stand in for two processes sending as the same user
+    first, second = make_store(tmp_path), make_store(tmp_path)
+    open_session(first)
+    positions = []
+    for store in (first, second, second, first, second):
+        header, _ = store.next_outgoing("bob", PEER)
+        positions.append(header["n"])
+    assert positions == [1, 2, 3, 4, 5]
+
+def test_log_is_appended_and_compacted(tmp_path, monkeypatch):
+    monkeypatch.setattr(sessions, "LOG_COMPACT_SLACK", 5)
+    store = make_store(tmp_path)
+    session = open_session(store)
+    for _ in range(20):
+        store.next_outgoing("bob", PEER)
+    with open(store.path) as f:
+        assert len(f.readlines()) <= 1 + 5 + 1
+    # A fresh reader (and a store opened with another key) see the compacted state
+    header, _ = make_store(tmp_path).next_outgoing("bob", PEER)
+    assert header == dict(session, n=21)
+    assert make_store(tmp_path, ecdh_priv=999).next_outgoing("bob", PEER) is None
+
+def test_log_records_are_encrypted(tmp_path):
+    store = make_store(tmp_path)
+    session = open_session(store)
+    with open(store.path) as f:
+        data = f.read()
+    assert session["id"] not in data and "bob" not in data
+
+def test_incoming_roots_are_remembered_and_pruned(tmp_path, monkeypatch):
+    monkeypatch.setattr(sessions, "INCOMING_SESSIONS_MAX", 2)
+    store = make_store(tmp_path)
+    calls = []
+
+    def derive(name):
+        calls.append(name)
+        return sha256(name.encode("utf-8"))
+
+    for name in ("s1", "s2", "s1", "s3"):
+        assert store.incoming_root("carol", name, lambda: derive(name)) == sha256(name.encode("utf-8"))
+    assert calls == ["s1", "s2", "s3"]
+    # s2 was least recently used; a new reader keeps the most recently recorded roots
+    assert set(store.incoming) == {"carol/s1", "carol/s3"}
+    assert set(make_store(tmp_path).incoming) == {"carol/s2", "carol/s3"}
+
+def test_rejected_incoming_session_is_not_stored(tmp_path):
+    store = make_store(tmp_path)
+
+    def reject():
+        raise ValueError("Invalid session ticket")
+
+    with pytest.raises(ValueError):
+        store.incoming_root("carol", "s1", reject)
+    assert not store.incoming
+
+
+# End to end through SecureMessenger
+# ======================================================
+
+@pytest.fixture
+def users(workdir):
+    from core.user_manager import UserManager
+    manager = UserManager()
+    manager.register_many([("alice", "pw"), ("bob", "pw")])
+    return manager, manager.login("alice", "pw")[0], manager.login("bob", "pw")[0]
+
+def messenger(manager, **kwargs):
+    from core.secure_messenger import SecureMessenger
+    return SecureMessenger(manager, inbox_workers=0, **kwargs)
+
+def stored_packets(directory="data/messages"):
+    names = sorted(name for name in os.listdir(directory) if name.endswith(".msg"))
+    packets = []
+    for name in names:
+        with open(os.path.join(directory, name)) as f:
+            packets.append(json.load(f))
+    return sorted(packets, key=lambda packet: packet["timestamp"])
+
+def test_session_messages_round_trip(users):
+    manager, alice, bob = users
+    sender = messenger(manager)
+    for i in range(3):
+        assert sender.send_message(alice, "bob", f"hello {i}")[0]
+    opening, *ratchet = stored_packets()
+    assert "signature" in opening and opening["session"]["n"] == 0
+    assert [packet["session"]["n"] for packet in ratchet] == [1, 2]
+    assert all("mac" in packet and "signature" not in packet for packet in ratchet)
+    assert all(packet["session"]["ticket"] == opening["session"]["ticket"] for packet in ratchet)
+
+    inbox = messenger(manager).check_inbox(bob)
+    assert [(m["status"], m["content"]) for m in inbox] == [("Verified", f"hello {i}") for i in range(3)]
+    # A receiver without session state derives the root per packet
+    inbox = messenger(manager, sessions=False, seen_index=None).check_inbox(bob)
+    assert [m["status"] for m in inbox] == ["Verified"] * 3
+
+def test_session_needs_a_valid_ticket(users):
+    from core.seen_index import message_id_for
+    manager, alice, bob = users
+    sender = messenger(manager)
+    sender.send_message(alice, "bob", "opening")
+    sender.send_message(alice, "bob", "follow-up")
+    _, packet = stored_packets()
+
+    # Re-MAC the follow-up under a new session id, as the recipient (who also holds the ECDH secret) could
+    from core.secure_messenger import _shared_secret_for
+    forged_session = dict(packet["session"], id=new_session_id(), n=1)
+    shared_secret = _shared_secret_for(bob["ecdh_priv"], *manager.get_public_keys("alice")["ecdh"])
+    root = session_root(shared_secret, forged_session["id"], "alice", "bob")
+    _, mac_key = message_keys(chain_key_at(root, 1))
+    forged = dict(packet, session=forged_session, iv="00" * 8)
+    forged["message_id"] = message_id_for(forged)
+    forged["mac"] = packet_mac(mac_key, {k: v for k, v in forged.items() if k != "mac"})
+    with open("data/messages/bob_forged.msg", "w") as f:
+        json.dump(forged, f)
+
+    # The forgery shares the follow-up's timestamp, so the inbox order between them is arbitrary
+    inbox = messenger(manager).check_inbox(bob)
+    assert sorted(m.get("status") or m.get("error") for m in inbox) == ["Invalid session", "Verified", "Verified"]
+
+def test_opening_signature_covers_the_session_header(users):
+    from core.seen_index import message_id_for
+    manager, alice, bob = users
+    messenger(manager).send_message(alice, "bob", "opening")
+    opening, = stored_packets()
+    opening["session"]["id"] = new_session_id()
+    opening["message_id"] = message_id_for(opening)
+    with open("data/messages/bob_forged.msg", "w") as f:
+        json.dump(opening, f)
+    for name in os.listdir("data/messages"):
+        if name.endswith(".msg") and name != "bob_forged.msg":
+            os.remove(os.path.join("data/messages", name))
+
+    inbox = messenger(manager, seen_index=None).check_inbox(bob)
+    assert [m["status"] for m in inbox] == ["FAKE/TAMPERED"]
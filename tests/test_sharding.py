@@ -0,0 +1,163 @@
+import os
+import types
+import pytest
+from core import transport as transport_module
+from core.transport import FileTransport
+from core.sharding import HashRing, ShardedTransport, configured_roots, stored_users, ROOTS_ENV
+from core.seen_index import SeenIndex, message_id_for, NEW, SEEN
+
+USERS = [f"user{i}" for i in range(2000)]
+# "Now" for seen-index checks of the test packets (timestamped around 1000)
+NOW = 2000.0
+
+
+@pytest.fixture
+def fixed_clock(monkeypatch):
+    """Every delivery gets the same base id (<recipient>_1000), so ids clash across roots."""
+    monkeypatch.setattr(transport_module, "time", types.SimpleNamespace(time=lambda: 1000.0))
+
+def make_packet(recipient, i):
+    packet = {"sender": "alice", "recipient": recipient, "timestamp": 1000.0 + i,
+              "iv": f"{i:016x}", "ciphertext": f"{i:02x}" * 8}
+    packet["message_id"] = message_id_for(packet)
+    return packet
+
+def roots(tmp_path, *names):
+    return [os.path.normpath(str(tmp_path / name)) for name in names]
+
+
+# Hash ring
+# ======================================================
+
+def test_ring_is_deterministic_and_balanced():
+    ring = HashRing(["a", "b", "c", "d"])
+    owners = [ring.node_for(user) for user in USERS]
+    assert owners == [HashRing(["d", "c", "b", "a"]).node_for(user) for user in USERS]
+    for node in "abcd":
+        # 64 points per node keep each share within a factor of two of the mean
+        assert len(USERS) / 8 < owners.count(node) < len(USERS) / 2
+
+def test_adding_a_node_moves_only_its_share():
+    before = HashRing(["a", "b", "c", "d"])
+    after = HashRing(["a", "b", "c", "d", "e"])
+    moved = [user for user in USERS if before.node_for(user) != after.node_for(user)]
+    # Every moved user goes to the new node, and about 1/5 of them move
+    assert all(after.node_for(user) == "e" for user in moved)
+    assert 0.1 < len(moved) / len(USERS) < 0.3
+
+def test_ring_needs_a_node():
+    with pytest.raises(ValueError):
+        HashRing([])
+
+def test_configured_roots(monkeypatch):
+    monkeypatch.setenv(ROOTS_ENV, os.pathsep.join(["/disk1/messages", "", "/disk2/messages"]))
+    assert configured_roots() == ["/disk1/messages", "/disk2/messages"]
+    monkeypatch.delenv(ROOTS_ENV)
+    assert configured_roots() == [os.path.join("data", "messages")]
+
+
+# Routing
+# ======================================================
+
+def test_sharded_transport_routes_by_recipient(tmp_path):
+    sharded = ShardedTransport(roots(tmp_path, "r1", "r2", "r3"))
+    try:
+        users = USERS[:30]
+        sharded.deliver_many([make_packet(user, i) for i, user in enumerate(users)])
+        for user in users:
+            owner = sharded.ring.node_for(user)
+            assert stored_users(sharded.shards[owner]) >= {user}
+            assert [packet["recipient"] for packet in sharded.fetch(user)] == [user]
+        assert sharded.recipients() == sorted(users)
+        assert set(sharded.fetch_entries_many(users[:5])) == set(users[:5])
+    finally:
+        sharded.close()
+
+
+# Moving users between roots
+# ======================================================
+
+def test_move_user_keeps_live_archived_and_read_mail(tmp_path, fixed_clock):
+    source, target = FileTransport(str(tmp_path / "r1")), FileTransport(str(tmp_path / "r2"))
+    for i in range(4):
+        source.deliver(make_packet("bob", i))
+    ids = [header["id"] for header in source.headers("bob")]
+    source.mark_read("bob", ids[:3])
+    source.archive("bob", ids[:2])
+    # The target already holds a message under the first id
+    target.deliver(make_packet("bob", 9))
+
+    renames = []
+    assert source.move_user("bob", target, on_rename=lambda old, new: renames.append((old, new))) == 4
+    # Only the clashing id changes
+    assert len(renames) == 1 and renames[0][0] == ids[0] and renames[0][1] not in ids
+    renamed = dict(renames)
+
+    moved = [renamed.get(message_id, message_id) for message_id in ids]
+    assert sorted(header["id"] for header in target.headers("bob")) == sorted(moved + [ids[0]])
+    for i, message_id in enumerate(moved):
+        assert target.get_packet("bob", message_id) == make_packet("bob", i)
+    assert target.get_packet("bob", ids[0]) == make_packet("bob", 9)
+    assert target.read_ids("bob") == set(moved[:3])
+
+    assert stored_users(source) == set()
+    # Repeating the move is a no-op
+    assert source.move_user("bob", target) == 0
+    assert len(target.headers("bob")) == 5
+
+def test_rebalance(tmp_path):
+    old_roots = roots(tmp_path, "r1", "r2")
+    sharded = ShardedTransport(old_roots)
+    users = USERS[:40]
+    sharded.deliver_many([make_packet(user, i) for i, user in enumerate(users)])
+    sharded.close()
+
+    grown = ShardedTransport(old_roots + roots(tmp_path, "r3"))
+    try:
+        expected = sorted(user for user in users if grown.ring.node_for(user) == roots(tmp_path, "r3")[0])
+        plan = grown.rebalance(dry_run=True)
+        assert sorted(user for user, _, _ in plan["users"]) == expected and plan["messages"] == 0
+        report = grown.rebalance()
+        assert sorted(user for user, _, _ in report["users"]) == expected
+        assert report["messages"] == len(expected)
+        assert grown.rebalance()["users"] == []
+        for i, user in enumerate(users):
+            assert grown.fetch(user) == [make_packet(user, i)]
+    finally:
+        grown.close()
+
+def test_rebalance_drains_retired_roots(tmp_path):
+    r1, r2 = roots(tmp_path, "r1", "r2")
+    FileTransport(r2).deliver(make_packet("bob", 1))
+    sharded = ShardedTransport([r1])
+    try:
+        report = sharded.rebalance(retired=[r2])
+        assert report == {"users": [["bob", r2, r1]], "messages": 1}
+        assert sharded.fetch("bob") == [make_packet("bob", 1)]
+    finally:
+        sharded.close()
+
+def test_rebalance_keeps_renamed_messages_readable(tmp_path, fixed_clock):
+    r1, r2 = roots(tmp_path, "r1", "r2")
+    sharded = ShardedTransport([r1, r2])
+    owner = sharded.ring.node_for("bob")
+    stray = r2 if owner == r1 else r1
+    index_path = str(tmp_path / "seen.sqlite")
+    index = SeenIndex(index_path)
+    try:
+        # Both roots hold "bob_1000.msg", and both copies have been read already
+        for root, i in ((stray, 1), (owner, 2)):
+            transport = FileTransport(root)
+            transport.deliver(make_packet("bob", i))
+            (message_id, packet), = transport.fetch_entries("bob")
+            assert message_id == "bob_1000.msg"
+            assert index.check("bob", packet, message_id, now=NOW) == NEW
+
+        sharded.rebalance(seen_index=index_path)
+        entries = sharded.fetch_entries("bob")
+        assert sorted(packet["iv"] for _, packet in entries) == [make_packet("bob", i)["iv"] for i in (1, 2)]
+        # Neither copy reads as a DUPLICATE (which would discard it)
+        assert index.check_many("bob", [(packet, message_id) for message_id, packet in entries], now=NOW) == [SEEN, SEEN]
+    finally:
+        index.close()
+        sharded.close()